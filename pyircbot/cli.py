@@ -18,6 +18,10 @@ def main():
     parser = ArgumentParser(description="Run pyircbot")
     parser.add_argument("-c", "--config", help="Path to config file", required=True)
     parser.add_argument("--debug", action="store_true", help="Dump raw irc network")
+    parser.add_argument("--debug-loop", action="store_true", default=None,
+                        help="Run the event loop in asyncio's debug mode. Slow, but reports misbehaving coroutines")
+    parser.add_argument("--loop", choices=["asyncio", "uvloop", "auto"],
+                        help="Event loop implementation. auto uses uvloop if it is installed")
     parser.add_argument("-q", "--quit-message", help="Quit message if killed by signal",
                         default="received signal {}")
 
@@ -33,6 +37,12 @@ def main():
 
     botconfig = loads(sys.stdin.read()) if args.config == "-" else load(args.config)
 
+    " command line options override the config "
+    if args.debug_loop is not None:
+        botconfig["bot"]["debug_loop"] = args.debug_loop
+    if args.loop is not None:
+        botconfig["bot"]["loop"] = args.loop
+
     if sentry_sdk and "dsn" in botconfig["bot"]:
         sentry_sdk.init(botconfig["bot"]["dsn"])
 
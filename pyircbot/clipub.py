@@ -62,11 +62,7 @@ class PyIRCBotSub(PrimitiveBot):
                                      f"{nick}!{username}@{hostname}",   # hack
                                      trailing)
 
-        for module_name, module in self.moduleInstances.items():
-            for hook in module.irchooks:
-                validation = hook.validator(msg, self)
-                if validation:
-                    hook.method(msg, validation)
+        self.fire_irchooks(msg, self.nick())
 
     " Filesystem Methods "
     def getConfigPath(self, moduleName):
@@ -1,10 +1,11 @@
+import re
 from time import time
 from math import floor
 from json import load as json_load
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from time import sleep
 import os
-from threading import Thread
+from threading import Thread, Lock
 try:
     import sentry_sdk
 except ImportError:
@@ -12,6 +13,7 @@ except ImportError:
 
 
 ParsedCommand = namedtuple("ParsedCommand", "command args args_str message")
+CommandLine = namedtuple("CommandLine", "word args args_str message highlight addressed")
 
 
 def report(exception):
@@ -35,10 +37,11 @@ class burstbucket(object):
 
         self.bucket = self.bucket_max
 
-    def get(self):
+    def get(self, line=None):
         """
         Return 0 if no sleeping is necessary to rate limit. Otherwise, return the number of seconds to sleep. This
         method should be called again by the user after sleeping
+        :param line: the line about to be sent. Unused, every line counts the same
         """
         # First, update the bucket
         # Check if $period time has passed since the bucket was filled
@@ -58,6 +61,142 @@ class burstbucket(object):
         return self.bucket_period - since_fill
 
 
+class penaltybucket(object):
+    """
+    Rate limiter following the flood control model of RFC1459 section 8.10, which most servers implement in some form.
+    The server keeps a timer per client which each line advances by a penalty, and stops reading from the client while
+    the timer is more than `window` seconds ahead of the current time. Penalties here are a per-command cost plus a
+    cost per byte, multiplied by `factor`.
+
+    The factor adapts to the server: it is multiplied by `backoff` each time throttled() is called, when the server
+    complains about flooding, and decays back down a little after each `recover` seconds without complaints. It may
+    decay below 1 on lenient servers.
+    """
+    costs = {"PONG": 0.5, "PASS": 0.5, "JOIN": 3.0, "PART": 2.0, "MODE": 2.0, "KICK": 2.0, "NICK": 3.0, "WHO": 3.0,
+             "WHOIS": 3.0, "LIST": 5.0}
+    """Base penalty of each command in seconds. Anything else costs `cost`"""
+
+    def __init__(self, window=10.0, cost=2.0, line_bytes=120.0, backoff=2.0, max_factor=8.0, min_factor=0.5,
+                 recover=30.0):
+        """
+        :param window: how far ahead of the current time the penalty timer may run before we wait
+        :param cost: penalty of commands not listed in `costs`
+        :param line_bytes: each this many bytes of a line adds a second of penalty
+        :param backoff: multiplier applied to the penalty factor when the server throttles us
+        :param max_factor: upper bound of the penalty factor
+        :param min_factor: lower bound of the penalty factor
+        :param recover: seconds without being throttled after which the penalty factor is reduced by 10%
+        """
+        self.window = window
+        self.cost = cost
+        self.line_bytes = line_bytes
+        self.backoff = backoff
+        self.max_factor = max_factor
+        self.min_factor = min_factor
+        self.recover = recover
+
+        self.factor = 1.0
+        self.throttles = 0
+        self.timer = time()
+        self.adjusted = time()
+
+    def penalty(self, line):
+        """
+        Return the penalty, in seconds, of sending a line
+        """
+        command = line.split(" ", 1)[0].upper()
+        return (self.costs.get(command, self.cost) + len(line) / self.line_bytes) * self.factor
+
+    def get(self, line=""):
+        """
+        Return 0 if the line may be sent now, and count its penalty. Otherwise, return the number of seconds to sleep.
+        This method should be called again by the user after sleeping
+        """
+        now = time()
+        if now - self.adjusted >= self.recover:
+            steps = floor((now - self.adjusted) / self.recover)
+            self.factor = max(self.min_factor, self.factor * 0.9 ** steps)
+            self.adjusted += steps * self.recover
+        if self.timer < now:
+            self.timer = now
+        if self.timer - now > self.window:
+            return self.timer - now - self.window
+        self.timer += self.penalty(line)
+        return 0
+
+    def throttled(self):
+        """
+        Called when the server indicates we're sending too fast. Increases the penalty factor and pauses sending until
+        the server's timer has likely run out.
+        """
+        now = time()
+        self.throttles += 1
+        self.factor = min(self.max_factor, self.factor * self.backoff)
+        self.adjusted = now
+        self.timer = max(self.timer, now) + self.window
+
+
+class LRUCache(object):
+    """
+    Thread safe mapping holding up to `maxsize` entries. When full, the least recently used entry is evicted. Counts
+    hits and misses.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for key, or default if it isn't cached
+        """
+        with self.lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            if self.maxsize <= 0:
+                return
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self.lock:
+            return self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        """
+        Return a dict of the cache's size and hit counters
+        """
+        lookups = self.hits + self.misses
+        return {"size": len(self.data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
 class TouchReload(Thread):
     def __init__(self, filepaths, do, resolution=0.75):
         """
@@ -141,6 +280,35 @@ def messageHasCommandSingle(command, message, requireArgs=False, withHighlight=F
                          message)
 
 
+def parse_command_line(message, withHighlight=None):
+    """
+    Split a chat message into the forms a command can be matched against, in the same manner as messageHasCommand.
+    This is done once per message so that any number of commands can be tested against the result.
+
+    Returns a tuple of CommandLine objects. When the message starts with a highlight ('Nick[:,] command args'), the
+    second item is the message rewritten to '.command args' and has ``highlight`` set. ``addressed`` is set on both
+    forms of such a message.
+
+    :param message: the message string to look in, like "!ban Lil_Mac"
+    :type message: str
+    :param withHighlight: the bot's nick
+    :type withHighlight: str
+    """
+    if not message:
+        return ()
+    forms = [message]
+    addressed = bool(withHighlight) and (message.startswith(withHighlight + ": ") or
+                                         message.startswith(withHighlight + ", "))
+    if addressed:
+        forms.append("." + message[len(withHighlight) + 2:])
+    lines = []
+    for highlight, form in enumerate(forms):
+        word, _, args = form.partition(" ")
+        args = args.strip()
+        lines.append(CommandLine(word, tuple(args.split()), args, form, bool(highlight), addressed))
+    return tuple(lines)
+
+
 def load(filepath):
     """Return an object from the passed filepath
 
@@ -194,3 +362,105 @@ def parse_irc_line(data):
         args[index] = arg.strip()
 
     return (command, args, prefix, trailing)
+
+
+IRC_LINE_RE = re.compile(rb'(?:@([^ ]*) +)?(?::([^ ]+) +)?([^ :\r\n][^ \r\n]*)((?: +[^ :\r\n][^ \r\n]*)*)'
+                         rb'(?: +:([^\n]*))? *\r?\n?')
+
+TAG_ESCAPES = {"\\:": ";", "\\s": " ", "\\\\": "\\", "\\r": "\r", "\\n": "\n"}
+
+
+def decode_irc(data):
+    """
+    Decode bytes received from irc. Text that isn't valid UTF-8 is decoded as latin-1 instead, so that no line is
+    dropped because of a client sending another encoding.
+    """
+    try:
+        return str(data, "UTF-8")
+    except UnicodeDecodeError:
+        return str(data, "latin-1")
+
+
+def decode_ascii(data):
+    return str(data, "ascii")
+
+
+class IRCLine(object):
+    """
+    One line of the irc protocol as returned by :py:func:`parse_irc_bytes`. Fields are decoded from the raw bytes
+    the first time they're accessed.
+
+    ``trailing`` has surrounding whitespace stripped and is None if the line had no trailing parameter, as with
+    :py:func:`parse_irc_line`.
+    """
+    __slots__ = ("raw", "match", "command", "decode", "_prefix", "_args", "_trailing", "_tags")
+
+    def __init__(self, raw, match):
+        self.raw = raw
+        self.match = match
+        self.command = match.group(3).decode("ascii", "replace")
+        # Most lines are plain ascii, which can be decoded without the UTF-8 attempt
+        self.decode = decode_ascii if raw.isascii() else decode_irc
+        self._prefix = self._args = self._trailing = self._tags = IRCLine
+
+    @property
+    def prefix(self):
+        if self._prefix is IRCLine:
+            prefix = self.match.group(2)
+            self._prefix = None if prefix is None else self.decode(prefix)
+        return self._prefix
+
+    @property
+    def args(self):
+        if self._args is IRCLine:
+            self._args = [self.decode(arg) for arg in self.match.group(4).split()]
+        return self._args
+
+    @property
+    def trailing(self):
+        if self._trailing is IRCLine:
+            trailing = self.match.group(5)
+            self._trailing = None if trailing is None else self.decode(trailing).strip()
+        return self._trailing
+
+    @property
+    def tags(self):
+        """
+        Dict of IRCv3 message tags. Tags without a value are set to True.
+        """
+        if self._tags is IRCLine:
+            self._tags = {}
+            tags = self.match.group(1)
+            if tags:
+                for tag in self.decode(tags).split(";"):
+                    key, sep, value = tag.partition("=")
+                    if key:
+                        self._tags[key] = re.sub(r'\\.?', lambda m: TAG_ESCAPES.get(m.group(0), m.group(0)[1:]),
+                                                 value) if value else True
+        return self._tags
+
+    def astuple(self):
+        """
+        Return a (command, args, prefix, trailing) tuple, like :py:func:`parse_irc_line`
+        """
+        _, prefix, _, args, trailing = self.match.groups()
+        if self.decode is decode_ascii:
+            return (self.command,
+                    args.decode("ascii").split(),
+                    None if prefix is None else prefix.decode("ascii"),
+                    None if trailing is None else trailing.decode("ascii").strip())
+        return (self.command, self.args, self.prefix, self.trailing)
+
+
+def parse_irc_bytes(data):
+    """
+    Parse one line irc sent us, as read from the socket. Returns an :py:class:`IRCLine` or None if the line isn't valid
+    irc protocol.
+
+    :param data: the line to process, with or without the line ending
+    :type data: bytes
+    :return IRCLine:"""
+    match = IRC_LINE_RE.fullmatch(data)
+    if match is None:
+        return None
+    return IRCLine(data, match)
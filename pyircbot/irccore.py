@@ -6,34 +6,213 @@
 
 """
 
+import re
 import socket
+import random
 import asyncio
 import logging
 import traceback
 import sys
-from inspect import getargspec
-from pyircbot.common import burstbucket, parse_irc_line, report
-from collections import namedtuple
+from inspect import signature
+from pyircbot.common import burstbucket, penaltybucket, parse_irc_bytes, report
+from collections import namedtuple, deque, OrderedDict
+from heapq import heappush, heappop
 from io import StringIO
-from time import time
+from threading import get_ident
+from time import time, monotonic
 
 
 IRCEvent = namedtuple("IRCEvent", "command args prefix trailing replyto")
 UserPrefix = namedtuple("UserPrefix", "nick username hostname")
 ServerPrefix = namedtuple("ServerPrefix", "hostname")
 
+THROTTLE_COMMANDS = frozenset(["ERROR", "NOTICE", "263", "439"])
+"""Commands the server may use to tell us we're sending too fast. 263 is RPL_TRYAGAIN and 439 ERR_TARGETTOOFAST"""
+THROTTLE_RE = re.compile(r'\bexcess flood\b|\bthrottled due to flood|\btoo fast\b.*\bwait\b|\bwait a while\b', re.I)
+"""Known phrasings of the server telling us to slow down. Other notices mentioning floods, like exemptions or oper
+notices, don't match"""
+DISPATCH_SLICE = 0.01
+"""Seconds the inbound queue's hooks may run for before letting the reader catch up"""
+JOIN_LENGTH = 500
+"""Longest list of channels, in bytes, sent in one JOIN line. Lines are limited to 512 bytes including the command"""
+
+
+class OutputQueue(object):
+    """
+    Queue of outgoing lines. Lines with a lower priority value are sent first. Lines of equal priority are grouped by
+    target - the channel or nick a PRIVMSG or NOTICE is sent to - and the targets take turns, so that one module
+    flooding one channel doesn't hold up replies everywhere else. Lines of each target are sent in the order they were
+    queued.
+
+    Optionally, consecutive PRIVMSGs to the same target can be merged into one line, to get more text through the rate
+    limit. This changes how messages appear in the channel, so it's off by default.
+
+    Lines can be given a time to live, per line or per priority. Lines still queued when it runs out are stale - a
+    reply to something said minutes ago - and are dropped rather than sent, so that a backlog can recover.
+    """
+
+    def __init__(self):
+        self.levels = {}
+        """Mapping of priority to an OrderedDict of target -> deque of (time queued, expiry time, line) tuples"""
+        self.priorities = []
+        """Heap of priorities that have lines queued"""
+        self.size = 0
+        self.ready = asyncio.Event()
+
+        self.coalesce_length = None
+        """Set to a maximum line length in bytes to merge consecutive PRIVMSGs to the same target"""
+        self.coalesce_separator = " | "
+        """Text placed between merged messages"""
+
+        self.ttls = {}
+        """Mapping of priority to the default number of seconds PRIVMSGs and NOTICEs of that priority may wait before
+        being dropped"""
+        self.expire_policy = "drop"
+        """What to do with expired PRIVMSGs and NOTICEs. "drop" discards them, "collapse" replaces each run of expired
+        lines to a target with one line saying how many were dropped"""
+        self.expired = {}
+        """Mapping of priority to number of lines that expired"""
+
+    @staticmethod
+    def target(line):
+        """Return the target of a PRIVMSG or NOTICE line, or an empty string for other lines
+
+        :param line: protocol line, like "PRIVMSG #chan :hello"
+        :type line: str"""
+        if line.startswith("PRIVMSG ") or line.startswith("NOTICE "):
+            return line.split(" ", 2)[1]
+        return ""
+
+    def put(self, priority, line, ttl=None):
+        """Queue a line for sending
+
+        :param priority: numerical priority, lower values are sent first
+        :param line: protocol line to send
+        :type line: str
+        :param ttl: seconds after which the line is stale and won't be sent. If None, PRIVMSGs and NOTICEs use the ttl
+                    configured for the priority in `ttls`, if any.
+        :type ttl: float"""
+        level = self.levels.get(priority)
+        if level is None:
+            level = self.levels[priority] = OrderedDict()
+            heappush(self.priorities, priority)
+        target = OutputQueue.target(line)
+        if target not in level:
+            level[target] = deque()
+        if ttl is None and target:
+            ttl = self.ttls.get(priority)
+        queued = time()
+        level[target].append((queued, queued + ttl if ttl is not None else None, line))
+        self.size += 1
+        self.ready.set()
+
+    def get_nowait(self):
+        """Return the next line to send as a tuple of (priority, time queued, line). Expired lines are dropped or
+        collapsed along the way. Raises asyncio.QueueEmpty if there's nothing to send."""
+        now = time()
+        while self.size:
+            priority = self.priorities[0]
+            level = self.levels[priority]
+            target, lines = next(iter(level.items()))
+            queued, expires, line = lines.popleft()
+            self.size -= 1
+            if expires is not None and expires < now:
+                expired = 1
+                while lines and lines[0][1] is not None and lines[0][1] < now:
+                    lines.popleft()
+                    self.size -= 1
+                    expired += 1
+                self.expired[priority] = self.expired.get(priority, 0) + expired
+                if self.expire_policy == "collapse" and target:
+                    line = "{} {} :({} old message{} dropped)".format(line.split(" ", 1)[0], target, expired,
+                                                                     "s" if expired > 1 else "")
+                else:
+                    line = None
+            elif self.coalesce_length and target:
+                while lines:
+                    merged = self.merge(line, lines[0][2])
+                    if not merged:
+                        break
+                    line = merged
+                    lines.popleft()
+                    self.size -= 1
+            if lines:
+                level.move_to_end(target)
+            else:
+                del level[target]
+                if not level:
+                    del self.levels[priority]
+                    heappop(self.priorities)
+            if line is not None:
+                return (priority, queued, line)
+        raise asyncio.QueueEmpty()
+
+    async def get(self):
+        """Wait for and return the next line to send, like get_nowait()"""
+        while True:
+            while not self.size:
+                self.ready.clear()
+                await self.ready.wait()
+            try:
+                return self.get_nowait()
+            except asyncio.QueueEmpty:  # everything queued had expired
+                pass
+
+    def merge(self, line, nextline):
+        """Return the two PRIVMSG lines merged into one, or None if they can't be merged"""
+        head, _, text = line.partition(" :")
+        nexthead, _, nexttext = nextline.partition(" :")
+        if head != nexthead or not head.startswith("PRIVMSG ") or \
+                text.startswith("\x01") or nexttext.startswith("\x01"):
+            return None
+        merged = "{}{}{}".format(line, self.coalesce_separator, nexttext)
+        if len(merged.encode("UTF-8")) > self.coalesce_length:
+            return None
+        return merged
+
+    def qsize(self):
+        return self.size
+
+    def empty(self):
+        return not self.size
+
+    def backlog(self):
+        """Return a dict of target -> number of lines queued. Lines without a target are counted under "*"."""
+        backlog = {}
+        for level in self.levels.values():
+            for target, lines in level.items():
+                backlog[target or "*"] = backlog.get(target or "*", 0) + len(lines)
+        return backlog
+
 
 class IRCCore(object):
 
-    def __init__(self, servers, loop, rate_limit=True, rate_max=5.0, rate_int=1.1):
+    def __init__(self, servers, loop, rate_limit=True, rate_max=5.0, rate_int=1.1, rate_adaptive=False):
         self._loop = loop
 
         # rate limiting options
         self.rate_limit = rate_limit
         self.rate_max = float(rate_max)
         self.rate_int = float(rate_int)
+        self.rate_adaptive = rate_adaptive
+        """Use a penaltybucket per server that adapts to the server's flood control, instead of a fixed burstbucket"""
+        self.limiters = {}
+        """Mapping of "host:port" to the penaltybucket learned for that server"""
 
         self.reconnect_delay = 3.0
+        """Base of the exponential backoff between connection attempts, in seconds"""
+        self.reconnect_max = 300.0
+        """Upper bound of the backoff between connection attempts, in seconds"""
+        self.connect_attempts = 0
+        """Number of connection attempts since we last completed registration"""
+        self.connect_parallel = 2
+        """How many servers of the list to race connections to. Each connection may also race ipv4 and ipv6"""
+        self.happy_eyeballs_delay = 0.25
+        """Seconds to wait for a connection attempt before starting the next one in parallel"""
+        self.connect_timeout = 30.0
+        """Seconds after which a connection attempt is given up"""
+        self.registered = False
+        """If the server has accepted our registration (sent 001) on the current connection"""
 
         self.connected = False
         """If we're connected or not"""
@@ -59,6 +238,31 @@ class IRCCore(object):
 
         self.bind_addr = None
         """Optionally bind to a specific address. This should be a (host, port) tuple."""
+        self.stream_limit = 2 ** 16
+        """Size limit in bytes of the buffer lines are read into. Lines longer than this are an error"""
+        self.nodelay = True
+        """Set TCP_NODELAY, so that writes are sent immediately rather than held to be combined with later writes"""
+        self.keepalive = None
+        """Optionally enable tcp keepalives to notice dead connections. This should be a dict of `idle`, `interval`
+        and `count`, as for the TCP_KEEPIDLE, TCP_KEEPINTVL and TCP_KEEPCNT socket options, or True for the system's
+        defaults."""
+
+        self.inbound_size = 1000
+        """Number of lines read from the server that may wait for their hooks to run"""
+        self.inbound_overflow = "drop_oldest"
+        """What to do with lines read while the inbound queue is full. "drop_oldest" discards the line that has waited
+        longest, "drop_newest" discards the line read and "block" stops reading until there's room. PINGs are answered
+        as they're read, but a blocked reader doesn't read them, so "block" risks a ping timeout behind slow hooks."""
+        self.inbound = None
+        """Queue of (time read, command, args, prefix, trailing) tuples of lines waiting for their hooks to run"""
+        self.inbound_dropped = 0
+        """Number of lines discarded because the inbound queue was full"""
+        self.overflowing = False
+        self.lines_read = 0
+        """Number of lines whose hooks have run"""
+        self.latency_last = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
 
         self.nick = None
 
@@ -66,70 +270,257 @@ class IRCCore(object):
         self.initHooks()
 
         self.outseq = 5
-        self.outputq = asyncio.PriorityQueue()
+        self.outputq = OutputQueue()
+        self.handoff = deque()
+        """Lines sent from other threads, waiting to be moved to the output queue by the event loop"""
+        self.handoff_scheduled = False
+        self.loop_thread = None
+        """Ident of the thread running the event loop"""
+
+        self.lines_written = 0
+        """Number of lines written to the socket"""
+        self.bytes_written = 0
+        """Number of bytes written to the socket"""
+        self.writes = 0
+        """Number of writes made to the socket. Each write contains one or more lines"""
+
         self._loop.call_soon_threadsafe(asyncio.ensure_future, self.outputqueue())
 
     async def loop(self, loop):
+        if self.inbound is None:
+            self.inbound = asyncio.Queue(self.inbound_size)
+        dispatcher = asyncio.ensure_future(self.dispatch())
+        try:
+            await self.read(loop)
+        finally:
+            dispatcher.cancel()
+
+    async def read(self, loop):
+        """Connect, and read lines from the server into the inbound queue until disconnected. Then reconnect, until
+        we're killed. PINGs are answered here, rather than waiting for their turn in the queue."""
         while self.alive:
             try:
-                # TODO support ipv6 again
-                self.reader, self.writer = await asyncio.open_connection(self.servers[self.server][0],
-                                                                         port=self.servers[self.server][1],
-                                                                         loop=loop,
-                                                                         ssl=None,
-                                                                         family=self.connection_family,
-                                                                         local_addr=self.bind_addr)
+                self.server, self.reader, self.writer = await self.connect()
+                self.registered = False
+                if self.rate_adaptive:
+                    self.bucket = self.server_limiter()
                 self.fire_hook("_CONNECT")
-            except (socket.gaierror, ConnectionRefusedError, OSError) as e:
-                logging.warning("Non-fatal connect error, trying next server...")
+            except (OSError, asyncio.TimeoutError) as e:
+                delay = self.backoff()
+                logging.warning("Non-fatal connect error, trying next servers in {:.1f}s...".format(delay))
                 self.trace()
                 report(e)
-                self.server = (self.server + 1) % len(self.servers)
-                await asyncio.sleep(1, loop=loop)
+                self.server = (self.server + min(self.connect_parallel, len(self.servers))) % len(self.servers)
+                await asyncio.sleep(delay)
                 continue
             while self.alive:
                 try:
-                    data = await self.reader.readuntil()
+                    try:
+                        data = await self.reader.readuntil()
+                    except asyncio.LimitOverrunError:
+                        self.log.warning("Discarding line longer than {} bytes".format(self.stream_limit))
+                        await self.discard_line()
+                        continue
                     self.log.debug("<<< {}".format(repr(data)))
-                    command, args, prefix, trailing = parse_irc_line(data.decode("UTF-8"))
-                    self.fire_hook("_RECV", args=args, prefix=prefix, trailing=trailing)
-                    if command not in self.hookcalls:
-                        self.log.warning("Unknown command: cmd='{}' prefix='{}' args='{}' trailing='{}'"
-                                         .format(command, prefix, args, trailing))
-                    else:
-                        self.fire_hook(command, args=args, prefix=prefix, trailing=trailing)
-                except (ConnectionResetError, asyncio.streams.IncompleteReadError) as e:
+                    line = parse_irc_bytes(data)
+                    if line is None:
+                        self.log.warning("Unparseable line: {}".format(repr(data)))
+                        continue
+                    command, args, prefix, trailing = line.astuple()
+                    if command == "PING":
+                        # the token may be sent as a middle parameter rather than a trailing one
+                        self.act_PONG(trailing if trailing is not None else (args[0] if args else ""))
+                    elif not self.registered and command == "001":
+                        self.registered = True
+                        self.connect_attempts = 0
+                    elif self.rate_adaptive and command in THROTTLE_COMMANDS and \
+                            self.is_throttle(command, prefix, trailing):
+                        self.log.warning("Throttled by server: {}".format(trailing))
+                        self.bucket.throttled()
+                    await self.enqueue((monotonic(), command, args, prefix, trailing))
+                except (ConnectionResetError, asyncio.IncompleteReadError) as e:
                     self.trace()
                     report(e)
                     break
-                except (UnicodeDecodeError, ) as e:
-                    self.trace()
-                    report(e)
+            # the hooks of lines from this connection run before those of the next
+            await self.inbound.join()
             self.fire_hook("_DISCONNECT")
             self.writer.close()
             if self.alive:
-                # TODO ramp down reconnect attempts
-                logging.info("Reconnecting in {}s...".format(self.reconnect_delay))
-                await asyncio.sleep(self.reconnect_delay)
+                if not self.registered:  # this server isn't letting us in, try the next one
+                    self.server = (self.server + 1) % len(self.servers)
+                delay = self.backoff()
+                logging.info("Reconnecting in {:.1f}s...".format(delay))
+                await asyncio.sleep(delay)
+
+    async def enqueue(self, item):
+        """Add a line to the inbound queue, applying the overflow policy if it's full"""
+        if self.inbound.full() and self.inbound_overflow != "block":
+            if not self.overflowing:
+                self.log.warning("Inbound queue is full, dropping lines")
+                self.overflowing = True
+            self.inbound_dropped += 1
+            if self.inbound_overflow == "drop_newest":
+                return
+            self.inbound.get_nowait()
+            self.inbound.task_done()
+        else:
+            self.overflowing = False
+        await self.inbound.put(item)
+
+    async def dispatch(self):
+        """Run the hooks of lines in the inbound queue, in the order they were read"""
+        running_since = monotonic()
+        while True:
+            if self.inbound.empty():
+                # waiting for a line lets everything else run
+                item = await self.inbound.get()
+                running_since = monotonic()
+            else:
+                item = self.inbound.get_nowait()
+            received, command, args, prefix, trailing = item
+            try:
+                self.latency_last = monotonic() - received
+                self.latency_total += self.latency_last
+                self.latency_max = max(self.latency_max, self.latency_last)
+                self.lines_read += 1
+                self.fire_hook("_RECV", args=args, prefix=prefix, trailing=trailing)
+                if command not in self.hookcalls:
+                    self.log.warning("Unknown command: cmd='{}' prefix='{}' args='{}' trailing='{}'"
+                                     .format(command, prefix, args, trailing))
+                else:
+                    self.fire_hook(command, args=args, prefix=prefix, trailing=trailing)
+            finally:
+                self.inbound.task_done()
+            if monotonic() - running_since > DISPATCH_SLICE:
+                # let the reader run, so PINGs are answered while there's a backlog
+                await asyncio.sleep(0)
+                running_since = monotonic()
+
+    async def connect(self):
+        """Open a connection to one of the servers. Connections are attempted to up to `connect_parallel` servers,
+        starting with the current one. Each attempt is given `happy_eyeballs_delay` seconds to connect before the next
+        one is started alongside it, and the first to connect wins. Raises the last connection error if all fail.
+
+        :returns: tuple of (server index, reader, writer)"""
+        count = min(self.connect_parallel, len(self.servers)) or 1
+        indexes = [(self.server + i) % len(self.servers) for i in range(count)]
+        attempts = {}
+        pending = set()
+        winner = None
+        error = None
+        try:
+            while indexes or pending:
+                if indexes:
+                    index = indexes.pop(0)
+                    task = asyncio.ensure_future(self.open_server(index))
+                    attempts[task] = index
+                    pending.add(task)
+                done, pending = await asyncio.wait(pending, timeout=self.happy_eyeballs_delay if indexes else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        self.log.warning("Connecting to {}:{} failed: {}".format(*self.servers[attempts[task]],
+                                                                                repr(error)))
+                    elif winner is None:
+                        winner = (attempts[task], ) + task.result()
+                    else:
+                        task.result()[1].close()
+                if winner:
+                    return winner
+        finally:
+            for task in pending:
+                task.cancel()
+            for result in await asyncio.gather(*pending, return_exceptions=True):
+                if type(result) is tuple:  # connected just as it was cancelled
+                    result[1].close()
+        raise error
+
+    async def open_server(self, index):
+        """Open a connection to the server at an index of the server list
+
+        :returns: tuple of (reader, writer)"""
+        host, port = self.servers[index]
+        kwargs = {}
+        if self.connection_family == socket.AF_UNSPEC:
+            kwargs["happy_eyeballs_delay"] = self.happy_eyeballs_delay
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port=port, ssl=None,
+                                                                        family=self.connection_family,
+                                                                        local_addr=self.bind_addr,
+                                                                        limit=self.stream_limit, **kwargs),
+                                                self.connect_timeout)
+        self.set_socket_options(writer.get_extra_info("socket"))
+        return reader, writer
+
+    async def discard_line(self):
+        """Skip the rest of a line that is too long to be read, up to and including its line ending"""
+        while True:
+            try:
+                await self.reader.readuntil()
+                return
+            except asyncio.LimitOverrunError as e:
+                await self.reader.readexactly(e.consumed)
+
+    def set_socket_options(self, sock):
+        """Apply the `nodelay` and `keepalive` options to a connected socket"""
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if self.nodelay else 0)
+        if self.keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            settings = self.keepalive if isinstance(self.keepalive, dict) else {}
+            for key, option in (("idle", "TCP_KEEPIDLE"), ("interval", "TCP_KEEPINTVL"), ("count", "TCP_KEEPCNT")):
+                if key in settings and hasattr(socket, option):  # not all platforms have these
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), int(settings[key]))
+
+    def backoff(self):
+        """Return the number of seconds to wait before the next connection attempt. This is a random value up to an
+        exponentially growing limit ("full jitter"), so that many bots disconnected at once don't all come back at the
+        same moment.
+
+        :returns: float"""
+        limit = min(self.reconnect_max, self.reconnect_delay * 2 ** min(self.connect_attempts, 32))
+        self.connect_attempts += 1
+        return random.uniform(0, limit)
 
     async def outputqueue(self):
-        self.bucket = burstbucket(self.rate_max, self.rate_int)
+        self.loop_thread = get_ident()
+        self.bucket = self.server_limiter() if self.rate_adaptive else burstbucket(self.rate_max, self.rate_int)
+        self.held = None
         while True:
+            # a line taken from the queue but not yet sent is kept in self.held
+            if not self.held:
+                self.held = (await self.outputq.get())[2]
             # sleep until the bucket allows us to send
-            # TODO warn/drop option if age (the _ above is older than some threshold)
             if self.rate_limit:
                 while True:
-                    s = self.bucket.get()
+                    s = self.bucket.get(self.held)
                     if s == 0:
                         break
                     else:
-                        await asyncio.sleep(s, loop=self._loop)
-            prio, _, line = await self.outputq.get()
-            self.fire_hook('_SEND', args=None, prefix=None, trailing=None)
-            self.log.debug(">>> {}".format(repr(line)))
-            self.outputq.task_done()
+                        await asyncio.sleep(s)
+            lines = [self.held]
+            self.held = None
+            # Send whatever else is queued in the same write, as far as the bucket allows right now
+            while not self.outputq.empty():
+                try:
+                    line = self.outputq.get_nowait()[2]
+                except asyncio.QueueEmpty:  # the rest had expired
+                    break
+                if self.rate_limit and self.bucket.get(line) != 0:
+                    self.held = line
+                    break
+                lines.append(line)
+            for line in lines:
+                self.fire_hook('_SEND', args=None, prefix=None, trailing=None)
+                self.log.debug(">>> {}".format(repr(line)))
+            data = "".join(line + "\r\n" for line in lines).encode("UTF-8")
             try:
-                self.writer.write((line + "\r\n").encode("UTF-8"))
+                self.writer.write(data)
+                self.lines_written += len(lines)
+                self.bytes_written += len(data)
+                self.writes += 1
+                # Wait for the transport's buffer to empty out if the kernel isn't accepting data fast enough
+                await self.writer.drain()
             except Exception as e:  # Probably fine if we drop messages while offline
                 self.trace()
                 report(e)
@@ -147,18 +538,99 @@ class IRCCore(object):
         self.writer.close()
         self.log.info("Kill complete")
 
-    def sendRaw(self, data, priority=None):
+    def sendRaw(self, data, priority=None, ttl=None):
         """
         Send data on the wire. Lower priorities are sent first.
         :param data: unicode data to send. will be converted to utf-8
         :param priority: numerical priority value. If not None, the message will likely be sent first. Otherwise, an
                          ever-increasing sequence number is used to maintain order. For a minimum priority message,
                          use a priority value of sys.maxsize.
+        :param ttl: seconds the message may wait in the queue before it is dropped as stale. Defaults to the ttl
+                    configured for the priority, if any.
         """
         if priority is None:
             self.outseq += 1
             priority = self.outseq
-        asyncio.run_coroutine_threadsafe(self.outputq.put((priority, time(), data, )), self._loop)
+        if get_ident() == self.loop_thread:
+            if self.handoff:
+                self.flush_handoff()
+            self.outputq.put(priority, data, ttl)
+            return
+        # other threads pass lines through a deque and wake the loop once for as many lines as they send before it runs
+        self.handoff.append((priority, data, ttl))
+        if not self.handoff_scheduled:
+            self.handoff_scheduled = True
+            self._loop.call_soon_threadsafe(self.flush_handoff)
+
+    def flush_handoff(self):
+        """Move lines sent from other threads into the output queue. Runs on the event loop."""
+        # cleared first, so that lines appended after the deque is emptied schedule another flush
+        self.handoff_scheduled = False
+        popleft = self.handoff.popleft
+        put = self.outputq.put
+        while True:
+            try:
+                priority, data, ttl = popleft()
+            except IndexError:
+                return
+            put(priority, data, ttl)
+
+    def server_limiter(self):
+        """Return the penaltybucket of the current server, creating it if we haven't connected to the server before
+
+        :returns: penaltybucket"""
+        key = "{}:{}".format(*self.servers[self.server])
+        if key not in self.limiters:
+            self.limiters[key] = penaltybucket()
+        return self.limiters[key]
+
+    @staticmethod
+    def is_throttle(command, prefix, trailing):
+        """Determine if a line from the server is telling us to slow down. NOTICEs from users are ignored.
+
+        :param command: irc command of the line
+        :type command: str
+        :param prefix: the line's prefix
+        :type prefix: str
+        :param trailing: the line's trailing data
+        :type trailing: str
+        :returns: bool"""
+        if command in ("263", "439"):
+            return True
+        if command == "NOTICE" and prefix and "!" in prefix:
+            return False
+        return bool(trailing and THROTTLE_RE.search(trailing))
+
+    def get_stats(self):
+        """Return a dict of counters describing the connection's traffic. Safe to call from any thread: the queues and
+        limiters are read on the event loop, which is the only thread that changes them.
+
+        :returns: dict"""
+        if get_ident() == self.loop_thread or not self._loop.is_running():
+            return self.collect_stats()
+
+        async def collect():
+            return self.collect_stats()
+        return asyncio.run_coroutine_threadsafe(collect(), self._loop).result(timeout=10)
+
+    def collect_stats(self):
+        """Build the dict returned by :py:meth:`get_stats`. Must run on the event loop."""
+        stats = {"output_queue": self.outputq.qsize() + (1 if getattr(self, "held", None) else 0),
+                 "output_backlog": self.outputq.backlog(),
+                 "output_expired": dict(self.outputq.expired),
+                 "lines_written": self.lines_written,
+                 "bytes_written": self.bytes_written,
+                 "writes": self.writes,
+                 "inbound_queue": self.inbound.qsize() if self.inbound is not None else 0,
+                 "inbound_dropped": self.inbound_dropped,
+                 "lines_read": self.lines_read,
+                 "inbound_latency": {"last": self.latency_last,
+                                     "average": self.latency_total / self.lines_read if self.lines_read else 0.0,
+                                     "max": self.latency_max}}
+        if self.rate_adaptive:
+            stats["rate_limits"] = {key: {"factor": limiter.factor, "throttles": limiter.throttles}
+                                    for key, limiter in self.limiters.items()}
+        return stats
 
     " Module related code "
     def initHooks(self):
@@ -179,6 +651,8 @@ class IRCCore(object):
             'PRIVMSG',
             'KICK',
             'INVITE',
+            'CAP',
+            'AUTHENTICATE',
             '001',
             '002',
             '003',
@@ -202,8 +676,16 @@ class IRCCore(object):
             '401',
             '422',
             '433',
+            '900',
+            '902',
+            '903',
+            '904',
+            '905',
+            '906',
+            '907',
+            '908',
         ]
-        " mapping of hooks to methods "
+        " mapping of hooks to (method, legacy calling convention) tuples "
         self.hookcalls = {command: [] for command in self.hooks}
 
     def fire_hook(self, command, args=None, prefix=None, trailing=None):
@@ -217,27 +699,32 @@ class IRCCore(object):
         :type prefix: str
         :param trailing: data payload of the command
         :type trailing: str"""
-        for hook in self.hookcalls["_ALL"] + self.hookcalls[command]:
-            try:
-                if len(getargspec(hook).args) == 2:
-                    hook(IRCCore.packetAsObject(command, args, prefix, trailing))
-                else:
-                    hook(args, prefix, trailing)
+        event = None
+        for hooks in (self.hookcalls["_ALL"], self.hookcalls[command]):
+            for hook, legacy in hooks:
+                try:
+                    if legacy:
+                        hook(args, prefix, trailing)
+                    else:
+                        if event is None:
+                            event = IRCCore.packetAsObject(command, args, prefix, trailing)
+                        hook(event)
 
-            except Exception as e:
-                self.log.warning("Error processing hook: \n%s" % self.trace())
-                report(e)
+                except Exception as e:
+                    self.log.warning("Error processing hook: \n%s" % self.trace())
+                    report(e)
 
     def addHook(self, command, method):
         """**Internal.** Enable (connect) a single hook of a module
 
         :param command: command this hook will trigger on
         :type command: str
-        :param method: callable method object to hook in
+        :param method: callable method object to hook in. Methods accepting a single argument are passed an
+                       :py:class:`IRCEvent`, others are called with the legacy (args, prefix, trailing) arguments.
         :type method: object"""
         " add a single hook "
         if command in self.hooks:
-            self.hookcalls[command].append(method)
+            self.hookcalls[command] = self.hookcalls[command] + [(method, IRCCore.isLegacyHook(method))]
         else:
             self.log.warning("Invalid hook - %s" % command)
             return False
@@ -251,13 +738,22 @@ class IRCCore(object):
         :type method: object"""
         " remove a single hook "
         if command in self.hooks:
-            for hookedMethod in self.hookcalls[command]:
-                if hookedMethod == method:
-                    self.hookcalls[command].remove(hookedMethod)
+            self.hookcalls[command] = [hook for hook in self.hookcalls[command] if hook[0] != method]
         else:
             self.log.warning("Invalid hook - %s" % command)
             return False
 
+    @staticmethod
+    def isLegacyHook(method):
+        """Determine if a hook method expects the legacy (args, prefix, trailing) arguments rather than an IRCEvent
+
+        :param method: the hook method
+        :type method: object
+        :returns: bool"""
+        params = [param for param in signature(method).parameters.values()
+                  if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD)]
+        return len(params) != 1
+
     @staticmethod
     def packetAsObject(command, args, prefix, trailing):
         """Given an irc message's args, prefix, and trailing data return an object with these properties
@@ -354,20 +850,35 @@ class IRCCore(object):
         self.sendRaw("NICK %s" % newNick, priority)
 
     def act_JOIN(self, channel, priority=3):
-        """Use the `/join` command
+        """Use the `/join` command. A list of channels is joined with as few lines as possible.
 
-        :param channel: the channel to attempt to join
+        :param channel: the channel, or list of channels, to attempt to join
         :type channel: str"""
-        self.sendRaw("JOIN %s" % channel, priority)
-
-    def act_PRIVMSG(self, towho, message, priority=3):
+        if isinstance(channel, str):
+            channel = [channel]
+        batch = []
+        length = 0
+        for name in channel:
+            size = len(name.encode("UTF-8")) + 1
+            if batch and length + size > JOIN_LENGTH:
+                self.sendRaw("JOIN %s" % ",".join(batch), priority)
+                batch = []
+                length = 0
+            batch.append(name)
+            length += size
+        if batch:
+            self.sendRaw("JOIN %s" % ",".join(batch), priority)
+
+    def act_PRIVMSG(self, towho, message, priority=3, ttl=None):
         """Use the `/msg` command
 
         :param towho: the target #channel or user's name
         :type towho: str
         :param message: the message to send
-        :type message: str"""
-        self.sendRaw("PRIVMSG %s :%s" % (towho, message), priority)
+        :type message: str
+        :param ttl: seconds the message may wait to be sent before it's dropped as stale
+        :type ttl: float"""
+        self.sendRaw("PRIVMSG %s :%s" % (towho, message), priority, ttl)
 
     def act_MODE(self, channel, mode, extra=None, priority=2):
         """Use the `/mode` command
@@ -383,14 +894,16 @@ class IRCCore(object):
         else:
             self.sendRaw("MODE %s %s" % (channel, mode), priority)
 
-    def act_ACTION(self, channel, action, priority=2):
+    def act_ACTION(self, channel, action, priority=2, ttl=None):
         """Use the `/me <action>` command
 
         :param channel: the channel name or target's name the message is sent to
         :type channel: str
         :param action: the text to send
-        :type action: str"""
-        self.sendRaw("PRIVMSG %s :\x01ACTION %s" % (channel, action), priority)
+        :type action: str
+        :param ttl: seconds the message may wait to be sent before it's dropped as stale
+        :type ttl: float"""
+        self.sendRaw("PRIVMSG %s :\x01ACTION %s" % (channel, action), priority, ttl)
 
     def act_KICK(self, channel, who, comment="", priority=2):
         """Use the `/kick <user> <message>` command
@@ -410,6 +923,26 @@ class IRCCore(object):
         :type message: str"""
         self.sendRaw("QUIT :%s" % message, priority)
 
+    def act_CAP(self, subcommand, capabilities=None, priority=1):
+        """Use the CAP command to negotiate IRCv3 capabilities. Used during connection
+
+        :param subcommand: LS, REQ or END
+        :type subcommand: str
+        :param capabilities: capabilities to request, or the LS version
+        :type capabilities: str"""
+        if capabilities is None:
+            self.sendRaw("CAP %s" % subcommand, priority)
+        else:
+            self.sendRaw("CAP %s %s" % (subcommand, capabilities if subcommand == "LS" else ":" + capabilities),
+                         priority)
+
+    def act_AUTHENTICATE(self, data, priority=1):
+        """Use the AUTHENTICATE command to pick a SASL mechanism or send SASL data. Used during connection
+
+        :param data: the mechanism name, or a chunk of base64 encoded data
+        :type data: str"""
+        self.sendRaw("AUTHENTICATE %s" % data, priority)
+
     def act_PASS(self, password, priority=1):
         """
         Send server password, for use on connection
@@ -8,9 +8,19 @@
 
 import re
 import os
+import asyncio
 import logging
+import traceback
+from functools import partial
+from itertools import chain
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # python < 3.11
+    import sre_parse
+    import sre_constants
 from .common import load as pload
-from .common import messageHasCommand
+from .common import report
+from .common import messageHasCommandSingle, parse_command_line, ParsedCommand
 
 
 class ModuleBase(object):
@@ -22,6 +32,12 @@ class ModuleBase(object):
     :type moduleName: str
     """
 
+    max_tasks = 4
+    """Number of this module's ``async def`` hooks that may run at once. Others wait for a slot"""
+
+    max_waiting = 32
+    """Number of this module's tasks that may wait for a slot. Tasks started while this many are waiting are dropped"""
+
     def __init__(self, bot, moduleName):
         self.moduleName = moduleName
         """Assigned name of this module"""
@@ -42,6 +58,14 @@ class ModuleBase(object):
         self.log = logging.getLogger("Module.%s" % self.moduleName)
         """Logger object for this module"""
 
+        self.tasks = set()
+        """Futures of this module's running tasks"""
+        self.task_slots = asyncio.Semaphore(self.max_tasks)
+        self.tasks_waiting = 0
+        """Number of this module's tasks waiting for a slot"""
+        self.tasks_dropped = 0
+        """Number of this module's tasks dropped because too many were waiting"""
+
         # Autoload config if available
         self.loadConfig()
 
@@ -60,7 +84,7 @@ class ModuleBase(object):
                 continue
             if hasattr(attr, ATTR_ALL_HOOKS):
                 for hook in getattr(attr, ATTR_ALL_HOOKS):
-                    self.irchooks.append(IRCHook(hook.validate, attr))
+                    self.irchooks.append(IRCHook(hook.validate, attr, hook))
 
     def loadConfig(self):
         """
@@ -83,6 +107,77 @@ class ModuleBase(object):
         """
         pass
 
+    def run_task(self, coro):
+        """Run a coroutine as a task on the bot's event loop. At most `max_tasks` of the module's tasks run at once,
+        and at most `max_waiting` wait for a slot; tasks beyond that are dropped, resolving to None. Exceptions are
+        logged and reported, and tasks still running when the module is unloaded are cancelled. Safe to call from any
+        thread. ``async def`` hooks are run this way.
+
+        :param coro: the coroutine to run
+        :returns: concurrent.futures.Future -- the coroutine's result"""
+        future = asyncio.run_coroutine_threadsafe(self._run_task(coro), self.bot.loop)
+        self.tasks.add(future)
+        future.add_done_callback(self.tasks.discard)
+        return future
+
+    async def _run_task(self, coro):
+        if self.task_slots.locked() and self.tasks_waiting >= self.max_waiting:
+            self.tasks_dropped += 1
+            self.log.warning("Dropping task, %s are already waiting to run" % self.tasks_waiting)
+            coro.close()
+            return
+        try:
+            self.tasks_waiting += 1
+            try:
+                await self.task_slots.acquire()
+            finally:
+                self.tasks_waiting -= 1
+            try:
+                return await coro
+            finally:
+                self.task_slots.release()
+        except asyncio.CancelledError:
+            coro.close()
+            raise
+        except Exception as e:
+            self.log.warning("Error processing task: \n%s" % traceback.format_exc())
+            report(e)
+
+    def cancel_tasks(self):
+        """Cancel the module's running tasks"""
+        for future in list(self.tasks):
+            future.cancel()
+
+    async def run_in_thread(self, func, *args, **kwargs):
+        """Call a blocking function on the event loop's default thread pool, without blocking the event loop, and
+        return its result. For use in ``async def`` hooks. The pool is separate from the scheduler's, so slow calls
+        don't hold up timed jobs.
+
+        :param func: the function to call with args and kwargs"""
+        return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args, **kwargs))
+
+    def call_later(self, delay, func, *args, threaded=False, name=None):
+        """Schedule func to be called once after delay seconds. Cancelled if the module is unloaded first. See
+        :py:meth:`pyircbot.scheduler.Scheduler.call_later`
+
+        :returns: pyircbot.scheduler.Job"""
+        return self.bot.scheduler.call_later(delay, func, *args, owner=self, threaded=threaded, name=name)
+
+    def call_every(self, interval, func, *args, delay=None, threaded=False, name=None):
+        """Schedule func to be called every interval seconds until the module is unloaded. See
+        :py:meth:`pyircbot.scheduler.Scheduler.call_every`
+
+        :returns: pyircbot.scheduler.Job"""
+        return self.bot.scheduler.call_every(interval, func, *args, delay=delay, owner=self, threaded=threaded,
+                                             name=name)
+
+    def call_cron(self, spec, func, *args, threaded=False, name=None):
+        """Schedule func to be called on a cron-like schedule until the module is unloaded. See
+        :py:meth:`pyircbot.scheduler.Scheduler.call_cron`
+
+        :returns: pyircbot.scheduler.Job"""
+        return self.bot.scheduler.call_cron(spec, func, *args, owner=self, threaded=threaded, name=name)
+
     def getConfigPath(self):
         """Returns the absolute path of this module's json config file"""
         return self.bot.getConfigPath(self.moduleName)
@@ -104,13 +199,276 @@ class ModuleHook:
 
 
 class IRCHook:
-    def __init__(self, validator, method):
+    def __init__(self, validator, method, hook=None):
         """
         :param validator: method accpeting an IRCEvent and returning false-like or true-like depending on match
         :param method: module method
+        :param hook: the AbstractHook instance that produced this IRCHook. Used to find the index keys of the hook
         """
         self.validator = validator
         self.method = method
+        self.hook = hook
+        self.is_async = asyncio.iscoroutinefunction(method)
+        """Whether the method is an ``async def`` that is run as a task of its module"""
+        self.commands, self.keywords = hook.index_keys() if hook else (None, None)
+        self.patterns = hook.index_patterns() if hook else None
+        self.order = 0
+        """Dispatch order, assigned by :py:class:`HookIndex`"""
+
+
+class HookIndex(object):
+    """
+    Lookup table of the IRCHooks of all loaded modules. Hooks are bucketed by the IRC commands they listen for and,
+    for chat commands, by the prefixed keyword, so that a line is only validated against hooks that can possibly match
+    it. Hooks that didn't declare any commands are tested against every line.
+
+    Buckets are replaced rather than modified so lookups from other threads never see a half-updated list.
+    """
+
+    def __init__(self):
+        self.wildcard = []
+        """(hook, None) tuples of hooks that are tested against every message"""
+
+        self.by_command = {}
+        """Mapping of irc command to (hook, None) tuples"""
+
+        self.by_keyword = {}
+        """Mapping of (irc command, first word of a prefixed chat command) to hooks"""
+
+        self.by_pattern = {}
+        """Mapping of irc command to a :py:class:`PatternSet` of regex hooks"""
+
+        self.seq = 0
+
+    def add(self, irchooks):
+        """
+        Add hooks to the index. Hooks added later are dispatched after those added earlier.
+
+        :param irchooks: list of :py:class:`IRCHook` objects
+        """
+        # regex hooks by irc command, so each PatternSet is compiled once
+        patterns = {}
+        for irchook in irchooks:
+            self.seq += 1
+            irchook.order = self.seq
+            for bucket, key in self._keys(irchook):
+                if bucket is self.by_pattern:
+                    if key not in patterns:
+                        patterns[key] = list(bucket[key].hooks) if key in bucket else []
+                    patterns[key].append(irchook)
+                else:
+                    bucket[key] = bucket.get(key, []) + [(irchook, None) if bucket is self.by_command else irchook]
+            if irchook.commands is None:
+                self.wildcard = self.wildcard + [(irchook, None)]
+        for key, hooks in patterns.items():
+            self.by_pattern[key] = PatternSet(hooks)
+
+    def remove(self, irchooks):
+        """
+        Remove hooks from the index
+
+        :param irchooks: list of :py:class:`IRCHook` objects
+        """
+        removed = set(irchooks)
+        patterns = set()  # irc commands whose PatternSet needs rebuilding
+        for irchook in irchooks:
+            for bucket, key in self._keys(irchook):
+                if bucket is self.by_pattern:
+                    patterns.add(key)
+                    continue
+                hooks = [i for i in bucket.get(key, []) if i is not irchook and i != (irchook, None)]
+                if hooks:
+                    bucket[key] = hooks
+                else:
+                    bucket.pop(key, None)
+            if irchook.commands is None:
+                self.wildcard = [i for i in self.wildcard if i[0] is not irchook]
+        for key in patterns:
+            hooks = [i for i in (self.by_pattern[key].hooks if key in self.by_pattern else []) if i not in removed]
+            if hooks:
+                self.by_pattern[key] = PatternSet(hooks)
+            else:
+                self.by_pattern.pop(key, None)
+
+    def _keys(self, irchook):
+        """
+        Yield (bucket, key) pairs an IRCHook is stored under
+        """
+        if irchook.commands is None:
+            return
+        for irc_command in irchook.commands:
+            if irchook.patterns is not None:
+                yield self.by_pattern, irc_command
+            elif irchook.keywords is None:
+                yield self.by_command, irc_command
+            else:
+                for keyword in irchook.keywords:
+                    yield self.by_keyword, (irc_command, keyword)
+
+    def lookup(self, msg, nick=None):
+        """
+        Return the hooks that may match a message, in dispatch order. The hooks' validators still need to be called.
+
+        :param msg: message to find hooks for
+        :type msg: pyircbot.irccore.IRCEvent
+        :param nick: the bot's current nick, used to look up chat commands in the highlight form
+        :type nick: str
+        """
+        return [irchook for irchook, line in self._candidates(msg, nick)]
+
+    def matches(self, msg, bot, nick=None):
+        """
+        Yield (irchook, validation) pairs for each hook matching a message, in dispatch order. The message's chat
+        command, if any, is parsed once and shared by all chat command hooks.
+
+        :param msg: message to find hooks for
+        :type msg: pyircbot.irccore.IRCEvent
+        :param bot: reference to the bot, passed to validators
+        :param nick: the bot's current nick, used to match chat commands in the highlight form
+        :type nick: str
+        """
+        for irchook, line in self._candidates(msg, nick):
+            if line is None:
+                validation = irchook.validator(msg, bot)
+            else:
+                validation = irchook.hook.validate_line(msg, line)
+            if validation:
+                yield irchook, validation
+
+    def _candidates(self, msg, nick):
+        """
+        Return a list of (irchook, command_line) tuples, in dispatch order. command_line is the parsed
+        :py:class:`pyircbot.common.CommandLine` the hook was found by, for keyword hooks, or None
+        """
+        buckets = [bucket for bucket in (self.wildcard, self.by_command.get(msg.command)) if bucket]
+        # patterns may match an empty message, like ^$ does
+        if msg.command in self.by_pattern and msg.trailing is not None:
+            bucket = self.by_pattern[msg.command].candidates(msg.trailing)
+            if bucket:
+                buckets.append(bucket)
+        if self.by_keyword and msg.trailing:
+            for line in parse_command_line(msg.trailing, nick):
+                bucket = self.by_keyword.get((msg.command, line.word))
+                if bucket:
+                    buckets.append([(irchook, line) for irchook in bucket])
+        if not buckets:
+            return []
+        if len(buckets) == 1:
+            return buckets[0]
+        return sorted(chain(*buckets), key=lambda item: item[0].order)
+
+
+class PatternSet(object):
+    """
+    Group of hooks that search the message text with regular expressions. Rather than searching every expression of
+    every hook, the message is prefiltered so that only hooks with an expression that could match are validated:
+
+    - Expressions that contain a literal string in every match, such as ``\\.text\\-(\\w+)``, are only searched if
+      the message contains that string
+    - Other expressions are merged into a single alternation that is searched once. If it doesn't match, none of
+      the expressions can.
+
+    Expressions that can be neither - those with inline flags, back references or clashing group names - are always
+    validated on their own.
+    """
+
+    UNMERGEABLE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+    def __init__(self, hooks):
+        """
+        :param hooks: list of :py:class:`IRCHook` objects that have patterns, in dispatch order
+        """
+        self.hooks = hooks
+        self.always = []
+        self.by_literal = {}
+        self.merged = []
+        merged = []
+        names = set()
+        for irchook in hooks:
+            entry = (irchook, None)
+            literals = []
+            hook_merged = []
+            hook_names = set(names)
+            for exp in irchook.patterns:
+                literal = required_literal(exp)
+                if literal:
+                    literals.append(literal)
+                elif self.mergeable(exp, hook_names):
+                    hook_names.update(exp.groupindex)
+                    hook_merged.append("(?:{})".format(exp.pattern))
+                else:
+                    self.always.append(entry)
+                    break
+            else:
+                for literal in literals:
+                    self.by_literal.setdefault(literal, []).append(entry)
+                if hook_merged:
+                    names = hook_names
+                    merged.extend(hook_merged)
+                    self.merged.append(entry)
+        self.literals = None
+        if self.by_literal:
+            self.literals = re.compile("|".join(re.escape(literal) for literal in
+                                                sorted(self.by_literal, key=len, reverse=True)))
+        self.combined = None
+        if merged:
+            try:
+                self.combined = re.compile("|".join(merged))
+            except re.error:
+                self.always = sorted(set(self.always + self.merged), key=lambda item: item[0].order)
+                self.merged = []
+
+    def mergeable(self, exp, names):
+        return type(exp.pattern) is str and \
+            exp.flags == re.UNICODE and \
+            not self.UNMERGEABLE.search(exp.pattern) and \
+            not names.intersection(exp.groupindex)
+
+    def candidates(self, text):
+        """
+        Return the (hook, None) tuples of hooks that may match the text, in dispatch order
+        """
+        hits = []
+        if self.literals is not None and self.literals.search(text):
+            hits.extend(entries for literal, entries in self.by_literal.items() if literal in text)
+        if self.combined is not None and self.combined.search(text):
+            hits.append(self.merged)
+        if not hits:
+            return self.always
+        return sorted(set(chain(self.always, *hits)), key=lambda item: item[0].order)
+
+
+def required_literal(exp):
+    """
+    Return the longest string that any match of a compiled regular expression must contain, or None if there isn't one
+    or it can't be determined.
+
+    :param exp: compiled regular expression
+    """
+    if type(exp.pattern) is not str or exp.flags & (re.IGNORECASE | re.LOCALE):
+        return None
+    try:
+        parsed = sre_parse.parse(exp.pattern, exp.flags)
+    except Exception:
+        return None
+    runs = []
+
+    def walk(items):
+        run = ""
+        for op, av in items:
+            if op is sre_constants.LITERAL:
+                run += chr(av)
+                continue
+            runs.append(run)
+            run = ""
+            if op is sre_constants.SUBPATTERN and not av[1] & re.IGNORECASE:
+                walk(av[-1])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+                walk(av[2])
+        runs.append(run)
+
+    walk(parsed)
+    return max(runs, key=len) or None
 
 
 ATTR_ALL_HOOKS = "__hooks"
@@ -157,6 +515,21 @@ class AbstractHook(object):
         """
         return True
 
+    def index_keys(self):
+        """
+        Return a tuple of (irc_commands, keywords) describing which messages this hook can possibly match. None for
+        irc_commands means the hook is tested against every message. keywords, if not None, is a list of the first
+        words of chat commands the hook accepts.
+        """
+        return None, None
+
+    def index_patterns(self):
+        """
+        Return a list of compiled regular expressions if this hook only matches messages whose text matches one of
+        them. Otherwise, None.
+        """
+        return None
+
 
 class hook(AbstractHook):
     """
@@ -181,6 +554,9 @@ class hook(AbstractHook):
         if msg.command in self.commands:
             return True
 
+    def index_keys(self):
+        return self.commands, None
+
 
 class command(hook):
     """
@@ -217,6 +593,8 @@ class command(hook):
         self.require_args = require_args
         self.allow_private = allow_private
         self.allow_highlight = allow_highlight
+        self.prefixed = [("{}{}".format(self.prefix, keyword), " " in keyword) for keyword in keywords]
+        """(prefixed keyword, keyword has multiple words) for each keyword"""
 
     def validate(self, msg, bot):
         """
@@ -227,22 +605,47 @@ class command(hook):
         :param bot: reference to main pyircbot
         :type bot: pyircbot.pyircbot.PyIRCBot
         """
-        bot_nick = bot.get_nick()
         if not super().validate(msg, bot):
             return False
-        if msg.args[0][0] != "#" and not self.allow_private:
-            return False
-        for keyword in self.keywords:
-            single = self._validate_prefixedcommand(msg, keyword, bot_nick)
+        for line in parse_command_line(msg.trailing, bot.get_nick()):
+            single = self.validate_line(msg, line)
             if single:
                 return single
         return False
 
-    def _validate_prefixedcommand(self, msg, keyword, nick):
-        with_prefix = "{}{}".format(self.prefix, keyword)
-        return messageHasCommand(with_prefix, msg.trailing,
-                                 requireArgs=self.require_args,
-                                 withHighlight=nick if self.allow_highlight else False)
+    def validate_line(self, msg, line):
+        """
+        Test an already parsed message and return a ParsedCommand if matched. The irc command of the message is not
+        checked.
+
+        :param msg: message to test against
+        :type msg: pyircbot.irccore.IRCEvent
+        :param line: one form of the message's text, from :py:meth:`pyircbot.common.parse_command_line`
+        :type line: pyircbot.common.CommandLine
+        """
+        if msg.args[0][0] != "#" and not self.allow_private:
+            return False
+        # Messages starting with a highlight are only matched in their highlight form, if the command allows it
+        if line.highlight != (line.addressed and self.allow_highlight):
+            return False
+        for with_prefix, multiword in self.prefixed:
+            if multiword:
+                single = messageHasCommandSingle(with_prefix, line.message, requireArgs=self.require_args)
+                if single:
+                    return single
+                continue
+            if with_prefix != line.word:
+                continue
+            if self.require_args:
+                if not line.args_str:
+                    continue
+                elif type(self.require_args) is int and len(line.args) != self.require_args:
+                    continue
+            return ParsedCommand(with_prefix, list(line.args), line.args_str, line.message)
+        return False
+
+    def index_keys(self):
+        return self.commands, list({with_prefix.split(" ", 1)[0] for with_prefix, multiword in self.prefixed})
 
 
 class regex(hook):
@@ -290,6 +693,9 @@ class regex(hook):
                 return matches
         return False
 
+    def index_patterns(self):
+        return self.regexps
+
 
 class MissingDependancyException(Exception):
     """
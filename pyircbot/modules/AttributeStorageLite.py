@@ -8,6 +8,19 @@
 """
 
 from pyircbot.modulebase import ModuleBase
+from pyircbot.common import LRUCache
+from threading import Lock
+
+
+MISSING = object()
+
+MIGRATIONS = [
+    # 1: look up items by name and values by attribute without scanning the tables
+    ["CREATE INDEX IF NOT EXISTS `items_item` ON `items` (`item`)",
+     "CREATE INDEX IF NOT EXISTS `values_attributeid` ON `values` (`attributeid`)"],
+]
+"""Schema changes applied in order to existing databases. The database's `user_version` pragma is the number of
+migrations applied to it"""
 
 
 class AttributeStorageLite(ModuleBase):
@@ -49,12 +62,43 @@ class AttributeStorageLite(ModuleBase):
             ) ;""")
             c.close()
 
+        self.migrate()
+
+        # Caches of recently used values and ids. Values are written through by setKey; nothing else writes the tables
+        cache_size = self.config.get("cache_size", 4096)
+        self.values = LRUCache(cache_size)
+        """(item, attribute) -> value cache. Unset values are cached as None"""
+        self.items = LRUCache(cache_size)
+        """item -> dict of all the item's values cache"""
+        self.item_ids = LRUCache(cache_size)
+        self.attribute_ids = LRUCache(cache_size)
+        self.generation = 0
+        """Number of values written through to the caches. Reads only cache what they fetched if it hasn't changed"""
+        self.cache_lock = Lock()
+        """Guards generation"""
+
+    def migrate(self):
+        """Apply schema migrations the database is missing"""
+        with self.db.transaction() as c:
+            c.execute("PRAGMA user_version")
+            version = c.fetchone()["user_version"]
+            for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                self.log.info("Migrating schema to version %s" % number)
+                for statement in statements:
+                    c.execute(statement)
+                c.execute("PRAGMA user_version=%d" % number)
+
     def getItem(self, name):
         """Get all values for a item
 
         :param name: the item
         :type name: str
         :returns: dict -- the item's values expressed as a dict"""
+        name = name.lower()
+        item = self.items.get(name)
+        if item is not None:
+            return dict(item)
+        generation = self.generation
         c = self.db.query("""SELECT
             `i`.`id`,
             `i`.`item`,
@@ -68,7 +112,7 @@ class AttributeStorageLite(ModuleBase):
                     on `a`.`id`=`v`.`attributeid`
 
         WHERE
-            `i`.`item`=?;""", (name.lower(),))
+            `i`.`item`=?;""", (name,))
         item = {}
         while True:
             row = c.fetchone()
@@ -77,9 +121,8 @@ class AttributeStorageLite(ModuleBase):
             item[row["attribute"]] = row["value"]
         c.close()
 
-        if not item:
-            return {}
-        return item
+        self._cacheRead(self.items, [(name, item)], generation)
+        return dict(item)
 
     def get(self, item, key):
         return self.getKey(item, key)
@@ -92,6 +135,12 @@ class AttributeStorageLite(ModuleBase):
         :param key: they key who's value to return
         :type key: str
         :returns: str -- the item from the database or **None**"""
+        item = item.lower()
+        key = key.lower()
+        value = self.values.get((item, key), MISSING)
+        if value is not MISSING:
+            return value
+        generation = self.generation
         c = self.db.query("""SELECT
             `i`.`id`,
             `i`.`item`,
@@ -107,13 +156,167 @@ class AttributeStorageLite(ModuleBase):
         WHERE
             `i`.`item`=?
                 AND
-            `a`.`attribute`=?;""", (item.lower(), key.lower()))
+            `a`.`attribute`=?;""", (item, key))
         row = c.fetchone()
 
         c.close()
-        if row is None:
-            return None
-        return row["value"]
+        value = None if row is None else row["value"]
+        self._cacheRead(self.values, [((item, key), value)], generation)
+        return value
+
+    def getMany(self, items, key):
+        """Get the value of a key on many items at once
+
+        :param items: names of the items to fetch the key from
+        :type items: list
+        :param key: the key who's values to return
+        :type key: str
+        :returns: dict -- mapping of item name to the key's value or **None**"""
+        key = key.lower()
+        result = {}
+        missing = []
+        for item in items:
+            value = self.values.get((item.lower(), key), MISSING)
+            if value is MISSING:
+                missing.append(item.lower())
+            else:
+                result[item] = value
+        generation = self.generation
+        found = {}
+        # stay well below sqlite's limit of variables per statement
+        for offset in range(0, len(missing), 500):
+            chunk = missing[offset:offset + 500]
+            c = self.db.query("""SELECT
+                `i`.`item`,
+                `v`.`value`
+            FROM
+                `items` `i`
+                    INNER JOIN `values` `v`
+                        on `v`.`itemid`=`i`.`id`
+                    INNER JOIN `attribute` `a`
+                        on `a`.`id`=`v`.`attributeid`
+            WHERE
+                `a`.`attribute`=?
+                    AND
+                `i`.`item` IN ({});""".format(", ".join(["?"] * len(chunk))), [key] + chunk)
+            for row in c.fetchall():
+                found[row["item"]] = row["value"]
+            c.close()
+        self._cacheRead(self.values, [((name, key), found.get(name)) for name in missing], generation)
+        for item in items:
+            if item not in result:
+                result[item] = found.get(item.lower())
+        return result
+
+    def getItems(self, names):
+        """Get all values of many items at once
+
+        :param names: the items
+        :type names: list
+        :returns: dict -- mapping of item name to a dict of the item's values"""
+        result = {}
+        missing = []
+        for name in names:
+            item = self.items.get(name.lower())
+            if item is None:
+                missing.append(name.lower())
+            else:
+                result[name] = dict(item)
+        generation = self.generation
+        found = {name: {} for name in missing}
+        for offset in range(0, len(missing), 500):
+            chunk = missing[offset:offset + 500]
+            c = self.db.query("""SELECT
+                `i`.`item`,
+                `a`.`attribute`,
+                `v`.`value`
+            FROM
+                `items` `i`
+                    INNER JOIN `values` `v`
+                        on `v`.`itemid`=`i`.`id`
+                    INNER JOIN `attribute` `a`
+                        on `a`.`id`=`v`.`attributeid`
+            WHERE
+                `i`.`item` IN ({});""".format(", ".join(["?"] * len(chunk))), chunk)
+            for row in c.fetchall():
+                found[row["item"]][row["attribute"]] = row["value"]
+            c.close()
+        self._cacheRead(self.items, found.items(), generation)
+        for name in names:
+            if name not in result:
+                result[name] = dict(found[name.lower()])
+        return result
+
+    def getItemsWithKey(self, key):
+        """Get every item that has a key set
+
+        :param key: the key
+        :type key: str
+        :returns: dict -- mapping of item name to the key's value"""
+        c = self.db.query("""SELECT
+            `i`.`item`,
+            `v`.`value`
+        FROM
+            `values` `v`
+                INNER JOIN `items` `i`
+                    on `i`.`id`=`v`.`itemid`
+                INNER JOIN `attribute` `a`
+                    on `a`.`id`=`v`.`attributeid`
+        WHERE
+            `a`.`attribute`=?;""", (key.lower(),))
+        items = {row["item"]: row["value"] for row in c.fetchall()}
+        c.close()
+        return items
+
+    def setItems(self, values):
+        """Set many keys in one transaction
+
+        :param values: (item, key, value) tuples. Values of None delete the key. If a key is given more than once, the
+                       last value is stored
+        :type values: list"""
+        # only the last value given for a key is stored, so the deletes and replaces below can run in any order
+        values = [(item, key, value) for (item, key), value in
+                  {(item.lower(), key.lower()): value for item, key, value in values}.items()]
+        with self.db.transaction() as c:
+            attributeIds = self._getIds(c, "attribute", "attribute", self.attribute_ids,
+                                        set(key for item, key, value in values))
+            itemIds = self._getIds(c, "items", "item", self.item_ids, set(item for item, key, value in values))
+            c.executemany("DELETE FROM `values` WHERE `itemid`=? AND `attributeid`=? ;",
+                          [(itemIds[item], attributeIds[key]) for item, key, value in values if value is None])
+            c.executemany("REPLACE INTO `values` (`itemid`, `attributeid`, `value`) VALUES (?, ?, ?);",
+                          [(itemIds[item], attributeIds[key], value)
+                           for item, key, value in values if value is not None])
+        self.log.info("Stored %s values" % len(values))
+        for name, rowId in attributeIds.items():
+            self.attribute_ids.put(name, rowId)
+        for name, rowId in itemIds.items():
+            self.item_ids.put(name, rowId)
+        for item, key, value in values:
+            self._cacheValue(item, key, value)
+
+    def _getIds(self, c, table, column, cache, names):
+        """Return a dict of the ids of rows in `table` with `column` equal to each of `names`, creating rows as needed.
+        Runs on the given cursor. The caller caches the ids once committed."""
+        ids = {}
+        missing = []
+        for name in names:
+            rowId = cache.get(name)
+            if rowId is None:
+                missing.append(name)
+            else:
+                ids[name] = rowId
+        for offset in range(0, len(missing), 500):
+            chunk = missing[offset:offset + 500]
+            c.execute("SELECT `id`, `{0}` FROM `{1}` WHERE `{0}` IN ({2});".format(column, table,
+                                                                                  ", ".join(["?"] * len(chunk))),
+                      chunk)
+            for row in c.fetchall():
+                ids[row[column]] = row["id"]
+        for name in missing:
+            if name not in ids:
+                c.execute("INSERT INTO `{}` (`{}`) VALUES (?);".format(table, column), (name,))
+                ids[name] = c.lastrowid
+        return ids
 
     def set(self, item, key, value):
         return self.setKey(item, key, value)
@@ -130,27 +333,8 @@ class AttributeStorageLite(ModuleBase):
         item = item.lower()
         attribute = key.lower()
 
-        # Check attribute exists
-        c = self.db.query("SELECT `id` FROM `attribute` WHERE `attribute`=?;", (attribute,))
-        row = c.fetchone()
-        attributeId = -1
-        if row is None:
-            c = self.db.query("INSERT INTO `attribute` (`attribute`) VALUES (?);", (attribute,))
-            attributeId = c.lastrowid
-        else:
-            attributeId = row["id"]
-        c.close()
-
-        # check item exists
-        c = self.db.query("SELECT `id` FROM `items` WHERE `item`=?;", (item,))
-        row = c.fetchone()
-        itemId = -1
-        if row is None:
-            c = self.db.query("INSERT INTO `items` (`item`) VALUES (?);", (item,))
-            itemId = c.lastrowid
-        else:
-            itemId = row["id"]
-        c.close()
+        attributeId = self._getId("attribute", "attribute", self.attribute_ids, attribute)
+        itemId = self._getId("items", "item", self.item_ids, item)
 
         if value is None:
             # delete it
@@ -161,3 +345,59 @@ class AttributeStorageLite(ModuleBase):
                               (itemId, attributeId, value))
             self.log.info("Stored item %s attribute %s value: %s" % (itemId, attributeId, value))
         c.close()
+        self._cacheValue(item, attribute, value)
+
+    def _getId(self, table, column, cache, name):
+        """Return the id of the row in `table` with `column` equal to `name`, creating it if needed"""
+        rowId = cache.get(name)
+        if rowId is not None:
+            return rowId
+        c = self.db.query("SELECT `id` FROM `{}` WHERE `{}`=?;".format(table, column), (name,))
+        row = c.fetchone()
+        if row is None:
+            c.close()
+            c = self.db.query("INSERT INTO `{}` (`{}`) VALUES (?);".format(table, column), (name,))
+            rowId = c.lastrowid
+        else:
+            rowId = row["id"]
+        c.close()
+        cache.put(name, rowId)
+        return rowId
+
+    def _cacheValue(self, item, attribute, value):
+        """Write a value that was just stored through to the caches"""
+        with self.cache_lock:
+            self.generation += 1
+            if value is not None and not isinstance(value, str):
+                # sqlite converts it to text, let the next read fetch whatever that turned out to be
+                self.values.pop((item, attribute))
+                self.items.pop(item)
+                return
+            self.values.put((item, attribute), value)
+            cached = self.items.pop(item)
+            if cached is not None:
+                cached = dict(cached)
+                if value is None:
+                    cached.pop(attribute, None)
+                else:
+                    cached[attribute] = value
+                self.items.put(item, cached)
+
+    def _cacheRead(self, cache, entries, generation):
+        """Cache (key, value) pairs read from the database, unless a value was written through since the read began.
+        Caching them then could replace the newer value with the one read before it was stored.
+
+        :param generation: value of `generation` before the read"""
+        with self.cache_lock:
+            if self.generation == generation:
+                for key, value in entries:
+                    cache.put(key, value)
+
+    def cacheStats(self):
+        """Return hit rate stats of the caches
+
+        :returns: dict -- mapping of cache name to the cache's stats"""
+        return {"values": self.values.stats(),
+                "items": self.items.stats(),
+                "item_ids": self.item_ids.stats(),
+                "attribute_ids": self.attribute_ids.stats()}
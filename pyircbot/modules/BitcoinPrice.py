@@ -22,10 +22,10 @@ class BitcoinPrice(ModuleBase):
 
     @info("btc", "retrieve the current price of bitcoin", cmds=["btc"])
     @command("btc", "bitcoin")
-    def btc(self, msg, cmd):
+    async def btc(self, msg, cmd):
         replyTo = msg.prefix.nick if "#" not in msg.args[0] else msg.args[0]
 
-        data = self.getApi()
+        data = await self.run_in_thread(self.getApi)
         self.bot.act_PRIVMSG(replyTo, "%s: %s" % (
             msg.prefix.nick,
             "\x02\x0307Bitcoin:\x03\x02 \x0307${price:.2f}\x0f - "
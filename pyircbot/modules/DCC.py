@@ -7,14 +7,15 @@
 """
 
 import os
-from pyircbot.modulebase import ModuleBase
+import asyncio
 import socket
-from threading import Thread
+from collections import deque
+from pyircbot.modulebase import ModuleBase, regex
 from random import randint
-from time import sleep
+from time import time
 
 
-BUFFSIZE = 8192
+BUFFSIZE = 65536
 
 
 class TransferFailedException(Exception):
@@ -45,132 +46,284 @@ class DCC(ModuleBase):
     def __init__(self, bot, name):
         super().__init__(bot, name)
         self.services = ["dcc"]
-        self.is_kill = False
-        self.transfers = []
+        self.loop = self.bot.loop
+        self.offers = {}
+        """Offers not yet accepted, by port"""
+        self.transfers = deque(maxlen=self.config.get("history", 50))
+        """Recent transfers, including those in progress"""
+        self.slots = asyncio.Semaphore(self.config.get("max_transfers", 4))
 
-    def offer(self, file_path, port=None):
+    def offer(self, file_path, port=None, timeout=30):
         """
-        Offer a file to another user.
-        - check file size
-        - start listener socket thread on some port
-        - info about the file: tuple of (ip, port, size)
+        Offer a file to another user. A listener socket is opened on the given port, a port from the `port_range`
+        option, or one assigned by the OS. The first connection to it is sent the file, from the event loop. If nobody
+        connects within timeout seconds, the offer is withdrawn.
+
+        :param file_path: path of the file to send
+        :type file_path: str
+        :param port: port to listen on
+        :type port: int
+        :returns: tuple -- (advertised ip as an int, port, file length, :py:class:`Offer`)
         """
-        port_range = self.config.get("port_range", [40000, 60000])  # TODO it would be better to let the system assign
-        port = randint(*port_range)
         bind_addr = self.config.get("bind_host", "0.0.0.0")
         advertise_addr = self.config.get("public_addr", bind_addr)
-        flen = os.path.getsize(file_path)
-        offer = OfferThread(self, file_path, bind_addr, port)  # offers are considered ephemeral. even if this module is
-        # unloaded, initiated transfers may continue. They will not block python from exiting (at which time they *will*
-        # be terminated).
-        offer.start()
-        return (ip2int(advertise_addr), port, flen, offer)
+        listener = self.listen(bind_addr, port)
+        offer = Offer(self, file_path, listener, timeout)
+        self.offers[offer.port] = offer
+        self.transfers.append(offer)
+        # offers are considered ephemeral. even if this module is unloaded, initiated transfers may continue.
+        offer.future = asyncio.run_coroutine_threadsafe(offer.serve(), self.loop)
+        return (ip2int(advertise_addr), offer.port, offer.length, offer)
 
-    def recieve(self, host, port, length):
+    def listen(self, bind_addr, port=None):
+        """
+        Open a listener socket. Without a port, ports in the `port_range` option are tried from a random starting
+        point until one is free. Without that option, the OS picks the port.
         """
-        Receive a file another user has offered. Returns a generator that yields data chunks.
+        if port is not None:
+            ports = [port]
+        elif "port_range" in self.config:
+            low, high = self.config["port_range"]
+            start = randint(low, high)
+            ports = list(range(start, high + 1)) + list(range(low, start))
+        else:
+            ports = [0]
+        for port in ports:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                listener.bind((bind_addr, port))
+            except OSError:
+                listener.close()
+                continue
+            listener.listen(1)
+            listener.setblocking(False)
+            return listener
+        raise TransferFailedException("No free port to listen on")
+
+    @regex(r'^\x01DCC RESUME ("[^"]+"|\S+) (\d+) (\d+)\x01$', allow_private=True)
+    def resume(self, msg, matches):
+        """
+        Handle a receiver asking to resume one of our offers part way through the file. If the offer hasn't been
+        accepted yet, it will start at the requested position.
+        """
+        filename, port, position = matches.groups()
+        offer = self.offers.get(int(port))
+        if offer is None or not offer.resume(int(position)):
+            return
+        self.bot.act_PRIVMSG(msg.prefix.nick, "\x01DCC ACCEPT {} {} {}\x01".format(filename, port, position))
+
+    def recieve(self, host, port, length, offset=0):
+        """
+        Receive a file another user has offered. Returns an iterable that yields data chunks. Iterate it with
+        `async for` on the event loop, or with `for` elsewhere.
+
+        :param offset: position in the file the transfer was resumed at
+        :type offset: int
+        """
+        return RecieveGenerator(host, port, length, offset)
+
+    def stats(self):
+        """
+        Return statistics of recent transfers
+
+        :returns: list -- dicts describing each transfer
         """
-        return RecieveGenerator(host, port, length)
+        return [transfer.stats() for transfer in list(self.transfers)]
+
+    def ondisable(self):
+        for offer in list(self.offers.values()):
+            offer.stopoffer()
 
 
 class RecieveGenerator(object):
-    def __init__(self, host, port, length):
+    """
+    Receives a file into a reusable buffer. Each chunk yielded is a memoryview of the buffer that is only valid until
+    the next chunk is requested, so copy or write it out before then. Acknowledgements of the bytes received are sent
+    back as the dcc protocol expects.
+
+    :param length: total length of the file
+    :type length: int
+    :param offset: position in the file the transfer starts at
+    :type offset: int
+    """
+    def __init__(self, host, port, length, offset=0, buffsize=BUFFSIZE):
         self.host = host
         self.port = port
         self.length = length
+        self.offset = offset
+        self.buffer = memoryview(bytearray(buffsize))
+        self.total = offset
+
+    def received(self, size):
+        """
+        Count a received chunk and return the acknowledgement to send for it
+        """
+        self.total += size
+        return (self.total & 0xFFFFFFFF).to_bytes(4, "big")
+
+    def check(self):
+        if self.total != self.length:
+            raise TransferFailedException("Transfer failed: expected {} bytes but got {}".format(self.length,
+                                                                                                 self.total))
 
     def __iter__(self):
-        self.sock = socket.create_connection((self.host, self.port), timeout=10)
-        total = 0
+        sock = socket.create_connection((self.host, self.port), timeout=10)
         try:
             while True:
-                if total == self.length:
+                size = sock.recv_into(self.buffer)
+                if not size:
+                    break
+                sock.sendall(self.received(size))
+                yield self.buffer[:size]
+                if self.total > self.length:
                     break
-                chunk = self.sock.recv(BUFFSIZE)
-                total += len(chunk)
-                if not chunk:
+            self.check()
+        finally:
+            sock.close()
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, (self.host, self.port)), 10)
+            while True:
+                size = await loop.sock_recv_into(sock, self.buffer)
+                if not size:
                     break
-                yield chunk
-                if total >= self.length:
+                await loop.sock_sendall(sock, self.received(size))
+                yield self.buffer[:size]
+                if self.total > self.length:
                     break
-            print("total", total, "expected", self.length)
-            if total != self.length:
-                raise TransferFailedException("Transfer failed: expected {} bytes but got {}".format(self.length, total))
+            self.check()
         finally:
-            # self.sock.shutdown(socket.SHUT_RDWR)
-            self.sock.close()
+            sock.close()
 
 
-class OfferThread(Thread):
-    def __init__(self, master, path, bind_addr, port, timeout=30):
-        """
-        DCC file transfer offer listener
-        :param master: reference to the parent module
-        :param path: file path to be opened and transferred
-        :param bind_addr: address str to bind the listener socket to
-        :param port: port number int to listen on
-        :param timeout: number of seconds to give up after
-        """
-        super().__init__()
+class Offer(object):
+    """
+    DCC file transfer offer, served from the event loop. Sends the file to the first client that connects, using
+    `sendfile` where the OS supports it.
+
+    :param master: reference to the parent module
+    :param path: file path to be opened and transferred
+    :param listener: listening socket
+    :param timeout: number of seconds to give up after
+    """
+    def __init__(self, master, path, listener, timeout=30):
         self.master = master
         self.path = path
-        self.bind = bind_addr
-        self.port = port
+        self.name = os.path.basename(path)
+        self.length = os.path.getsize(path)
+        self.listener = listener
+        self.port = listener.getsockname()[1]
         self.timeout = timeout
-        self.listener = None
-        self.daemon = True
-        self.bound = False
-        Thread(target=self.abort, daemon=True).start()
+        self.bound = True
+        self.future = None
+        """concurrent.futures.Future of the transfer, done when it ends"""
+
+        self.offset = 0
+        self.state = "offered"
+        self.sent = 0
+        self.acked = 0
+        self.started = None
+        self.finished = None
 
-    def run(self):
+    def resume(self, position):
         """
-        Open a server socket that accepts a single connections. When the first client connects, send the contents of the
-        offered file.
+        Start the transfer at position instead of the beginning of the file, if it hasn't started yet
+
+        :returns: bool -- whether the offer will be resumed
         """
-        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            self.listener.bind((self.bind, self.port))
-            self.listener.listen(1)
-            self.bound = True
-            (clientsocket, address) = self.listener.accept()
-            try:
-                self.send_file(clientsocket)
-            finally:
-                clientsocket.shutdown(socket.SHUT_RDWR)
-                clientsocket.close()
-        finally:
-            # try:
-            #     self.listener.shutdown(socket.SHUT_RDWR)
-            self.listener.close()
-            # except Exception:
-            #     pass
+        if self.state != "offered" or not 0 <= position < self.length:
+            return False
+        self.offset = position
+        return True
 
-    def abort(self):
+    async def serve(self):
         """
-        Expire the offer after a timeout.
+        Wait for the receiver to connect, then send the offered file
         """
-        sleep(self.timeout)
-        self.stopoffer()
+        loop = asyncio.get_running_loop()
+        try:
+            client, address = await asyncio.wait_for(loop.sock_accept(self.listener), self.timeout)
+        except (asyncio.TimeoutError, OSError):
+            self.state = "expired"
+            return
+        except asyncio.CancelledError:
+            self.state = "withdrawn"
+            raise
+        finally:
+            self.close()
+        self.state = "waiting"
+        try:
+            async with self.master.slots:
+                self.state = "sending"
+                self.started = time()
+                await self.send_file(client)
+                await self.wait_acks(client)
+            self.state = "done" if self.acked in (self.length, self.length & 0xFFFFFFFF) else "incomplete"
+        except Exception:
+            self.state = "failed"
+            self.master.log.exception("DCC: transfer of %s failed", self.path)
+        finally:
+            self.finished = time()
+            client.close()
 
-    def send_file(self, socket):
+    async def send_file(self, sock):
         """
         Send the contents of the offered file to the passed socket
-        :param socket: socket object ready for sending
-        :type socket: socket.socket
+
+        :param sock: connected, non-blocking socket
+        :type sock: socket.socket
         """
+        loop = asyncio.get_running_loop()
         with open(self.path, 'rb') as f:
-            while not self.master.is_kill:
-                chunk = f.read(BUFFSIZE)
-                if not chunk:
-                    break
-                socket.send(chunk)
+            self.sent = await loop.sock_sendfile(sock, f, self.offset, (self.length - self.offset) or None)
+        sock.shutdown(socket.SHUT_WR)
+
+    async def wait_acks(self, sock):
+        """
+        Read the receiver's acknowledgements until it has all of the file or hangs up. Closing the socket with unread
+        acknowledgements could reset the connection before the receiver got everything.
+        """
+        loop = asyncio.get_running_loop()
+        pending = b""
+        while self.acked not in (self.length, self.length & 0xFFFFFFFF):
+            try:
+                chunk = await asyncio.wait_for(loop.sock_recv(sock, 4096), self.timeout)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            pending += chunk
+            whole = len(pending) // 4 * 4
+            if whole:
+                self.acked = int.from_bytes(pending[whole - 4:whole], "big")
+                pending = pending[whole:]
 
     def stopoffer(self):
         """
-        Prematurely shut down & cleanup the offer socket
+        Prematurely withdraw the offer if nobody has connected yet. Safe to call from any thread.
         """
-        try:
-            self.listener.shutdown(socket.SHUT_RDWR)
-            self.listener.close()
-        except Exception:   # should only error if already cleaned up
-            pass
+        if self.future is not None and self.state == "offered":
+            self.future.cancel()
+
+    def close(self):
+        self.master.offers.pop(self.port, None)
+        self.listener.close()
+
+    def stats(self):
+        """
+        :returns: dict -- the transfer's state, bytes sent and average rate in bytes per second
+        """
+        elapsed = ((self.finished or time()) - self.started) if self.started else 0
+        return {"name": self.name,
+                "port": self.port,
+                "state": self.state,
+                "length": self.length,
+                "offset": self.offset,
+                "sent": self.sent,
+                "acked": self.acked,
+                "seconds": elapsed,
+                "rate": self.sent / elapsed if elapsed else 0.0}
@@ -7,7 +7,7 @@
 
 """
 
-from pyircbot.modulebase import ModuleBase, hook
+from pyircbot.modulebase import ModuleBase, regex
 from requests import get
 import re
 import time
@@ -15,7 +15,6 @@ import praw  # TODO: enable/disable modules
 import datetime
 from requests import head
 import html.parser
-from threading import Thread
 
 
 class LinkTitler(ModuleBase):
@@ -23,11 +22,10 @@ class LinkTitler(ModuleBase):
         ModuleBase.__init__(self, bot, moduleName)
         self.REQUEST_SIZE_LIMIT = 10 * 1024
 
-    @hook("PRIVMSG")
-    def searches(self, msg, cmd):
-        t = Thread(target=self.doLinkTitle, args=(msg.args, msg.prefix.nick, msg.trailing))
-        t.daemon = True
-        t.start()
+    # only lines that may contain a link start a task
+    @regex(r'https?://|reddit\.com/', r'(?i)youtu\.?be|yooouuutuuube', types=['PRIVMSG'], allow_private=True)
+    async def searches(self, msg, match):
+        await self.run_in_thread(self.doLinkTitle, msg.args, msg.prefix.nick, msg.trailing)
 
     def doLinkTitle(self, args, sender, trailing):
         # Youtube
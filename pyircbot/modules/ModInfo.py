@@ -7,6 +7,7 @@
 
 
 from pyircbot.modulebase import ModuleBase, command
+from collections import namedtuple
 
 
 class info(object):
@@ -42,7 +43,66 @@ class info(object):
         return func
 
 
+HelpEntry = namedtuple("HelpEntry", "modname module cmdspec docstring aliases")
+
+
 class ModInfo(ModuleBase):
+    def __init__(self, bot, moduleName):
+        ModuleBase.__init__(self, bot, moduleName)
+        self.page_size = self.config.get("page_size", 10)
+        self.modules = {}
+        """Module instances the help registry was built from, by name"""
+        self.entries = {}
+        """Help entries of each module, by module name"""
+        self.commands = {}
+        """Prefixed command alias -> help entries"""
+        self.rows = []
+        """Sorted rows of the full help listing"""
+        self.widths = []
+        """Column widths of the full help listing"""
+        self.index = []
+        """All prefixed command aliases"""
+
+    def refresh(self):
+        """
+        Bring the help registry up to date with the loaded modules. Modules loaded since the last call are scanned for
+        help info, and unloaded ones are forgotten.
+        """
+        loaded = self.bot.moduleInstances
+        if len(loaded) == len(self.modules) and all(self.modules.get(name) is module
+                                                    for name, module in loaded.items()):
+            return
+        for name in list(self.entries.keys()):
+            if loaded.get(name) is not self.modules[name]:
+                del self.entries[name]
+        for name, module in loaded.items():
+            if name not in self.entries:
+                self.entries[name] = list(ModInfo.scan(name, module))
+        self.modules = dict(loaded)
+
+        self.commands = {}
+        self.index = []
+        self.rows = []
+        for name in loaded.keys():
+            for entry in self.entries[name]:
+                for alias in entry.aliases:
+                    alias = "{}{}".format(command.prefix, alias)
+                    self.commands.setdefault(alias, []).append(entry)
+                    self.index.append(alias)
+                self.rows.append((name, command.prefix + entry.cmdspec, entry.docstring))
+        self.rows.sort(key=lambda item: item[0] + item[1])
+        self.widths = [max(len(row[col]) for row in self.rows) for col in range(3)] if self.rows else []
+
+    @staticmethod
+    def scan(modname, module):
+        """
+        Yield a HelpEntry for each help info tag on the module's methods
+        """
+        for attr_name in dir(module):
+            attr = getattr(module, attr_name)
+            if callable(attr) and hasattr(attr, "irchelp"):
+                for cmdinfo in attr.irchelp:
+                    yield HelpEntry(modname, module, cmdinfo.cmdspec, cmdinfo.docstring, cmdinfo.aliases)
 
     @info("help [command]", "show the manual for all or [commands]", cmds=["help"])
     @command("help")
@@ -50,31 +110,26 @@ class ModInfo(ModuleBase):
         """
         Get help on a command
         """
-        if cmd.args:
-            for modname, module, cmdspec, docstring, aliases in self.iter_modules():
-                if cmd.args[0] in ["{}{}".format(command.prefix, i) for i in aliases]:
-                    self.bot.act_PRIVMSG(msg.args[0], "RTFM: {}: ({}{}) {}"
-                                         .format(cmd.args[0], command.prefix, cmdspec, docstring))
+        self.refresh()
+        if cmd.args and not cmd.args[0].isdigit():
+            for entry in self.commands.get(cmd.args[0], []):
+                self.bot.act_PRIVMSG(msg.args[0], "RTFM: {}: ({}{}) {}"
+                                     .format(cmd.args[0], command.prefix, entry.cmdspec, entry.docstring))
         else:
-            rows = []
-            for modname, module, cmdspec, docstring, aliases in self.iter_modules():
-                rows.append((modname, command.prefix + cmdspec, docstring))
-            rows.sort(key=lambda item: item[0] + item[1])
-            self.send_columnized(msg.args[0], rows)
-
-    def send_columnized(self, channel, rows):
+            pages = max(1, -(-len(self.rows) // self.page_size))
+            page = min(max(int(cmd.args[0]) if cmd.args else 1, 1), pages)
+            start = (page - 1) * self.page_size
+            self.send_columnized(msg.args[0], self.rows[start:start + self.page_size], self.widths)
+            if pages > 1:
+                self.bot.act_PRIVMSG(msg.args[0], "Page {} of {}. Use {}help <page> for more"
+                                     .format(page, pages, command.prefix))
+
+    def send_columnized(self, channel, rows, widths=None):
         if not rows:
             return
-        widths = []
-        # Find how many col widths we must calculate
-        for _ in rows[0]:
-            widths.append(0)
-        # Find widest value per col
-        for row in rows:
-            for col, value in enumerate(row):
-                vlen = len(value)
-                if vlen > widths[col]:
-                    widths[col] = vlen
+        if widths is None:
+            # Find widest value per col
+            widths = [max(len(row[col]) for row in rows) for col in range(len(rows[0]))]
         # Print each row
         for row in rows:
             message = ""
@@ -89,11 +144,8 @@ class ModInfo(ModuleBase):
         """
         Short index of commands
         """
-        commands = []
-        for modname, module, cmdspec, docstring, aliases in self.iter_modules():
-            commands += ["{}{}".format(command.prefix, i) for i in aliases]
-
-        self.bot.act_PRIVMSG(msg.args[0], "{}: commands: {}".format(msg.prefix.nick, ", ".join(commands)))
+        self.refresh()
+        self.bot.act_PRIVMSG(msg.args[0], "{}: commands: {}".format(msg.prefix.nick, ", ".join(self.index)))
 
     def iter_modules(self):
         """
@@ -102,9 +154,7 @@ class ModInfo(ModuleBase):
 
         (module_name, module_object, command_spec, command_help, command_alias_list)
         """
-        for modname, module in self.bot.moduleInstances.items():
-            for attr_name in dir(module):
-                attr = getattr(module, attr_name)
-                if callable(attr) and hasattr(attr, "irchelp"):
-                    for cmdinfo in attr.irchelp:
-                        yield (modname, module, cmdinfo.cmdspec, cmdinfo.docstring, cmdinfo.aliases)
+        self.refresh()
+        for entries in list(self.entries.values()):
+            for entry in entries:
+                yield tuple(entry)
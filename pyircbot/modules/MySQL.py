@@ -8,36 +8,276 @@
 """
 
 from pyircbot.modulebase import ModuleBase
-import sys
-import pymysql as MySQLdb  # python 3.x
+from contextlib import contextmanager
+from collections import deque
+from threading import Lock, Semaphore
+from time import time
+try:
+    import pymysql as MySQLdb  # python 3.x
+except ImportError:
+    MySQLdb = None
+
+CR_SERVER_GONE_ERROR = 2006
+"""pymysql error code raised when a statement couldn't be sent to the server"""
+CR_SERVER_LOST = 2013
+"""pymysql error code raised when the connection was lost while waiting for the server's response"""
 
 
 class MySQL(ModuleBase):
     def __init__(self, bot, moduleName):
         ModuleBase.__init__(self, bot, moduleName)
         self.services = ["mysql"]
-        self.connection = self.getConnection()
+        if MySQLdb is None:
+            raise Exception("MySQL: the pymysql package is required")
+        self.pool = ConnectionPool(self.config, self.log)
+        self.connection = Connection(self.pool)
 
     def getConnection(self):
-        return Connection(self)
+        return Connection(self.pool)
+
+    def ondisable(self):
+        self.pool.close()
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of connections to the mysql server, each with the database already selected. Connections that have
+    been idle for longer than `idle_timeout` seconds are pinged before being handed out again; others are trusted, and
+    a query that fails because its connection died before the server could run it is retried once on a new connection.
+    """
+    def __init__(self, config, log):
+        self.config = config
+        self.log = log
+        self.size = config.get("pool_size", 4)
+        self.timeout = config.get("pool_timeout", 30)
+        self.idle_timeout = config.get("idle_timeout", 60)
+
+        self.idle = deque()
+        """Connections not in use, as (connection, time released) tuples. The most recently used is on the right"""
+        self.lock = Lock()
+        self.slots = Semaphore(self.size)
+
+        self.connections = 0
+        self.created = 0
+        self.checkouts = 0
+        self.health_checks = 0
+        self.retries = 0
+
+        # Create the database if it doesn't exist yet. Pooled connections select it when they connect
+        self.log.info("MySQL: Connecting to db host at %s" % self.config["host"])
+        connection = self._connect(None)
+        with connection.cursor() as c:
+            c.execute("CREATE DATABASE IF NOT EXISTS `%s`;" % self.config["database"])
+        connection.close()
+        self.log.info("MySQL: Connected.")
+
+    def _connect(self, database):
+        return MySQLdb.connect(host=self.config["host"], user=self.config["username"],
+                               passwd=self.config["password"], database=database, autocommit=True,
+                               cursorclass=MySQLdb.cursors.DictCursor)
+
+    def acquire(self):
+        """Take a connection from the pool, connecting if there are no idle connections. Blocks while `size`
+        connections are in use.
+
+        :returns: a pymysql connection"""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise Exception("MySQL: timed out waiting for a pooled connection")
+        try:
+            connection = None
+            while connection is None:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    candidate, released = self.idle.pop()
+                if time() - released >= self.idle_timeout:
+                    # Idle long enough that the server may have dropped it
+                    with self.lock:
+                        self.health_checks += 1
+                    try:
+                        candidate.ping(reconnect=False)
+                    except Exception:
+                        self.log.info("MySQL: discarding dead idle connection")
+                        self._discard(candidate)
+                        continue
+                connection = candidate
+            if connection is None:
+                connection = self._connect(self.config["database"])
+                with self.lock:
+                    self.connections += 1
+                    self.created += 1
+            with self.lock:
+                self.checkouts += 1
+            return connection
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, connection, broken=False):
+        """Return a connection to the pool
+
+        :param broken: if True, the connection is closed instead of reused"""
+        if broken:
+            self._discard(connection)
+        else:
+            with self.lock:
+                self.idle.append((connection, time()))
+        self.slots.release()
+
+    def _discard(self, connection):
+        with self.lock:
+            self.connections -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def connection_lost(self, error):
+        """Check if an exception means the connection to the server is gone
+
+        :param error: exception raised by pymysql
+        :returns: bool"""
+        if isinstance(error, MySQLdb.err.InterfaceError):
+            return True
+        return isinstance(error, MySQLdb.err.OperationalError) and bool(error.args) and \
+            error.args[0] in (CR_SERVER_GONE_ERROR, CR_SERVER_LOST)
+
+    def can_retry(self, error, started, many=False):
+        """Check if a query that failed can be run again on a new connection. It can if the connection was lost before
+        the server could run any of its statements: either none had been started, or the only one couldn't be sent.
+
+        :param error: exception raised by pymysql
+        :param started: number of statements started on the connection, including the one that failed
+        :type started: int
+        :param many: whether the last statement was started with executemany, which may send several statements
+        :type many: bool
+        :returns: bool"""
+        if not self.connection_lost(error):
+            return False
+        if started == 0:
+            return True
+        # after a 2013 error the statement may have run, only the response was lost
+        return started == 1 and not many and (isinstance(error, MySQLdb.err.InterfaceError) or
+                                              error.args[0] == CR_SERVER_GONE_ERROR)
+
+    def run(self, func):
+        """Call func with a cursor on a pooled connection and return its result. If the connection turns out to be
+        dead before the statement was sent, func is retried once on a new connection.
+
+        :param func: callable taking a cursor"""
+        for attempt in range(2):
+            connection = self.acquire()
+            c = None
+            try:
+                with connection.cursor() as cursor:
+                    c = CountingCursor(cursor)
+                    result = func(c)
+            except Exception as e:
+                self.release(connection, broken=self.connection_lost(e))
+                if attempt or not self.can_retry(e, c.started if c else 0, c.many if c else False):
+                    raise
+                with self.lock:
+                    self.retries += 1
+                self.log.warning("MySQL: connection failed, retrying on a new connection")
+                continue
+            self.release(connection)
+            return result
+
+    def close(self):
+        """Close idle connections. Connections in use are closed when they are released"""
+        with self.lock:
+            idle, self.idle = self.idle, deque()
+        for connection, released in idle:
+            self._discard(connection)
+
+    def stats(self):
+        """Return a dict of pool counters"""
+        return {"connections": self.connections,
+                "idle": len(self.idle),
+                "created": self.created,
+                "checkouts": self.checkouts,
+                "health_checks": self.health_checks,
+                "retries": self.retries}
+
+
+class CountingCursor:
+    """
+    Cursor counting the statements started with it, so a failed query can tell whether any reached the server
+    """
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.started = 0
+        self.many = False
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def execute(self, *args):
+        self.started += 1
+        self.many = False
+        return self.cursor.execute(*args)
+
+    def executemany(self, *args):
+        self.started += 1
+        self.many = True
+        return self.cursor.executemany(*args)
+
+
+class PooledCursor:
+    """
+    Cursor holding a pooled connection until it is closed. Behaves like the underlying pymysql cursor.
+    """
+    def __init__(self, pool, connection):
+        self.pool = pool
+        self.connection = None
+        self.cursor = None
+        try:
+            self.cursor = connection.cursor()
+        except Exception:
+            pool.release(connection, broken=True)
+            raise
+        self.connection = connection
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self, broken=False):
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        try:
+            self.cursor.close()
+        except Exception:
+            broken = True
+        self.pool.release(connection, broken)
+
+    def __del__(self):
+        self.close()
 
 
 class Connection:
-    def __init__(self, master):
-        self.config = master.config
-        self.log = master.log
-        self._connect()
+    """
+    Query interface of the mysql service. Each call runs on a connection from the pool. Cursors returned by
+    :py:meth:`query` and :py:meth:`getCursor` hold their connection until they are closed, so close them promptly.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.log = pool.log
 
     # Check if the table requested exists
     def tableExists(self, tablename):
-        c = self.getCursor()
-        c.execute("SHOW TABLES;")
-        tables = c.fetchall()
-        if len(tables) == 0:
-            return False
-        key = list(tables[0].keys())[0]
+        tables = self.fetchall("SHOW TABLES LIKE %s;", (tablename,))
         for table in tables:
-            if table[key] == tablename:
+            if list(table.values())[0] == tablename:
                 return True
         return False
 
@@ -49,22 +289,79 @@ class Connection:
         :param args: arguments to be escaped into the query
         :type args: tuple
         :returns: cursor -- the sql cursor"""
-        c = self.getCursor()
-        if len(args) == 0:
-            c.execute(queryText)
-        else:
-            c.execute(queryText, args)
-        return c
+        for attempt in range(2):
+            c = self.getCursor()
+            try:
+                if len(args) == 0:
+                    c.execute(queryText)
+                else:
+                    c.execute(queryText, args)
+                return c
+            except Exception as e:
+                c.close(broken=self.pool.connection_lost(e))
+                if attempt or not self.pool.can_retry(e, 1):
+                    raise
+                with self.pool.lock:
+                    self.pool.retries += 1
+                self.log.warning("MySQL: connection failed, retrying on a new connection")
 
-    # Returns a cusor object, after checking for connectivity
+    # Returns a cursor holding a pooled connection
     def getCursor(self):
-        self.ensureConnected()
-        if sys.version_info > (3, 0):
-            c = self.connection.cursor(MySQLdb.cursors.DictCursor)
-        else:
-            c = self.connection.cursor(cursorclass=MySQLdb.cursors.DictCursor)
-        c.execute("USE `%s`;" % self.config["database"])
-        return c
+        return PooledCursor(self.pool, self.pool.acquire())
+
+    def execute(self, queryText, args=()):
+        """Execute a statement and return the number of rows affected and the last inserted id
+
+        :returns: tuple -- (rowcount, lastrowid)"""
+        def execute(c):
+            c.execute(queryText, args or None)
+            return c.rowcount, c.lastrowid
+        return self.pool.run(execute)
+
+    def executemany(self, queryText, seq):
+        """Execute a statement once for each set of arguments in seq. INSERT and REPLACE statements are sent as one
+        multi-row statement.
+
+        :returns: int -- the number of rows affected"""
+        seq = list(seq)
+        if not seq:
+            return 0
+
+        def executemany(c):
+            c.executemany(queryText, seq)
+            return c.rowcount
+        return self.pool.run(executemany)
+
+    def fetchall(self, queryText, args=()):
+        """Execute a query and return all rows
+
+        :returns: list -- rows as dicts"""
+        def fetchall(c):
+            c.execute(queryText, args or None)
+            return c.fetchall()
+        return self.pool.run(fetchall)
+
+    def fetchone(self, queryText, args=()):
+        """Execute a query and return the first row, or None
+
+        :returns: dict -- the row"""
+        def fetchone(c):
+            c.execute(queryText, args or None)
+            return c.fetchone()
+        return self.pool.run(fetchone)
+
+    @contextmanager
+    def transaction(self):
+        """Context manager yielding a cursor whose statements are committed together when the block exits, or rolled
+        back if it raises"""
+        with self.getCursor() as c:
+            c.execute("START TRANSACTION;")
+            try:
+                yield c
+            except BaseException:
+                c.execute("ROLLBACK;")
+                raise
+            c.execute("COMMIT;")
 
     def escape(self, s):
         """Escape a string using the mysql server
@@ -72,43 +369,5 @@ class Connection:
         :param s: the string to escape
         :type s: str
         :returns: str -- the escaped string"""
-        self.ensureConnected()
-        return self.connection.escape_string(s)
-
-    def ensureConnected(self):
-        try:
-            self.connection.ping()
-        except:
-            try:
-                self.connection.close()
-            except:
-                pass
-            del self.connection
-            self._connect()
-
-    def ondisable(self):
-        self.connection.close()
-
-    # Connects to the database server, and selects a database (Or attempts to create it if it doesn't exist yet)
-    def _connect(self):
-        self.log.info("MySQL: Connecting to db host at %s" % self.config["host"])
-        self.connection = MySQLdb.connect(host=self.config["host"], user=self.config["username"],
-                                          passwd=self.config["password"])
-        self.log.info("MySQL: Connected.")
-        self.connection.autocommit(True)
-        c = None
-        if sys.version_info > (3, 0):
-            c = self.connection.cursor(MySQLdb.cursors.DictCursor)
-        else:
-            c = self.connection.cursor(cursorclass=MySQLdb.cursors.DictCursor)
-
-        c.execute("SHOW DATABASES")
-        dblist = c.fetchall()
-        found = False
-        for row in dblist:
-            if row["Database"] == self.config["database"]:
-                found = True
-        if not found:
-            c.execute("CREATE DATABASE `%s`;" % self.config["database"])
-        c.execute("USE `%s`;" % self.config["database"])
-        c.close()
+        with self.getCursor() as c:
+            return c.connection.escape_string(s)
@@ -22,8 +22,8 @@ class NFLLive(ModuleBase):
 
     @info("nfl", "show nfl schedule & score", cmds=["nfl"])
     @command("nfl")
-    def nflitup(self, message, cmd):
-        games = self.getNflGamesCached()
+    async def nflitup(self, message, cmd):
+        games = await self.run_in_thread(self.getNflGamesCached)
         msg = []
 
         liveGames = []
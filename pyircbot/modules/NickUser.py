@@ -25,8 +25,12 @@ class NickUser(ModuleBase):
         return False
 
     def ondisable(self):
-        pass
-        # TODO: log out all users
+        # Log out all users
+        attr = self.bot.getBestModuleForService("attributes")
+        if attr is None:
+            return
+        loggedin = attr.getItemsWithKey("loggedinfrom")
+        attr.setItems([(nick, "loggedinfrom", None) for nick in loggedin])
 
     @hook("PRIVMSG")
     def gotmsg(self, msg, cmd):
@@ -44,16 +44,12 @@ class RandQuote(ModuleBase):
 
     @hook("PRIVMSG")
     def logquote(self, msg, cmd):
-        self.db.query("INSERT INTO `chat` (`date`, `sender`, `message`) VALUES (?, ?, ?)",
-                      (int(datetime.now().timestamp()), msg.prefix.nick, msg.trailing)).close()
+        # Queued for the sqlite writer thread so the event loop doesn't wait on the disk
+        self.db.execute("INSERT INTO `chat` (`date`, `sender`, `message`) VALUES (?, ?, ?)",
+                        (int(datetime.now().timestamp()), msg.prefix.nick, msg.trailing))
         # Trim quotes
-        c = self.db.query("SELECT * FROM `chat` ORDER BY `date` DESC LIMIT %s, 1000000;" % self.config["limit"])
-        while True:
-            row = c.fetchone()
-            if not row:
-                break
-            self.db.query("DELETE FROM `chat` WHERE id=?", (row["id"],)).close()
-        c.close()
+        self.db.execute("DELETE FROM `chat` WHERE `id` NOT IN (SELECT `id` FROM `chat` ORDER BY `date` DESC LIMIT ?)",
+                        (int(self.config["limit"]), ))
 
     def ondisable(self):
         self.db.close()
@@ -8,8 +8,6 @@
 """
 
 from pyircbot.modulebase import ModuleBase, hook
-from time import sleep
-from threading import Thread
 
 
 class Rejoin(ModuleBase):
@@ -24,8 +22,4 @@ class Rejoin(ModuleBase):
     def kicked(self, msg, cmd):
         channel, who = msg.args
         if who == self._services.nick():
-            Thread(target=self.rejoin, args=(self.config.get("delay", 30), channel)).start()
-
-    def rejoin(self, delay, channel):
-        sleep(delay)
-        self.bot.act_JOIN(channel)
+            self.call_later(self.config.get("delay", 30), self.bot.act_JOIN, channel, name="Rejoin.rejoin")
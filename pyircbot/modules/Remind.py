@@ -8,8 +8,9 @@
 
 from pyircbot.modulebase import ModuleBase, command
 from datetime import datetime, timedelta
-from threading import Thread
-from time import sleep
+from threading import Lock
+from time import time
+import heapq
 import re
 import pytz
 from pyircbot.modules.ModInfo import info
@@ -38,24 +39,70 @@ class Remind(ModuleBase):
             ) ;""")
             c.close()
 
-        self.disabled = False
+        self.db.query("CREATE INDEX IF NOT EXISTS `reminders_when` ON `reminders` (`when`);").close()
 
-        # Start monitor thread
-        self.t = Thread(target=self.monitor_thread)
-        self.t.daemon = True
-        self.t.start()
+        self.heap = []
+        """(due timestamp, reminder id) tuples of undelivered reminders"""
+        self.timer = None
+        """Job scheduled for when the first reminder in the heap is due"""
+        self.lock = Lock()
+        """Guards heap and timer"""
 
-    def monitor_thread(self):
-        while True:
-            sleep(self.config["precision"])
-            if self.disabled:
-                break
-            self.monitor()
+        c = self.db.query("SELECT `id`, `when` FROM `reminders` ORDER BY `when`")
+        for row in c.fetchall():
+            self.heap.append((Remind.timestamp(row["when"]), row["id"]))
+        c.close()
+        heapq.heapify(self.heap)
+        with self.lock:
+            self.rearm()
+
+    @staticmethod
+    def timestamp(when):
+        " Convert a `when` value from the database to a unix timestamp "
+        if isinstance(when, str):
+            when = datetime.fromisoformat(when)
+        return when.timestamp()
+
+    def schedule(self, reminderId, when):
+        """Add a reminder that was just stored to the heap. Safe to call from any thread.
+
+        :param reminderId: id of the reminder's row
+        :type reminderId: int
+        :param when: when the reminder is due
+        :type when: datetime.datetime"""
+        with self.lock:
+            heapq.heappush(self.heap, (Remind.timestamp(when), reminderId))
+            if self.heap[0][1] == reminderId:
+                self.rearm()
+
+    def rearm(self):
+        " (Re)schedule the timer for the first reminder due. Call with the lock held. "
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.heap:
+            self.timer = self.call_later(max(0, self.heap[0][0] - time()), self.monitor, name="Remind.monitor")
 
     def monitor(self):
-        remindPeople = self.db.query("SELECT * FROM `reminders` WHERE `when` < ?", (datetime.now(),))
-        reminders = remindPeople.fetchall()
-        remindPeople.close()
+        " Pop reminders that are due from the heap and deliver them on the scheduler's thread pool "
+        now = time()
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                due.append(heapq.heappop(self.heap)[1])
+            self.rearm()
+        if due:
+            self.call_later(0, self.deliver, due, threaded=True)
+
+    def deliver(self, reminderIds):
+        " Send the given reminders and delete them "
+        reminders = []
+        for i in range(0, len(reminderIds), 500):
+            chunk = reminderIds[i:i + 500]
+            c = self.db.query("SELECT * FROM `reminders` WHERE `id` IN ({}) ORDER BY `when`, `id`"
+                              .format(", ".join(["?"] * len(chunk))), chunk)
+            reminders += c.fetchall()
+            c.close()
 
         byrecip = {}
 
@@ -90,9 +137,9 @@ class Remind(ModuleBase):
             for recip in channelpms_bysender:
                 self.sendReminders(channelpms_bysender[recip], channel, recip)
 
-        # Delete now that it's sent
-        for item in reminders:
-            self.db.query("DELETE FROM `reminders` WHERE `id`=?", (item["id"],)).close()
+        # Delete now that they're sent. Wait for it, so a failure is logged by the scheduler
+        self.db.executemany("DELETE FROM `reminders` WHERE `id`=?",
+                            [(reminderId, ) for reminderId in reminderIds]).result()
 
     def sendReminders(self, reminders, target, nick):
         " Send a set of reminders of the same recipient, to them. Collapse down into one message."
@@ -104,7 +151,9 @@ class Remind(ModuleBase):
             self.bot.act_PRIVMSG(target, "%s: Reminder: %s" % (nick, reminder_str))
 
     def ondisable(self):
-        self.disabled = True
+        with self.lock:
+            self.heap = []
+            self.rearm()
 
     @info("remind <time>", "have the bot remind you", cmds=["remind", "at"])
     @command("remind", "at", allow_private=True)
@@ -174,6 +223,7 @@ class Remind(ModuleBase):
             remindAt,
             message
         ))
+        self.schedule(c.lastrowid, remindAt)
         c.close()
 
         diffHours = int(timediff.seconds / 60 / 60)
@@ -226,12 +276,14 @@ class Remind(ModuleBase):
 
         remindAt = datetime.now() + timedelta(seconds=delaySeconds)
 
-        self.db.query("INSERT INTO `reminders` (`sender`, `senderch`, `when`, `message`) VALUES (?, ?, ?, ?)", (
+        c = self.db.query("INSERT INTO `reminders` (`sender`, `senderch`, `when`, `message`) VALUES (?, ?, ?, ?)", (
             msg.prefix.nick,
             msg.args[0] if "#" in msg.args[0] else "",
             remindAt,
             cmd.args_str[len(cmd.args[0]):].strip()
-        )).close()
+        ))
+        self.schedule(c.lastrowid, remindAt)
+        c.close()
 
         hours = int(delaySeconds / 60 / 60)
         minutes = int((delaySeconds - (hours * 60 * 60)) / 60)
@@ -8,31 +8,78 @@
 """
 
 from pyircbot.modulebase import ModuleBase
+from concurrent.futures import Future
+from contextlib import contextmanager, closing
+from collections import namedtuple
+from threading import Thread, Lock, local
+from queue import Queue, Empty
+import asyncio
 import sqlite3
+import weakref
+
+
+WriteResult = namedtuple("WriteResult", "rowcount lastrowid")
 
 
 class SQLite(ModuleBase):
+    pragmas = {"journal_mode": "WAL",
+               "synchronous": "NORMAL",
+               "busy_timeout": 5000}
+    """Default pragmas set on every connection. Override or add to them with the `pragmas` config key"""
+
     def __init__(self, bot, moduleName):
         ModuleBase.__init__(self, bot, moduleName)
         self.services = ["sqlite"]
 
     def opendb(self, dbname):
-        return Connection(self, dbname)
+        return Connection(self, dbname, dict(SQLite.pragmas, **self.config.get("pragmas", {})),
+                          self.config.get("batch_size", 100))
+
+
+class ThreadConnection:
+    """
+    Holds a thread's connection in thread local storage
+    """
+    def __init__(self, connection):
+        self.connection = connection
 
 
 class Connection:
-    def __init__(self, master, dbname):
+    """
+    A sqlite database opened through the sqlite service.
+
+    Each thread that uses the database gets its own connection in autocommit mode, which :py:meth:`query` and
+    :py:meth:`getCursor` run on. In WAL mode, readers don't block each other or the writer.
+
+    Writes may instead be queued with :py:meth:`execute`, :py:meth:`executemany` and :py:meth:`run`. Queued writes are
+    performed by a single writer thread, started when the first write is queued, which groups whatever has been queued
+    into one transaction, and return futures. Their ``a``-prefixed coroutine versions can be awaited from the event
+    loop without blocking it. Queued writes are not visible to :py:meth:`query` until their future is done.
+    """
+    def __init__(self, master, dbname, pragmas=None, batch_size=100):
         self.master = master
         self.log = master.log
         self.dbname = dbname
-        self.connection = None
-        self._connect()
+        self.path = self.master.getFilePath(self.dbname)
+        self.pragmas = pragmas or {}
+        self.batch_size = batch_size
+
+        self.local = local()
+        self.connections = []
+        """Every connection open, so they can be closed"""
+        self.lock = Lock()
+
+        self.writes = Queue()
+        self.writer = None
+        """Thread performing queued writes, once any have been queued"""
+        self.log.info("Sqlite: opening database %s" % self.path)
+        self.connection = self._connect()
 
     # Check if the table requested exists
     def tableExists(self, tablename):
-        c = self.getCursor()
-        c.execute("SELECT * FROM SQLITE_MASTER WHERE `type`='table' AND `name`=?", (tablename,))
-        tables = c.fetchall()
+        with closing(self.getCursor()) as c:
+            c.execute("SELECT * FROM SQLITE_MASTER WHERE `type`='table' AND `name`=?", (tablename,))
+            tables = c.fetchall()
         if len(tables) == 0:
             return False
         return True
@@ -59,23 +106,175 @@ class Connection:
             c.execute(queryText, args)
         return c
 
-    # Returns a cusor object, after checking for connectivity
+    # Returns a cursor on the calling thread's connection
     def getCursor(self):
-        c = self.connection.cursor()
-        return c
+        return self.thread_connection().cursor()
+
+    def thread_connection(self):
+        """Return the calling thread's connection, opening it if needed
+
+        :returns: sqlite3.Connection"""
+        holder = getattr(self.local, "holder", None)
+        if holder is None:
+            holder = self.local.holder = ThreadConnection(self._connect())
+            # the thread's locals are freed when it exits, closing its connection
+            weakref.finalize(holder, self._release, holder.connection)
+        return holder.connection
+
+    def _release(self, connection):
+        with self.lock:
+            if connection not in self.connections:
+                return  # already closed by close()
+            self.connections.remove(connection)
+        connection.close()
+
+    @contextmanager
+    def transaction(self):
+        """Context manager that runs the statements executed on the cursor it yields as one transaction on the calling
+        thread's connection. The transaction is committed when the block exits, or rolled back if it raises."""
+        connection = self.thread_connection()
+        c = connection.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            yield c
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+        else:
+            c.execute("COMMIT")
+        finally:
+            c.close()
+
+    def execute(self, queryText, args=()):
+        """Queue a statement for the writer thread
+
+        :param queryText: the sqlite query
+        :type queryText: str
+        :param args: arguments to be escaped into the query
+        :type args: tuple
+        :returns: concurrent.futures.Future -- resolves to a WriteResult once the statement is committed"""
+        def write(c):
+            c.execute(queryText, args)
+            return WriteResult(c.rowcount, c.lastrowid)
+        return self._queue(write)
+
+    def executemany(self, queryText, seq):
+        """Queue a statement to be run with each set of arguments in seq for the writer thread
+
+        :returns: concurrent.futures.Future -- resolves to a WriteResult once the statements are committed"""
+        def write(c):
+            c.executemany(queryText, seq)
+            return WriteResult(c.rowcount, c.lastrowid)
+        return self._queue(write)
+
+    def run(self, func):
+        """Queue a function for the writer thread. It is called with a cursor, and the statements it executes are
+        committed or rolled back together.
+
+        :param func: callable taking a cursor
+        :returns: concurrent.futures.Future -- resolves to the function's return value once committed"""
+        return self._queue(func)
+
+    async def aquery(self, queryText, args=()):
+        """Execute a query on a thread pool thread and return all rows, without blocking the event loop"""
+        def fetch():
+            with closing(self.query(queryText, args)) as c:
+                return c.fetchall()
+        return await asyncio.get_running_loop().run_in_executor(None, fetch)
+
+    async def aexecute(self, queryText, args=()):
+        """Coroutine version of :py:meth:`execute`"""
+        return await asyncio.wrap_future(self.execute(queryText, args))
+
+    async def aexecutemany(self, queryText, seq):
+        """Coroutine version of :py:meth:`executemany`"""
+        return await asyncio.wrap_future(self.executemany(queryText, seq))
+
+    async def arun(self, func):
+        """Coroutine version of :py:meth:`run`"""
+        return await asyncio.wrap_future(self.run(func))
+
+    def _queue(self, func):
+        future = Future()
+        with self.lock:
+            if self.writer is None:
+                self.writer = Thread(target=self._write_thread, daemon=True)
+                self.writer.start()
+        self.writes.put((func, future))
+        return future
+
+    def _write_thread(self):
+        while True:
+            item = self.writes.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.writes.get_nowait()
+                except Empty:
+                    break
+                if item is None:
+                    self.writes.put(None)  # finish this batch, then stop
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        """Run a batch of queued writes in one transaction. Each runs in a savepoint, so one failing doesn't roll back
+        the others."""
+        results = []
+        with closing(self.connection.cursor()) as c:
+            try:
+                c.execute("BEGIN IMMEDIATE")
+                for func, future in batch:
+                    c.execute("SAVEPOINT queued")
+                    try:
+                        results.append((future, True, func(c)))
+                        c.execute("RELEASE queued")
+                    except Exception as e:
+                        c.execute("ROLLBACK TO queued")
+                        c.execute("RELEASE queued")
+                        # callers often don't check the future
+                        self.log.warning("Sqlite: queued write failed: %s" % e)
+                        results.append((future, False, e))
+                c.execute("COMMIT")
+            except Exception as e:
+                self.log.error("Sqlite: writing batch of %s failed: %s" % (len(batch), e))
+                if self.connection.in_transaction:
+                    self.connection.rollback()
+                results = [(future, False, e) for func, future in batch]
+        for future, success, result in results:
+            if success:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
 
     # Opens the sqlite database / attempts to create it if it doesn't exist yet
     def _connect(self):
-        self.log.info("Sqlite: opening database %s" % self.master.getFilePath(self.dbname))
-        self.connection = sqlite3.connect(self.master.getFilePath(self.dbname), check_same_thread=False)
-        self.connection.row_factory = Connection.dict_factory
-        self.connection.isolation_level = None
-        self.log.info("Sqlite: Connected.")
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.row_factory = Connection.dict_factory
+        connection.isolation_level = None
+        for pragma, value in self.pragmas.items():
+            connection.execute("PRAGMA {}={}".format(pragma, value)).close()
+        with self.lock:
+            self.connections.append(connection)
 
         # Test the connection
-        c = self.connection.cursor()
+        c = connection.cursor()
         derp = c.execute("SELECT * FROM SQLITE_MASTER")  # NOQA
         c.close()
+        return connection
 
     def close(self):
-        self.connection.close()
+        """Finish queued writes and close all connections"""
+        with self.lock:
+            writer, self.writer = self.writer, None
+        if writer is not None and writer.is_alive():
+            self.writes.put(None)
+            writer.join()
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.local = local()
@@ -10,6 +10,7 @@
 from pyircbot.modules.ModInfo import info
 from pyircbot.modulebase import ModuleBase, command, hook
 from contextlib import closing
+from threading import Lock
 import sqlite3
 import time
 
@@ -18,47 +19,89 @@ class Seen(ModuleBase):
     def __init__(self, bot, moduleName):
         ModuleBase.__init__(self, bot, moduleName)
         # if the database doesnt exist, it will be created
-        sql = self.getSql()
-        c = sql.cursor()
-        # check if our table exists
-        c.execute("SELECT * FROM SQLITE_MASTER WHERE `type`='table' AND `name`='seen'")
-        if len(c.fetchall()) == 0:
-            self.log.info("Seen: Creating database")
-            # if no, create it.
-            c.execute("CREATE TABLE `seen` (`nick` VARCHAR(32), `date` INTEGER, PRIMARY KEY(`nick`))")
+        self.sql = self.getSql()
+        """Connection used for all queries. Guarded by sqllock"""
+        self.sqllock = Lock()
+        with closing(self.sql.cursor()) as c:
+            # check if our table exists
+            c.execute("SELECT * FROM SQLITE_MASTER WHERE `type`='table' AND `name`='seen'")
+            if len(c.fetchall()) == 0:
+                self.log.info("Seen: Creating database")
+                # if no, create it.
+                c.execute("CREATE TABLE `seen` (`nick` VARCHAR(32), `date` INTEGER, PRIMARY KEY(`nick`))")
+            self.sql.commit()
+
+        self.seen = {}
+        """Mapping of nick to last seen time of everyone seen since the last flush"""
+        self.pending = {}
+        """Entries of `seen` not yet written to the database"""
+        self.lock = Lock()
+
+        # Writes are batched and flushed in the background
+        self.flusher = self.call_every(self.config.get("flush_interval", 10), self.flush, threaded=True)
 
     @hook("PRIVMSG")
     def recordSeen(self, message, command):
         # using a message to update last seen, also, the .seen query
-        datest = str(time.time() + (int(self.config["add_hours"]) * 60 * 60))
-        sql = self.getSql()
-        with closing(sql.cursor()) as c:
-            # update or add the user's row
-            c.execute("REPLACE INTO `seen` (`nick`, `date`) VALUES (?, ?)", (message.prefix.nick.lower(), datest))
-            # self.log.info("Seen: %s on %s" % (nick.lower(), datest))
-            sql.commit()
+        nick = message.prefix.nick.lower()
+        date = time.time() + (int(self.config["add_hours"]) * 60 * 60)
+        with self.lock:
+            self.seen[nick] = date
+            self.pending[nick] = date
 
     @info("seen <nick>", "print last time user was seen", cmds=["seen"])
     @command("seen", require_args=True)
     def lastSeen(self, message, command):
-        sql = self.getSql()
         searchnic = command.args[0].lower()
-        with closing(sql.cursor()) as c:
-            # query the DB for the user
-            c.execute("SELECT * FROM `seen` WHERE `nick`= ? ", [searchnic])
-            rows = c.fetchall()
+        date = self.seen.get(searchnic)
+        if date is None:
+            with self.sqllock, closing(self.sql.cursor()) as c:
+                # query the DB for the user
+                c.execute("SELECT * FROM `seen` WHERE `nick`= ? ", [searchnic])
+                rows = c.fetchall()
             if len(rows) == 1:
-                self.bot.act_PRIVMSG(message.args[0], "I last saw %s on %s (%s)." %
-                                     (command.args[0], time.strftime("%m/%d/%y at %I:%M %p",
-                                      time.localtime(rows[0]['date'])), self.config["timezone"]))
-            else:
-                self.bot.act_PRIVMSG(message.args[0], "Sorry, I haven't seen %s!" % command.args[0])
+                date = rows[0]['date']
+        if date is not None:
+            self.bot.act_PRIVMSG(message.args[0], "I last saw %s on %s (%s)." %
+                                 (command.args[0], time.strftime("%m/%d/%y at %I:%M %p",
+                                  time.localtime(date)), self.config["timezone"]))
+        else:
+            self.bot.act_PRIVMSG(message.args[0], "Sorry, I haven't seen %s!" % command.args[0])
+
+    def flush(self):
+        """Write pending last seen times to the database in one transaction"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        try:
+            with self.sqllock, closing(self.sql.cursor()) as c:
+                c.executemany("REPLACE INTO `seen` (`nick`, `date`) VALUES (?, ?)", pending.items())
+                self.sql.commit()
+        except Exception:
+            # keep the entries for the next attempt, unless the nick has been seen again since
+            with self.lock:
+                self.pending = dict(pending, **self.pending)
+            raise
+        # flushed entries are answered from the database now, unless the nick has been seen again since
+        with self.lock:
+            for nick, date in pending.items():
+                if self.seen.get(nick) == date:
+                    del self.seen[nick]
+
+    def ondisable(self):
+        self.flusher.cancel()
+        self.flush()
+        with self.sqllock:
+            self.sql.close()
 
     def getSql(self):
         # return a SQL reference to the database
         path = self.getFilePath('database.sql3')
-        sql = sqlite3.connect(path)
+        sql = sqlite3.connect(path, check_same_thread=False)
         sql.row_factory = self.dict_factory
+        sql.execute("PRAGMA journal_mode=WAL")
+        sql.execute("PRAGMA synchronous=NORMAL")
         return sql
 
     def dict_factory(self, cursor, row):
@@ -8,7 +8,15 @@
 """
 
 from pyircbot.modulebase import ModuleBase, hook
-from time import sleep
+from base64 import b64encode
+import re
+
+
+GHOST_REPLY_RE = re.compile(r'\bghost|\b(killed|released|regained|disconnected)\b|\bnot (online|in use)\b|'
+                            r'\bisn.t (online|in use|currently in use)\b|\b(invalid|incorrect) password\b|'
+                            r'\bpassword incorrect\b|\baccess denied\b', re.I)
+"""Services' replies to the ghost command, successful or not. Other notices they send, like the one saying our nick
+is registered, don't match"""
 
 
 class Services(ModuleBase):
@@ -18,19 +26,90 @@ class Services(ModuleBase):
         self.current_nick = None
         self.current_channels = []
         self.do_ghost = False
+        self.regaining = False
+        self.regain_job = None
+        self.authenticated = False
+        """Whether we logged in to our account with SASL during registration"""
+        self.server_caps = {}
+        self.sasl = self.config.get("sasl", {})
         self.services = ["services"]
 
     @hook("_CONNECT")
     def _doConnect(self, msg, cmd):
         """Hook for when the IRC conneciton is opened"""
         self.current_preferred_nick = 0
+        self.current_channels = []
+        self.do_ghost = False
+        self.regaining = False
+        self.authenticated = False
+        self.server_caps = {}
+        if self.sasl.get("enable"):
+            " registration is held until capability negotiation ends "
+            self.bot.act_CAP("LS", "302")
         self.bot.act_NICK(self.config["user"]["nick"][self.current_preferred_nick])
         self.bot.act_USER(self.config["user"]["username"], self.config["user"]["hostname"],
                           self.config["user"]["realname"])
 
+    @hook("CAP")
+    def _cap(self, msg, cmd):
+        """Hook that negotiates the sasl capability"""
+        subcommand = msg.args[1].upper() if len(msg.args) > 1 else None
+        if subcommand == "LS":
+            for cap in (msg.trailing or "").split():
+                name, _, value = cap.partition("=")
+                self.server_caps[name] = value
+            if msg.args[-1] == "*":
+                " more capabilities are listed on the next line "
+                return
+            mechanisms = self.server_caps.get("sasl")
+            if mechanisms is None or (mechanisms and "PLAIN" not in mechanisms.split(",")):
+                self.log.warning("Server doesn't support SASL PLAIN authentication")
+                self.bot.act_CAP("END")
+                return
+            self.bot.act_CAP("REQ", "sasl")
+        elif subcommand == "ACK" and "sasl" in (msg.trailing or "").split():
+            self.bot.act_AUTHENTICATE("PLAIN")
+        elif subcommand == "NAK":
+            self.log.warning("Server refused the sasl capability")
+            self.bot.act_CAP("END")
+
+    @hook("AUTHENTICATE")
+    def _authenticate(self, msg, cmd):
+        """Hook that sends our credentials when the server is ready for them"""
+        if (msg.args[0] if msg.args else msg.trailing) != "+":
+            return
+        account = self.sasl.get("account", self.config["user"]["nick"][0])
+        payload = b64encode("{0}\0{0}\0{1}".format(account, self.config["user"]["password"]).encode("UTF-8")) \
+            .decode("ascii")
+        " sent in 400 byte chunks. an empty chunk, +, ends data that is a multiple of 400 bytes long "
+        for i in range(0, len(payload) + 1, 400):
+            self.bot.act_AUTHENTICATE(payload[i:i + 400] or "+")
+
+    @hook("903", "907")
+    def _sasl_success(self, msg, cmd):
+        """Hook for successful SASL authentication"""
+        self.log.info("Authenticated with SASL")
+        self.authenticated = True
+        self.bot.act_CAP("END")
+
+    @hook("902", "904", "905", "906", "908")
+    def _sasl_failed(self, msg, cmd):
+        """Hook for failed or aborted SASL authentication. Registration continues without it"""
+        if msg.command == "908":
+            " 908 lists the mechanisms the server offers and is followed by 904 "
+            return
+        self.log.error("SASL authentication failed: %s" % msg.trailing)
+        self.bot.act_CAP("END")
+
     @hook("433")
     def _nickTaken(self, msg, cmd):
         """Hook that responds to 433, meaning our nick is taken"""
+        if self.regaining:
+            self.log.warning("Couldn't regain nick %s, staying as %s" % (self.config["user"]["nick"][0],
+                                                                        self.current_nick))
+            self.bot.act_NICK(self.current_nick)
+            self._regained()
+            return
         if self.config["ident"]["ghost"]:
             self.do_ghost = True
         self.current_preferred_nick += 1
@@ -42,14 +121,47 @@ class Services(ModuleBase):
     @hook("001")
     def _initservices(self, msg, cmd):
         """Hook that sets our initial nickname"""
-        if self.do_ghost:
-            self.bot.act_PRIVMSG(self.config["ident"]["ghost_to"], self.config["ident"]["ghost_cmd"] %
-                                 {"nick": self.config["user"]["nick"][0], "password": self.config["user"]["password"]})
-            sleep(2)
-            self.bot.act_NICK(self.config["user"]["nick"][self.current_preferred_nick])
         self.current_nick = self.config["user"]["nick"][self.current_preferred_nick]
+        if self.do_ghost:
+            self._ghost()
+            if not self.authenticated:
+                " nickserv identification is for the nick we're regaining "
+                return
         self._do_initservices()
 
+    def _ghost(self):
+        """Ask services to disconnect whoever is using our nick. We try to take it back when they reply, or after
+        `ident.ghost_timeout` seconds"""
+        self.regaining = True
+        self.bot.act_PRIVMSG(self.config["ident"]["ghost_to"], self.config["ident"]["ghost_cmd"] %
+                             {"nick": self.config["user"]["nick"][0], "password": self.config["user"]["password"]})
+        self.regain_job = self.call_later(self.config["ident"].get("ghost_timeout", 5), self._regain)
+
+    @hook("NOTICE")
+    def _ghost_reply(self, msg, cmd):
+        """Hook for services' reply to the ghost command"""
+        if self.regaining and self.regain_job is not None and \
+                getattr(msg.prefix, "nick", "").lower() == self.config["ident"]["ghost_to"].lower() and \
+                GHOST_REPLY_RE.search(msg.trailing or ""):
+            self._regain()
+
+    def _regain(self):
+        """Change back to our preferred nick. The server's reply finishes regaining it"""
+        if self.regain_job is None:
+            return
+        self.regain_job.cancel()
+        self.regain_job = None
+        self.bot.act_NICK(self.config["user"]["nick"][0])
+
+    def _regained(self):
+        """The nick change after ghosting is done, successful or not"""
+        self.regaining = False
+        if self.regain_job is not None:
+            self.regain_job.cancel()
+            self.regain_job = None
+        if not self.authenticated:
+            self._do_initservices()
+
     @hook("INVITE")
     def _invited(self, msg, cmd):
         """Hook responding to INVITE channel invitations"""
@@ -59,15 +171,15 @@ class Services(ModuleBase):
 
     def _do_initservices(self):
         """Identify with nickserv and join startup channels"""
-        " id to nickserv "
-        if self.config["ident"]["enable"]:
+        " id to nickserv, unless sasl did it already "
+        if self.config["ident"]["enable"] and not self.authenticated:
             self.bot.act_PRIVMSG(self.config["ident"]["to"], self.config["ident"]["command"] %
                                  {"password": self.config["user"]["password"]})
 
         " join plain channels "
-        for channel in self.config["channels"]:
-            self.log.info("Joining %s" % channel)
-            self.bot.act_JOIN(channel)
+        if self.config["channels"]:
+            self.log.info("Joining %s" % ", ".join(self.config["channels"]))
+            self.bot.act_JOIN(self.config["channels"])
 
         " request invite for private message channels "
         for channel in self.config["privatechannels"]["list"]:
@@ -79,6 +191,8 @@ class Services(ModuleBase):
     def _changed_nick(self, msg, cmd):
         if msg.prefix.nick == self.current_nick:
             self.current_nick = msg.trailing
+            if self.regaining and self.current_nick == self.config["user"]["nick"][0]:
+                self._regained()
 
     @hook("JOIN", "PART")
     def _joinpart(self, msg, cmd):
@@ -3,8 +3,8 @@ from pyircbot.modules.ModInfo import info
 from pyircbot.modules.NickUser import protected
 from contextlib import closing
 from decimal import Decimal
-from time import sleep, time
-from queue import Queue, Empty
+from time import time
+from queue import Queue
 from threading import Thread
 from requests import get
 from collections import namedtuple
@@ -138,24 +138,21 @@ class StockPlay(ModuleBase):
 
         self.cache = PriceCache(self)
 
-        # Last time the interval tasks were executed
-        self.task_time = 0
-
         # background work executor thread
         self.asyncq = Queue()
-        self.running = True
 
         self.trader = Thread(target=self.trader_background)
         self.trader.start()
 
-        # quote updater thread
-        self.pricer = Thread(target=self.price_updater)
-        self.pricer.start()
+        # interval tasks run on the trader thread so they don't race trades
+        self.call_every(60, self.asyncq.put, ("tasks", None), name="StockPlay.tasks")
+
+        # quote updater
+        self.call_every(self.config["bginterval"], self.price_updater, threaded=True)
 
     def ondisable(self):
-        self.running = False
+        self.asyncq.put(None)
         self.trader.join()
-        self.pricer.join()
 
     def calc_user_avgbuy(self, nick, symbol):
         """
@@ -187,50 +184,38 @@ class StockPlay(ModuleBase):
         """
         Perform quote cache updating task
         """
-        while self.running:
-            self.log.info("price_updater")
-            try:
-                updatesym = None
-                with closing(self.sql.getCursor()) as c:
-                    row = c.execute("""SELECT * FROM stockplay_prices
-                                        WHERE symbol in (SELECT symbol FROM stockplay_holdings WHERE count>0)
-                                       ORDER BY attempt_time ASC LIMIT 1""").fetchone()
-                    updatesym = row["symbol"] if row else None
-                    c.execute("UPDATE stockplay_prices SET attempt_time=? WHERE symbol=?;", (time(), updatesym))
-
-                if updatesym:
-                    self.cache.get_price(updatesym, 0)
+        self.log.info("price_updater")
+        updatesym = None
+        with closing(self.sql.getCursor()) as c:
+            row = c.execute("""SELECT * FROM stockplay_prices
+                                WHERE symbol in (SELECT symbol FROM stockplay_holdings WHERE count>0)
+                               ORDER BY attempt_time ASC LIMIT 1""").fetchone()
+            updatesym = row["symbol"] if row else None
+            c.execute("UPDATE stockplay_prices SET attempt_time=? WHERE symbol=?;", (time(), updatesym))
 
-            except Exception:
-                traceback.print_exc()
-            delay = self.config["bginterval"]
-            while self.running and delay > 0:
-                delay -= 1
-                sleep(1)
+        if updatesym:
+            self.cache.get_price(updatesym, 0)
 
     def trader_background(self):
         """
         Perform trading, reporting and other background tasks
         """
-        while self.running:
+        while True:
+            queued = self.asyncq.get()
+            if queued is None:
+                return
             try:
-                queued = None
-                try:
-                    queued = self.asyncq.get(block=True, timeout=1)
-                except Empty:
+                action, data = queued
+                if action == "tasks":
                     self.do_tasks()
-                    continue
-                if queued:
-                    action, data = queued
-                    if action == "trade":
-                        self.do_trade(data)
-                    elif action == "portreport":
-                        self.do_report(*data)
-                    elif action == "topten":
-                        self.do_topten(*data)
+                elif action == "trade":
+                    self.do_trade(data)
+                elif action == "portreport":
+                    self.do_report(*data)
+                elif action == "topten":
+                    self.do_topten(*data)
             except Exception:
                 traceback.print_exc()
-                continue
 
     def do_topten(self, nick, replyto):
         """
@@ -433,10 +418,6 @@ class StockPlay(ModuleBase):
         """
         Do interval tasks such as recording nightly balances
         """
-        now = time()
-        if now - 60 < self.task_time:
-            return
-        self.task_time = now
         self.record_nightly_balances()
 
     def checksym(self, s):
@@ -39,10 +39,26 @@ class Tell(ModuleBase):
         self.db.query("DELETE FROM `tells` WHERE `when`<?",
                       (int(mktime(datetime.datetime.now().timetuple())) - self.config["maxage"],)).close()
 
+        # Recipients are stored lowercase. Older versions stored them as typed
+        self.db.query("UPDATE `tells` SET `recip`=lower(`recip`) WHERE `recip`!=lower(`recip`)").close()
+        self.db.query("CREATE INDEX IF NOT EXISTS `tells_recip` ON `tells` (`recip`);").close()
+
+        self.pending = {}
+        """Number of undelivered tells of each recipient. Nicks not in here have nothing waiting for them"""
+        c = self.db.query("SELECT `recip`, COUNT(*) as `cnt` FROM `tells` GROUP BY `recip`")
+        for row in c.fetchall():
+            self.pending[row["recip"]] = row["cnt"]
+        c.close()
+
     @hook("PRIVMSG", "JOIN")
     def showtell(self, msg, cmd):
+        nick = msg.prefix.nick.lower()
+        if nick not in self.pending:
+            return
+        del self.pending[nick]
+
         # Look for tells for this person
-        c = self.db.query("SELECT * FROM `tells` WHERE `recip`=?", (msg.prefix.nick,))
+        c = self.db.query("SELECT * FROM `tells` WHERE `recip`=? ORDER BY `id`", (nick,))
         tells = c.fetchall()
         c.close()
         for tell in tells:
@@ -58,8 +74,14 @@ class Tell(ModuleBase):
                 agostr,
                 tell["message"]
             ))
-            # Delete
-            self.db.query("DELETE FROM `tells` WHERE `id`=?", (tell["id"],))
+        # Delete them all at once
+        deleted = self.db.executemany("DELETE FROM `tells` WHERE `id`=?", [(tell["id"], ) for tell in tells])
+        deleted.add_done_callback(lambda future: self.deleted(future, nick, len(tells)))
+
+    def deleted(self, future, nick, count):
+        " Log delivered tells that couldn't be deleted, as they'll be delivered again when the module is next loaded "
+        if future.exception() is not None:
+            self.log.error("Tell: failed to delete %s delivered tells of %s: %s" % (count, nick, future.exception()))
 
     @info("tell <person> <message>", "relay a message when the target is online", cmds=["tell"])
     @command("tell", allow_private=True)
@@ -69,14 +91,10 @@ class Tell(ModuleBase):
                                  "they're seen. Example: .tell antiroach Do your homework!" % msg.prefix.nick)
             return
 
-        recip = cmd.args[0]
+        recip = cmd.args[0].lower()
         message = ' '.join(cmd.args[1:]).strip()
 
-        c = self.db.query("SELECT COUNT(*) as `cnt` FROM `tells` WHERE `recip`=?;", (recip, ))
-        user_total = c.fetchall()[0]['cnt']
-        c.close()
-
-        if user_total >= self.config.get("max", 3):
+        if self.pending.get(recip, 0) >= self.config.get("max", 3):
             return
 
         self.db.query("INSERT INTO `tells` (`sender`, `channel`, `when`, `recip`, `message`) VALUES "
@@ -85,6 +103,7 @@ class Tell(ModuleBase):
                                            int(mktime(datetime.datetime.now().timetuple())),
                                            recip,
                                            message)).close()
+        self.pending[recip] = self.pending.get(recip, 0) + 1
 
         self.bot.act_PRIVMSG(msg.args[0], "%s: I'll pass that along." % msg.prefix.nick)
 
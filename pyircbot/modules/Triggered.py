@@ -5,8 +5,7 @@
 .. moduleauthor::Dave Pedu <git@davepedu.com>
 """
 
-from threading import Thread
-from time import sleep, time
+from time import time
 from pyircbot.modulebase import ModuleBase, hook
 from random import randrange, choice
 
@@ -33,14 +32,11 @@ class Triggered(ModuleBase):
         if not triggered:
             return
 
-        msg = Thread(target=self.scream, args=(msg.args[0],))
-        msg.daemon = True
-        msg.start()
+        self.scream(msg.args[0])
 
         self.quietuntil = time() + self.config["quiet"]
 
     def scream(self, channel):
         delay = randrange(self.config["mindelay"], self.config["maxdelay"])
         self.log.info("Sleeping for %s seconds" % delay)
-        sleep(delay)
-        self.bot.act_PRIVMSG(channel, choice(self.config["responses"]))
+        self.call_later(delay, self.bot.act_PRIVMSG, channel, choice(self.config["responses"]), name="Triggered.scream")
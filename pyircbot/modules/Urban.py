@@ -16,9 +16,10 @@ class Urban(ModuleBase):
 
     @info("urban <term>", "lookup an urban dictionary definition", cmds=["urban", "u"])
     @command("urban", "u")
-    def urban(self, msg, cmd):
-        definitions = requests.get("http://www.urbandictionary.com/iphone/search/define",
-                                   params={"term": cmd.args_str}).json()["list"]
+    async def urban(self, msg, cmd):
+        response = await self.run_in_thread(requests.get, "http://www.urbandictionary.com/iphone/search/define",
+                                            params={"term": cmd.args_str})
+        definitions = response.json()["list"]
         if len(definitions) == 0:
             self.bot.act_PRIVMSG(msg.args[0], "Urban definition: no results!")
         else:
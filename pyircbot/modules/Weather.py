@@ -34,13 +34,13 @@ class Weather(ModuleBase):
 
     @info("weather [location]", "display the forecast", cmds=["weather", "w"])
     @command("weather", "w")
-    def cmd_weather(self, msg, cmd):
+    async def cmd_weather(self, msg, cmd):
         hasUnit = self.attr.get(msg.prefix.nick, "weather-unit")
         if hasUnit:
             hasUnit = hasUnit.upper()
 
         if len(cmd.args_str) > 0:
-            self.send_weather(msg.args[0], msg.prefix.nick, cmd.args_str, hasUnit)
+            await self.run_in_thread(self.send_weather, msg.args[0], msg.prefix.nick, cmd.args_str, hasUnit)
             return
 
         weatherZip = self.attr.get(msg.prefix.nick, "weather-zip")
@@ -48,11 +48,12 @@ class Weather(ModuleBase):
             self.bot.act_PRIVMSG(msg.args[0], "%s: you must set a location with .setloc" % (msg.prefix.nick,))
             return
 
-        self.bot.act_PRIVMSG(msg.args[0], "%s: %s" % (msg.prefix.nick, self.getWeather(weatherZip, hasUnit)))
+        weather = await self.run_in_thread(self.getWeather, weatherZip, hasUnit)
+        self.bot.act_PRIVMSG(msg.args[0], "%s: %s" % (msg.prefix.nick, weather))
 
     @info("setloc <location>", "set your home location for weather lookups", cmds=["setloc"])
     @command("setloc", allow_private=True)
-    def cmd_setloc(self, msg, cmd):
+    async def cmd_setloc(self, msg, cmd):
         # if not cmd.args:
         #     self.bot.act_PRIVMSG(fromWho, ".setloc: set your location for weather lookup. Example: "
         #                                   ".setloc Rochester, NY")
@@ -60,7 +61,7 @@ class Weather(ModuleBase):
         reply_to = msg.args[0] if msg.args[0].startswith("#") else msg.prefix.nick
         weatherLoc = cmd.args_str
         try:
-            result = self.getWeather(weatherLoc)  # NOQA
+            result = await self.run_in_thread(self.getWeather, weatherLoc)  # NOQA
         except LocationNotSpecificException as lnse:
             self.bot.act_PRIVMSG(reply_to, "'%s': location not specific enough. Did you mean: %s" %
                                  (weatherLoc, self.alternates_to_str(lnse.alternates)))
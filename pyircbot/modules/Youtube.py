@@ -36,22 +36,23 @@ class Youtube(ModuleBase):
 
     @info("yt", "search for youtube videos", cmds=["yt", "youtube"])
     @command("yt", "youtube")
-    def youtube(self, msg, cmd):
-        j = get("https://www.googleapis.com/youtube/v3/search",
-                params={"key": self.config["api_key"],
-                        "part": "snippet",
-                        "type": "video",
-                        "maxResults": "25",
-                        "safeSearch": self.config.get("safe_search", "none"),
-                        "q": cmd.args_str}).json()
+    async def youtube(self, msg, cmd):
+        response = await self.run_in_thread(get, "https://www.googleapis.com/youtube/v3/search",
+                                            params={"key": self.config["api_key"],
+                                                    "part": "snippet",
+                                                    "type": "video",
+                                                    "maxResults": "25",
+                                                    "safeSearch": self.config.get("safe_search", "none"),
+                                                    "q": cmd.args_str})
+        j = response.json()
 
         if 'error' in j or len(j["items"]) == 0:
             self.bot.act_PRIVMSG(msg.args[0], "No results found.")
         else:
             shuffle(j['items'])
             vid_id = j["items"][0]['id']['videoId']
-            self.bot.act_PRIVMSG(msg.args[0], "http://youtu.be/{} :: {}".format(vid_id,
-                                                                                self.get_video_description(vid_id)))
+            description = await self.run_in_thread(self.get_video_description, vid_id)
+            self.bot.act_PRIVMSG(msg.args[0], "http://youtu.be/{} :: {}".format(vid_id, description))
 
     def get_video_description(self, vid_id):
         apidata = get('https://www.googleapis.com/youtube/v3/videos?part=snippet,contentDetails,statistics&id=%s'
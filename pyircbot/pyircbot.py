@@ -11,10 +11,17 @@ import sys
 from pyircbot.rpc import BotRPC
 from pyircbot.irccore import IRCCore
 from pyircbot.common import report
+from pyircbot.modulebase import HookIndex
+from pyircbot.scheduler import Scheduler
 from socket import AF_INET, AF_INET6
+from threading import Thread
 import os.path
 import asyncio
 import traceback
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 
 class ModuleLoader(object):
@@ -25,6 +32,12 @@ class ModuleLoader(object):
         """instances of modules"""
         self.moduleInstances = {}
 
+        """dispatch index of the loaded modules' irc hooks"""
+        self.hookindex = HookIndex()
+
+        """timed jobs of the loaded modules. Set by bots that have an event loop"""
+        self.scheduler = None
+
         self.log = logging.getLogger('ModuleLoader')
 
     def importmodule(self, name):
@@ -84,7 +97,7 @@ class ModuleLoader(object):
         " init the module "
         self.moduleInstances[name] = getattr(self.modules[name], name)(self, name)
         " load hooks "
-        # self.loadModuleHooks(self.moduleInstances[name])
+        self.hookindex.add(self.moduleInstances[name].irchooks)
         self.moduleInstances[name].onenable()
 
     def unloadmodule(self, name):
@@ -95,8 +108,12 @@ class ModuleLoader(object):
         if name in self.moduleInstances:
             " notify the module of disabling "
             self.moduleInstances[name].ondisable()
+            " cancel its scheduled jobs and running tasks "
+            if self.scheduler is not None:
+                self.scheduler.cancel(self.moduleInstances[name])
+            self.moduleInstances[name].cancel_tasks()
             " unload all hooks "
-            # self.unloadModuleHooks(self.moduleInstances[name])
+            self.hookindex.remove(self.moduleInstances[name].irchooks)
             " remove & delete the instance "
             self.moduleInstances.pop(name)
             self.log.info("Module %s unloaded" % name)
@@ -174,12 +191,58 @@ class ModuleLoader(object):
             return m[0]
         return None
 
+    def fire_irchooks(self, msg, nick=None):
+        """
+        Calling point for IRCHook based module hooks. Tests the hooks that may match the message and calls the hooked
+        functions on hits.
+
+        :param msg: the message to dispatch
+        :type msg: pyircbot.irccore.IRCEvent
+        :param nick: the bot's current nick, for highlight-style commands
+        :type nick: str
+        """
+        for hook, validation in self.hookindex.matches(msg, self, nick):
+            if hook.is_async:
+                hook.method.__self__.run_task(hook.method(msg, validation))
+            else:
+                hook.method(msg, validation)
+
 
 class PrimitiveBot(ModuleLoader):
     def __init__(self, botconfig):
         super().__init__()
         self.botconfig = botconfig
 
+        self.loop = None
+        """Event loop running modules' tasks and timed jobs"""
+
+        self.loop_thread = None
+        """Thread running the loop started by start_loop"""
+
+    def start_loop(self):
+        """
+        Run an event loop in a background thread, with a scheduler on it. Bots that don't run an event loop of their
+        own get one this way when their first module is loaded, so modules' timed jobs and async hooks work on them.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = Thread(target=self.loop.run_forever, name="loop", daemon=True)
+        self.loop_thread.start()
+        self.scheduler = Scheduler(self.loop, workers=self.botconfig.get("bot", {}).get("workers", 4))
+
+    def stop_loop(self):
+        """
+        Cancel all timed jobs and stop the loop started by :py:meth:`start_loop`
+        """
+        self.scheduler.stop()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+
+    def loadmodule(self, name):
+        if self.loop is None:
+            self.start_loop()
+        return super().loadmodule(name)
+
     def closeAllModules(self):
         """
         Deport all modules (for shutdown). Modules are unloaded in the opposite order listed in the config.
@@ -230,7 +293,11 @@ class PyIRCBot(PrimitiveBot):
         self.log = logging.getLogger('PyIRCBot')
         """Reference to logger object"""
 
-        self.loop = asyncio.get_event_loop()
+        self.loop = PyIRCBot.new_loop(self.botconfig["bot"].get("loop", "asyncio"))
+        self.loop.set_debug(self.botconfig["bot"].get("debug_loop", False))
+
+        self.scheduler = Scheduler(self.loop, workers=self.botconfig["bot"].get("workers", 4))
+        """Runs modules' timed jobs"""
 
         """Reference to BotRPC thread"""
         if self.botconfig["bot"]["rpcport"] >= 0:
@@ -242,13 +309,36 @@ class PyIRCBot(PrimitiveBot):
         self.irc = IRCCore(servers=self.botconfig["connection"]["servers"],
                            loop=self.loop,
                            rate_limit=True if ratelimit else False,
-                           rate_max=ratelimit["rate_max"],
-                           rate_int=ratelimit["rate_int"])
+                           rate_max=ratelimit.get("rate_max", 5.0),
+                           rate_int=ratelimit.get("rate_int", 1.1),
+                           rate_adaptive=ratelimit.get("adaptive", False))
         if self.botconfig.get("connection").get("force_ipv6", False):
             self.irc.connection_family = AF_INET6
         elif self.botconfig.get("connection").get("force_ipv4", False):
             self.irc.connection_family = AF_INET
         self.irc.bind_addr = self.botconfig.get("connection").get("bind", None)
+        self.irc.stream_limit = int(self.botconfig.get("connection").get("stream_limit", self.irc.stream_limit))
+        self.irc.nodelay = self.botconfig.get("connection").get("nodelay", self.irc.nodelay)
+        self.irc.keepalive = self.botconfig.get("connection").get("keepalive", self.irc.keepalive)
+        inbound = self.botconfig.get("connection").get("inbound", None)
+        if inbound:
+            self.irc.inbound_size = int(inbound.get("max_size", self.irc.inbound_size))
+            self.irc.inbound_overflow = inbound.get("overflow", self.irc.inbound_overflow)
+            if self.irc.inbound_overflow not in ("block", "drop_newest", "drop_oldest"):
+                raise ValueError("Unknown inbound overflow policy: %s" % self.irc.inbound_overflow)
+        reconnect = self.botconfig.get("connection").get("reconnect", None)
+        if reconnect:
+            self.irc.reconnect_delay = float(reconnect.get("delay", self.irc.reconnect_delay))
+            self.irc.reconnect_max = float(reconnect.get("max_delay", self.irc.reconnect_max))
+            self.irc.connect_parallel = int(reconnect.get("parallel", self.irc.connect_parallel))
+        coalesce = self.botconfig.get("connection").get("coalesce", None)
+        if coalesce:
+            self.irc.outputq.coalesce_length = coalesce.get("max_length", 400)
+            self.irc.outputq.coalesce_separator = coalesce.get("separator", " | ")
+        expiry = self.botconfig.get("connection").get("expire", None)
+        if expiry:
+            self.irc.outputq.ttls = {int(priority): float(ttl) for priority, ttl in expiry.get("ttls", {}).items()}
+            self.irc.outputq.expire_policy = expiry.get("policy", "drop")
 
         self.act_PONG = self.irc.act_PONG
         self.act_USER = self.irc.act_USER
@@ -260,6 +350,8 @@ class PyIRCBot(PrimitiveBot):
         self.act_KICK = self.irc.act_KICK
         self.act_QUIT = self.irc.act_QUIT
         self.act_PASS = self.irc.act_PASS
+        self.act_CAP = self.irc.act_CAP
+        self.act_AUTHENTICATE = self.irc.act_AUTHENTICATE
         self.get_nick = self.irc.get_nick
         self.decodePrefix = IRCCore.decodePrefix
 
@@ -269,6 +361,23 @@ class PyIRCBot(PrimitiveBot):
         # Internal usage hook
         self.irc.addHook("_ALL", self._irchook_internal)
 
+    @staticmethod
+    def new_loop(implementation):
+        """Return the event loop to run the bot on
+
+        :param implementation: "asyncio" for the default loop, "uvloop" for uvloop, or "auto" to use uvloop if it is
+                               installed
+        :type implementation: str"""
+        if implementation not in ("asyncio", "uvloop", "auto"):
+            raise ValueError("Unknown event loop: %s" % implementation)
+        if implementation == "uvloop" and uvloop is None:
+            logging.warning("uvloop isn't installed, using the default event loop")
+        if implementation == "asyncio" or uvloop is None:
+            return asyncio.get_event_loop()
+        loop = uvloop.new_event_loop()
+        asyncio.set_event_loop(loop)
+        return loop
+
     def initModules(self):
         """load modules specified in instance config"""
         " append module location to path "
@@ -284,7 +393,6 @@ class PyIRCBot(PrimitiveBot):
     def run(self):
         self.client = asyncio.ensure_future(self.irc.loop(self.loop), loop=self.loop)
         try:
-            self.loop.set_debug(True)
             self.loop.run_until_complete(self.client)
         finally:
             logging.debug("Escaped main loop")
@@ -314,14 +422,9 @@ class PyIRCBot(PrimitiveBot):
 
     def _irchook_internal(self, msg):
         """
-        IRC hook handler. Calling point for IRCHook based module hooks. This method is called when any message is
-        received. It tests all hooks in all modules against the message can calls the hooked function on hits.
+        IRC hook handler. This method is called when any message is received and passes it on to the modules' hooks.
         """
-        for module_name, module in self.moduleInstances.items():
-            for hook in module.irchooks:
-                validation = hook.validator(msg, self)
-                if validation:
-                    hook.method(msg, validation)
+        self.fire_irchooks(msg, self.get_nick())
 
     " Filesystem Methods "
     def getConfigPath(self, moduleName):
@@ -37,6 +37,7 @@ class BotRPC(Thread):
         self.server.register_function(self.reloadModule)
         self.server.register_function(self.redoModule)
         self.server.register_function(self.getLoadedModules)
+        self.server.register_function(self.getStats)
         self.server.register_function(self.pluginCommand)
         self.server.register_function(self.setPluginVar)
         self.server.register_function(self.getPluginVar)
@@ -106,6 +107,13 @@ class BotRPC(Thread):
         self.log.info("RPC: calling getLoadedModules()")
         return list(self.bot.moduleInstances.keys())
 
+    def getStats(self):
+        """Return counters describing the bot's irc connection, and timings of modules' scheduled jobs under `jobs`
+
+        :returns: dict -- {'output_queue': 0, 'lines_written': 52, ..., 'jobs': {'Seen.flush': {'runs': 3, ...}}}"""
+        self.log.info("RPC: calling getStats()")
+        return dict(self.bot.irc.get_stats(), jobs=self.bot.scheduler.stats())
+
     def pluginCommand(self, moduleName, methodName, argList):
         """Run a method of an active module
 
@@ -0,0 +1,277 @@
+"""
+.. module:: Scheduler
+    :synopsis: Timed and repeating jobs run by the bot's event loop
+
+.. moduleauthor:: Dave Pedu <dave@davepedu.com>
+
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import perf_counter, time
+
+
+class Scheduler(object):
+    """
+    Runs jobs at a later time, on an interval, or on a cron-like schedule. Timers are kept by the event loop, so no
+    thread waits for a job to be due. When due, jobs run on the event loop, or on a shared, bounded thread pool if they
+    may block. Coroutine functions are run as tasks.
+
+    Jobs scheduled by modules are given the module as their owner and are cancelled when it is unloaded. The scheduling
+    methods are safe to call from any thread.
+
+    :param loop: the event loop to keep time on
+    :type loop: asyncio.AbstractEventLoop
+    :param workers: size of the thread pool for jobs that run in a thread
+    :type workers: int
+    """
+    def __init__(self, loop, workers=4):
+        self.loop = loop
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scheduler")
+        self.jobs = set()
+        """Jobs that are scheduled or running"""
+        self.log = logging.getLogger('Scheduler')
+
+    def call_later(self, delay, func, *args, owner=None, threaded=False, name=None):
+        """Call func once, after delay seconds
+
+        :param delay: seconds to wait
+        :type delay: float
+        :param func: the function or coroutine function to call, with args
+        :param owner: object the job belongs to, such as a module
+        :param threaded: run func on the thread pool rather than the event loop
+        :type threaded: bool
+        :param name: name of the job in stats. Defaults to the owner and function name
+        :type name: str
+        :returns: Job"""
+        return self._add(Job(self, func, args, owner, threaded, name, OnceSchedule(delay)))
+
+    def call_every(self, interval, func, *args, delay=None, owner=None, threaded=False, name=None):
+        """Call func every interval seconds. A run that is still going when the next is due delays the next instead of
+        overlapping it.
+
+        :param interval: seconds between runs
+        :type interval: float
+        :param delay: seconds until the first run. Defaults to interval
+        :type delay: float
+        :returns: Job"""
+        return self._add(Job(self, func, args, owner, threaded, name,
+                             IntervalSchedule(interval, interval if delay is None else delay)))
+
+    def call_cron(self, spec, func, *args, owner=None, threaded=False, name=None):
+        """Call func whenever the local time matches a cron-like spec, such as ``*/15 * * * *`` or ``@daily``
+
+        :param spec: minute, hour, day of month, month and day of week fields, or a @hourly/@daily/@weekly/@monthly
+                     shortcut
+        :type spec: str
+        :returns: Job"""
+        return self._add(Job(self, func, args, owner, threaded, name, CronSpec(spec)))
+
+    def _add(self, job):
+        self.jobs.add(job)
+        self.loop.call_soon_threadsafe(job.arm)
+        return job
+
+    def cancel(self, owner):
+        """Cancel all jobs belonging to owner. Runs already in progress finish.
+
+        :param owner: the owner passed when the jobs were scheduled"""
+        # the loop adds and removes jobs while this runs in another thread
+        for job in [job for job in list(self.jobs) if job.owner is owner]:
+            job.cancel()
+
+    def stop(self):
+        """Cancel all jobs and shut down the thread pool"""
+        for job in list(self.jobs):
+            job.cancel()
+        self.pool.shutdown(wait=False)
+
+    def stats(self):
+        """Return timing statistics of all scheduled jobs
+
+        :returns: dict -- job name to a dict of statistics"""
+        return {job.name: job.stats() for job in list(self.jobs)}
+
+
+class Job(object):
+    """
+    A scheduled call, as returned by the :py:class:`Scheduler` methods. Cancel it with :py:meth:`cancel`.
+    """
+    def __init__(self, scheduler, func, args, owner, threaded, name, schedule):
+        self.scheduler = scheduler
+        self.func = func
+        self.args = args
+        self.owner = owner
+        self.threaded = threaded
+        self.schedule = schedule
+        if name is None:
+            name = getattr(func, "__name__", repr(func))
+            if owner is not None:
+                name = "%s.%s" % (getattr(owner, "moduleName", owner.__class__.__name__), name)
+        self.name = name
+
+        self.handle = None
+        self.cancelled = False
+        self.due = None
+        """Unix time the job is next due"""
+
+        self.runs = 0
+        self.errors = 0
+        self.last = 0.0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def arm(self):
+        """Set the timer for the next run, or forget the job if it has none. Runs on the event loop."""
+        loop = self.scheduler.loop
+        self.due = None if self.cancelled else self.schedule.next(time())
+        if self.due is None:
+            self.scheduler.jobs.discard(self)
+            return
+        self.handle = loop.call_at(loop.time() + max(0, self.due - time()), self.run)
+
+    def run(self):
+        self.handle = None
+        if self.cancelled:
+            return
+        start = perf_counter()
+        if asyncio.iscoroutinefunction(self.func):
+            task = self.scheduler.loop.create_task(self.func(*self.args))
+            task.add_done_callback(lambda task: self.done(start, None if task.cancelled() else task.exception()))
+        elif self.threaded:
+            future = self.scheduler.pool.submit(self.func, *self.args)
+            future.add_done_callback(lambda future: self.scheduler.loop.call_soon_threadsafe(
+                self.done, start, None if future.cancelled() else future.exception()))
+        else:
+            try:
+                self.func(*self.args)
+                error = None
+            except Exception as e:
+                error = e
+            self.done(start, error)
+
+    def done(self, start, error):
+        self.last = perf_counter() - start
+        self.runs += 1
+        self.total += self.last
+        self.longest = max(self.longest, self.last)
+        if error is not None:
+            self.errors += 1
+            self.scheduler.log.error("Job %s raised an exception" % self.name, exc_info=error)
+        self.arm()
+
+    def cancel(self):
+        """Stop the job from running again. Safe to call from any thread."""
+        self.cancelled = True
+        self.scheduler.jobs.discard(self)
+        handle, self.handle = self.handle, None
+        if handle is not None:
+            self.scheduler.loop.call_soon_threadsafe(handle.cancel)
+
+    def stats(self):
+        return {"runs": self.runs,
+                "errors": self.errors,
+                "last": self.last,
+                "average": self.total / self.runs if self.runs else 0.0,
+                "longest": self.longest,
+                "due": self.due}
+
+
+class OnceSchedule(object):
+    def __init__(self, delay):
+        self.due = time() + delay
+
+    def next(self, now):
+        due, self.due = self.due, None
+        return due
+
+
+class IntervalSchedule(object):
+    def __init__(self, interval, delay):
+        self.interval = interval
+        self.due = time() + delay
+        self.first = True
+
+    def next(self, now):
+        if self.first:
+            self.first = False
+        else:
+            self.due = max(self.due + self.interval, now)
+        return self.due
+
+
+class CronSpec(object):
+    """
+    A cron-like schedule: minute, hour, day of month, month and day of week fields. Each field is ``*``, a number, a
+    range like ``1-5``, a step like ``*/10`` or ``0-30/5``, or a comma separated list of those. Days of the week are
+    0-6 starting on Sunday, and 7 is also Sunday. Like cron, when both day fields are restricted either may match.
+
+    :param spec: the schedule
+    :type spec: str
+    """
+    shortcuts = {"@hourly": "0 * * * *",
+                 "@daily": "0 0 * * *",
+                 "@midnight": "0 0 * * *",
+                 "@weekly": "0 0 * * 0",
+                 "@monthly": "0 0 1 * *"}
+
+    def __init__(self, spec):
+        fields = CronSpec.shortcuts.get(spec.strip(), spec).split()
+        if len(fields) != 5:
+            raise ValueError("Cron spec needs 5 fields: %s" % spec)
+        self.minutes = CronSpec.parse_field(fields[0], 0, 59)
+        self.hours = CronSpec.parse_field(fields[1], 0, 23)
+        self.days = CronSpec.parse_field(fields[2], 1, 31)
+        self.months = CronSpec.parse_field(fields[3], 1, 12)
+        self.weekdays = set(day % 7 for day in CronSpec.parse_field(fields[4], 0, 7))
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+        # fail here rather than when the job is armed, for specs like the 31st of February
+        self.next(time())
+
+    @staticmethod
+    def parse_field(field, low, high):
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step = part.split("/")
+                step = int(step)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(i) for i in part.split("-"))
+            else:
+                start = end = int(part)
+                if step != 1:
+                    end = high
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError("Invalid cron field: %s" % field)
+            values.update(range(start, end + 1, step))
+        return values
+
+    def matches_day(self, when):
+        day = when.day in self.days
+        weekday = (when.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next(self, now):
+        """Return the first matching minute after now, as a unix timestamp"""
+        when = datetime.fromtimestamp(now).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = when + timedelta(days=366 * 5)
+        while when < limit:
+            if when.month not in self.months:
+                when = (when.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self.matches_day(when):
+                when = when.replace(hour=0, minute=0) + timedelta(days=1)
+            elif when.hour not in self.hours:
+                when = when.replace(minute=0) + timedelta(hours=1)
+            elif when.minute not in self.minutes:
+                when += timedelta(minutes=1)
+            else:
+                return when.timestamp()
+        raise ValueError("Cron spec never matches")
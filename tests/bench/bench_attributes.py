@@ -0,0 +1,45 @@
+"""
+Login checks at a high command rate. Each protected command calls NickUser.check, which looks up the sender's
+`loggedinfrom` attribute. Compares the attributes service with its caches disabled - the behavior before caching - and
+enabled, and prints the cache hit rate.
+"""
+from random import Random
+from tests.bench.lib import BenchBot, timed, print_table
+
+
+def make_bot(cache_size, users):
+    bot = BenchBot()
+    bot.botconfig["module_configs"]["AttributeStorageLite"] = {"cache_size": cache_size}
+    bot.loadmodule("SQLite")
+    bot.loadmodule("AttributeStorageLite")
+    bot.loadmodule("NickUser")
+    attr = bot.moduleInstances["AttributeStorageLite"]
+    for num in range(users):
+        attr.setKey("user{}".format(num), "password", "hunter2")
+        attr.setKey("user{}".format(num), "loggedinfrom", "host{}.example.com".format(num))
+    return bot
+
+
+def main(users=500, active=50, checks=20000):
+    rows = []
+    for cache_size in (0, 4096):
+        bot = make_bot(cache_size, users)
+        login = bot.moduleInstances["NickUser"]
+        attr = bot.moduleInstances["AttributeStorageLite"]
+        attr.values.clear()
+        rand = Random(1)
+        # most commands come from the few users active right now
+        senders = [rand.randrange(active) if rand.random() < 0.9 else rand.randrange(users) for _ in range(checks)]
+        senders = iter(senders)
+
+        def check():
+            num = next(senders)
+            login.check("user{}".format(num), "host{}.example.com".format(num))
+
+        per_check = timed(check, checks)
+        rows.append((cache_size, "{:.2f}".format(per_check), "{:.1%}".format(attr.values.stats()["hit_rate"])))
+    print_table(("cache size", "us/check", "hit rate"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Per-line module hook dispatch cost versus the number of loaded modules. Compares a linear scan of every module's
+irchooks - the dispatcher used before the hook index existed - against :py:meth:`PrimitiveBot.fire_irchooks`.
+"""
+from pyircbot.irccore import IRCCore
+from pyircbot.modulebase import ModuleBase, hook, command, regex
+from tests.bench.lib import BenchBot, timed, print_table
+
+
+LINES = [
+    ("PING", [], None, "irc.example.com"),
+    ("JOIN", [], "someone!user@host.example.com", "#chat"),
+    ("MODE", ["#chat", "+o", "someone"], "ChanServ!ChanServ@services.", None),
+    ("PRIVMSG", ["#chat"], "someone!user@host.example.com", "just some idle chatter in the channel"),
+    ("PRIVMSG", ["#chat"], "someone!user@host.example.com", ".cmd3_1 with some args"),
+    ("QUIT", [], "someone!user@host.example.com", "Ping timeout"),
+]
+
+
+def make_module(num):
+    class BenchModule(ModuleBase):
+        @command("cmd{}_1".format(num), "cmd{}_2".format(num))
+        def cmd_one(self, msg, cmd):
+            pass
+
+        @command("cmd{}_3".format(num), require_args=True)
+        def cmd_two(self, msg, cmd):
+            pass
+
+        @hook("JOIN", "PART")
+        def joinpart(self, msg, cmd):
+            pass
+
+        @regex(r'module{}: (\w+)'.format(num))
+        def regexp(self, msg, match):
+            pass
+    return BenchModule
+
+
+def linear_dispatch(bot, msg):
+    for module_name, module in bot.moduleInstances.items():
+        for hook in module.irchooks:
+            validation = hook.validator(msg, bot)
+            if validation:
+                hook.method(msg, validation)
+
+
+def main(counts=(1, 5, 10, 20, 40, 80), iterations=2000):
+    msgs = [IRCCore.packetAsObject(*line) for line in LINES]
+    rows = []
+    for count in counts:
+        bot = BenchBot()
+        for num in range(count):
+            name = "BenchModule{}".format(num)
+            bot.add_module_class(name, make_module(num))
+            bot.loadmodule(name)
+
+        def linear():
+            for msg in msgs:
+                linear_dispatch(bot, msg)
+
+        def indexed():
+            for msg in msgs:
+                bot.fire_irchooks(msg, "benchbot")
+
+        per_line_linear = timed(linear, iterations) / len(msgs)
+        per_line_indexed = timed(indexed, iterations) / len(msgs)
+        rows.append((count, "{:.2f}".format(per_line_linear), "{:.2f}".format(per_line_indexed),
+                     "{:.1f}x".format(per_line_linear / per_line_indexed)))
+    print_table(("modules", "linear us/line", "indexed us/line", "speedup"), rows)
+
+
+if __name__ == "__main__":
+    main()
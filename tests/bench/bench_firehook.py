@@ -0,0 +1,49 @@
+"""
+Throughput of :py:meth:`IRCCore.fire_hook`. Compares introspecting every hook's arguments and building an IRCEvent per
+hook on every call - the behavior before hook calling conventions were determined in addHook - against fire_hook.
+"""
+import asyncio
+from inspect import getfullargspec
+from pyircbot.irccore import IRCCore
+from tests.bench.lib import timed, print_table
+
+
+class Module(object):
+    def __init__(self):
+        self.calls = 0
+
+    def event(self, msg):
+        self.calls += 1
+
+    def legacy(self, args, prefix, trailing):
+        self.calls += 1
+
+
+def old_fire_hook(irc, command, args=None, prefix=None, trailing=None):
+    for hook, legacy in irc.hookcalls["_ALL"] + irc.hookcalls[command]:
+        if len(getfullargspec(hook).args) == 2:
+            hook(IRCCore.packetAsObject(command, args, prefix, trailing))
+        else:
+            hook(args, prefix, trailing)
+
+
+def main(counts=(1, 5, 20, 50), iterations=5000):
+    loop = asyncio.new_event_loop()
+    rows = []
+    for count in counts:
+        irc = IRCCore([["localhost", 6667]], loop)
+        for _ in range(count):
+            module = Module()
+            irc.addHook("PRIVMSG", module.event)
+            irc.addHook("_ALL", module.event)
+            irc.addHook("PRIVMSG", module.legacy)
+        line = dict(args=["#chat"], prefix="someone!user@host.example.com", trailing="hello world")
+        before = 1000000 / timed(lambda: old_fire_hook(irc, "PRIVMSG", **line), iterations)
+        after = 1000000 / timed(lambda: irc.fire_hook("PRIVMSG", **line), iterations)
+        rows.append((count * 3, "{:.0f}".format(before), "{:.0f}".format(after), "{:.1f}x".format(after / before)))
+    print_table(("hooks", "before lines/s", "after lines/s", "speedup"), rows)
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
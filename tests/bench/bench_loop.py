@@ -0,0 +1,87 @@
+"""
+Throughput of the bot's read loop under each event loop configuration: asyncio in debug mode - which the bot always
+used to run in - asyncio without it, and uvloop if it's installed. A local server sends a burst of PRIVMSGs, which
+:py:meth:`IRCCore.loop` reads, parses and passes to a hook. Hooks are either plain functions, or start a task per line
+like ``async def`` module hooks do.
+"""
+import asyncio
+import logging
+from time import perf_counter
+from pyircbot.irccore import IRCCore
+from tests.bench.lib import print_table
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+async def dispatch(lines, use_tasks):
+    """
+    Return how many lines per second the read loop dispatched
+    """
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    served = loop.create_future()
+    payload = b"".join(b":someone!user@host.example.com PRIVMSG #chat :hello world %d\r\n" % i for i in range(lines))
+
+    async def serve(reader, writer):
+        writer.write(payload)
+        await writer.drain()
+        await done
+        writer.close()
+        served.set_result(None)
+
+    server = await asyncio.start_server(serve, "127.0.0.1", 0)
+    irc = IRCCore([["127.0.0.1", server.sockets[0].getsockname()[1]]], loop)
+    irc.log.disabled = True
+    count = 0
+
+    def counted():
+        nonlocal count
+        count += 1
+        if count == lines:
+            done.set_result(perf_counter())
+
+    async def task():
+        counted()
+
+    irc.addHook("PRIVMSG", (lambda msg: loop.create_task(task())) if use_tasks else (lambda msg: counted()))
+    start = perf_counter()
+    asyncio.ensure_future(irc.loop(loop))
+    end = await done
+    await served
+    irc.alive = False
+    server.close()
+    await cancel_all()
+    return lines / (end - start)
+
+
+async def cancel_all():
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main(lines=50000):
+    logging.getLogger("asyncio").setLevel(logging.ERROR)  # debug mode's slow callback warnings
+    configs = [("asyncio, debug", asyncio.new_event_loop, True),
+               ("asyncio", asyncio.new_event_loop, False)]
+    if uvloop is not None:
+        configs.append(("uvloop", uvloop.new_event_loop, False))
+    rows = []
+    for name, new_loop, debug in configs:
+        results = []
+        for use_tasks in (False, True):
+            loop = new_loop()
+            loop.set_debug(debug)
+            results.append(loop.run_until_complete(dispatch(lines, use_tasks)))
+            loop.close()
+        rows.append([name] + ["{:.0f}".format(result) for result in results])
+    if uvloop is None:
+        rows.append(("uvloop", "not installed", "not installed"))
+    print_table(("loop", "hooks lines/s", "tasks lines/s"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Throughput of the irc line parser. Compares decoding each line and parsing it with :py:func:`parse_irc_line` - what
+IRCCore did before - against :py:func:`parse_irc_bytes`, over a corpus modeled on a busy network's traffic.
+
+A corpus file of raw lines, as logged with --debug or by a bouncer, can be passed as the first argument instead.
+"""
+import sys
+import random
+from pyircbot.common import parse_irc_line, parse_irc_bytes
+from tests.bench.lib import timed, print_table
+
+
+TEMPLATES = [
+    (40, ":{nick}!~{user}@{host} PRIVMSG #{chan} :{text}"),
+    (8, "@time=2019-02-10T17:03:{sec:02}.{ms:03}Z;account={user} :{nick}!~{user}@{host} PRIVMSG #{chan} :{text}"),
+    (6, ":{nick}!~{user}@{host} JOIN #{chan}"),
+    (6, ":{nick}!~{user}@{host} PART #{chan} :{text}"),
+    (8, ":{nick}!~{user}@{host} QUIT :Ping timeout: 252 seconds"),
+    (3, ":{nick}!~{user}@{host} MODE #{chan} +o {nick}"),
+    (3, ":{nick}!~{user}@{host} NICK :{nick}_"),
+    (3, ":{nick}!~{user}@{host} NOTICE #{chan} :{text}"),
+    (2, "PING :irc.example.net"),
+    (4, ":irc.example.net 353 benchbot = #{chan} :{names}"),
+    (1, ":irc.example.net 005 benchbot CHANTYPES=# EXCEPTS INVEX CHANMODES=eIbq,k,flj,CFLMPQScgimnprstz "
+        "CHANLIMIT=#:120 PREFIX=(ov)@+ MAXLIST=bqeI:100 MODES=4 NETWORK=example KNOCK STATUSMSG=@+ CALLERID=g "
+        ":are supported"),
+    (2, ":{nick}!~{user}@{host} PRIVMSG #{chan} :\x01ACTION {text}\x01"),
+    (1, ":{nick}!~{user}@{host} PRIVMSG #{chan} :caf\xe9 na\xefve r\xe9sum\xe9 ☃ {text}"),
+]
+
+WORDS = "the quick brown fox jumps over lazy dog build broken again lol anyone seen game last night coffee".split()
+
+
+def make_corpus(size=20000, seed=1):
+    rand = random.Random(seed)
+    weighted = [template for weight, template in TEMPLATES for _ in range(weight)]
+    corpus = []
+    for _ in range(size):
+        nick = rand.choice(["alice", "bob", "carol", "dave", "eve", "mallory"]) + str(rand.randint(0, 99))
+        values = dict(nick=nick, user=nick[:8], host="{}.dsl.example.com".format(rand.randint(1, 999999)),
+                      chan=rand.choice(["python", "linux", "offtopic"]), sec=rand.randint(0, 59),
+                      ms=rand.randint(0, 999), text=" ".join(rand.choice(WORDS) for _ in range(rand.randint(1, 20))),
+                      names=" ".join("@+"[rand.randint(0, 1)] + rand.choice(WORDS) + str(i) for i in range(60)))
+        corpus.append((rand.choice(weighted).format(**values) + "\r\n").encode("UTF-8"))
+    return corpus
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            corpus = [line for line in f if line.strip()]
+    else:
+        corpus = make_corpus()
+
+    def before():
+        for data in corpus:
+            parse_irc_line(data.decode("UTF-8"))
+
+    def after():
+        for data in corpus:
+            parse_irc_bytes(data).astuple()
+
+    def after_lazy():
+        for data in corpus:
+            parse_irc_bytes(data).command
+
+    rows = []
+    for name, func in (("decode + parse_irc_line", before), ("parse_irc_bytes, all fields", after),
+                       ("parse_irc_bytes, command only", after_lazy)):
+        rows.append((name, "{:.0f}".format(1000000 / (timed(func, 5) / len(corpus)))))
+    print("{} lines".format(len(corpus)))
+    print_table(("parser", "lines/s"), rows)
+
+
+if __name__ == "__main__":
+    main()
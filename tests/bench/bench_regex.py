@@ -0,0 +1,69 @@
+"""
+Throughput of @regex hook dispatch with many regex hooks loaded. Compares validating every hook's expressions against
+every message - the dispatcher used before regex hooks were merged - against :py:meth:`PrimitiveBot.fire_irchooks`.
+"""
+from pyircbot.irccore import IRCCore
+from pyircbot.modulebase import ModuleBase, regex
+from tests.bench.lib import BenchBot, timed, print_table
+
+
+CHATTER = [
+    "did anyone see the game last night",
+    "lol",
+    "I think the build is broken again, can someone look at the CI logs?",
+    "brb getting coffee",
+    "https://example.com/some/article is pretty interesting",
+    "F",
+]
+
+
+def make_module(num):
+    class BenchModule(ModuleBase):
+        @regex(r'^\.trigger{}(?:\s+(.+))?$'.format(num))
+        def trigger(self, msg, match):
+            pass
+
+        @regex(r'\bkeyword{}\b'.format(num), r'(?:^|\s)#{}(\d+)'.format(num))
+        def keyword(self, msg, match):
+            pass
+
+        @regex(r'^(\d+)\s*[-+*/]\s*(\d{%s,})$' % (num + 1))
+        def noliteral(self, msg, match):
+            pass
+    return BenchModule
+
+
+def linear_dispatch(bot, msg):
+    for module_name, module in bot.moduleInstances.items():
+        for hook in module.irchooks:
+            validation = hook.validator(msg, bot)
+            if validation:
+                hook.method(msg, validation)
+
+
+def main(counts=(1, 10, 40, 100, 200), iterations=500):
+    msgs = [IRCCore.packetAsObject("PRIVMSG", ["#chat"], "someone!user@host.example.com", line) for line in CHATTER]
+    rows = []
+    for count in counts:
+        bot = BenchBot()
+        for num in range(count):
+            name = "BenchModule{}".format(num)
+            bot.add_module_class(name, make_module(num))
+            bot.loadmodule(name)
+
+        def linear():
+            for msg in msgs:
+                linear_dispatch(bot, msg)
+
+        def merged():
+            for msg in msgs:
+                bot.fire_irchooks(msg, "benchbot")
+
+        before = 1000000 / (timed(linear, iterations) / len(msgs))
+        after = 1000000 / (timed(merged, iterations) / len(msgs))
+        rows.append((count * 4, "{:.0f}".format(before), "{:.0f}".format(after), "{:.1f}x".format(after / before)))
+    print_table(("expressions", "before msgs/s", "after msgs/s", "speedup"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Replays a busy channel's PRIVMSG log through the Seen module. Compares writing each message to SQLite as it arrives -
+how Seen worked before write-behind batching - against Seen recording in memory and flushing in batches.
+"""
+import sqlite3
+from contextlib import closing
+from random import Random
+from time import perf_counter, time
+from pyircbot.irccore import IRCCore
+from tests.bench.lib import BenchBot, print_table
+
+
+def make_log(count, nicks=200, seed=1):
+    """
+    Return a list of PRIVMSG events from a few chatty nicks
+    """
+    rand = Random(seed)
+    names = ["nick{}".format(i) for i in range(nicks)]
+    return [IRCCore.packetAsObject("PRIVMSG", ["#chat"], "{0}!{0}@host.example.com".format(rand.choice(names)),
+                                   "chatter number {}".format(i)) for i in range(count)]
+
+
+def legacy_record(path, msg):
+    sql = sqlite3.connect(path)
+    with closing(sql.cursor()) as c:
+        c.execute("REPLACE INTO `seen` (`nick`, `date`) VALUES (?, ?)", (msg.prefix.nick.lower(), str(time())))
+        sql.commit()
+
+
+def main(counts=(1000, 5000)):
+    rows = []
+    for count in counts:
+        log = make_log(count)
+        bot = BenchBot()
+        bot.botconfig["module_configs"]["Seen"] = {"timezone": "UTC", "add_hours": 0, "flush_interval": 1}
+        bot.loadmodule("Seen")
+        path = bot.moduleInstances["Seen"].getFilePath('database.sql3')
+
+        start = perf_counter()
+        for msg in log:
+            legacy_record(path, msg)
+        legacy = (perf_counter() - start) / count * 1000000
+
+        start = perf_counter()
+        for msg in log:
+            bot.fire_irchooks(msg, "benchbot")
+        bot.unloadmodule("Seen")  # includes the final flush
+        batched = (perf_counter() - start) / count * 1000000
+
+        rows.append((count, "{:.1f}".format(legacy), "{:.2f}".format(batched), "{:.0f}x".format(legacy / batched)))
+    print_table(("messages", "per-message commit us/msg", "write-behind us/msg", "speedup"), rows)
+
+
+if __name__ == "__main__":
+    main()
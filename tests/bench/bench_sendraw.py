@@ -0,0 +1,74 @@
+"""
+Throughput of :py:meth:`IRCCore.sendRaw` called from several threads at once. Compares waking the event loop for every
+line - the behavior before lines were handed off through a deque - against sendRaw. Lines are counted once the loop has
+written them to a socket that discards them.
+"""
+import asyncio
+from threading import Thread
+from time import perf_counter, sleep
+from pyircbot.irccore import IRCCore
+from tests.bench.lib import print_table
+
+
+class NullWriter(object):
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+
+class OldIRCCore(IRCCore):
+    def sendRaw(self, data, priority=None, ttl=None):
+        if priority is None:
+            self.outseq += 1
+            priority = self.outseq
+        self._loop.call_soon_threadsafe(self.outputq.put, priority, data, ttl)
+
+
+def lines_per_second(cls, loop, threads, lines, cores):
+    irc = cls([["localhost", 6667]], loop)
+    cores.append(irc)  # keeps its output task from being garbage collected until it's cancelled
+    irc.rate_limit = False
+    irc.writer = NullWriter()
+    irc.log.disabled = True
+    total = threads * lines
+
+    def send():
+        for i in range(lines):
+            irc.sendRaw("PRIVMSG #chat :line {}".format(i), 3)
+
+    workers = [Thread(target=send) for _ in range(threads)]
+    start = perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    while irc.lines_written < total:
+        sleep(0.0005)
+    return total / (perf_counter() - start)
+
+
+def main(threads=(1, 2, 4, 8), lines=20000):
+    loop = asyncio.new_event_loop()
+    Thread(target=loop.run_forever, daemon=True).start()
+    rows = []
+    cores = []
+    for count in threads:
+        before = lines_per_second(OldIRCCore, loop, count, lines, cores)
+        after = lines_per_second(IRCCore, loop, count, lines, cores)
+        rows.append((count, "{:.0f}".format(before), "{:.0f}".format(after), "{:.1f}x".format(after / before)))
+    print_table(("threads", "before lines/s", "after lines/s", "speedup"), rows)
+    asyncio.run_coroutine_threadsafe(cancel_all(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+
+async def cancel_all():
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    main()
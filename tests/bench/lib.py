@@ -0,0 +1,55 @@
+"""
+Helpers shared by the benchmark scripts. Benchmarks are not collected by py.test; run them from the repository root
+like:
+
+    python3 -m tests.bench.bench_dispatch
+"""
+import os
+import sys
+from tempfile import mkdtemp
+from time import perf_counter
+from types import SimpleNamespace
+from pyircbot.pyircbot import PrimitiveBot
+
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../pyircbot/modules/"))
+
+
+class BenchBot(PrimitiveBot):
+    """
+    Minimal bot that modules can be loaded into. Sent messages are counted and discarded.
+    """
+    def __init__(self, config=None):
+        datadir = mkdtemp()
+        os.mkdir(os.path.join(datadir, "data"))
+        super().__init__(config or {"bot": {"datadir": datadir}, "module_configs": {}})
+        self.sent = 0
+        self.start_loop()
+
+    def act_PRIVMSG(self, towho, message, priority=None):
+        self.sent += 1
+
+    def get_nick(self):
+        return "benchbot"
+
+    def add_module_class(self, name, cls):
+        """
+        Make a module class defined in a benchmark loadable with :py:meth:`loadmodule`
+        """
+        self.modules[name] = SimpleNamespace(**{name: cls})
+
+
+def timed(func, count):
+    """
+    Call func count times and return the average time per call in microseconds
+    """
+    start = perf_counter()
+    for _ in range(count):
+        func()
+    return (perf_counter() - start) / count * 1000000
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(row[col])) for row in [headers] + rows) for col in range(len(headers))]
+    for row in [headers] + rows:
+        print("  ".join(str(value).rjust(widths[col]) for col, value in enumerate(row)))
@@ -1,5 +1,6 @@
 import os
 import sys
+import asyncio
 import pytest
 from threading import Thread
 from random import randint
@@ -7,6 +8,7 @@ from pyircbot import PyIRCBot
 from pyircbot.pyircbot import PrimitiveBot
 from pyircbot.irccore import IRCEvent, UserPrefix, IRCCore
 from unittest.mock import MagicMock
+from concurrent.futures import wait
 from tests.miniircd import Server as MiniIrcServer
 
 
@@ -22,6 +24,7 @@ class FakeBaseBot(PrimitiveBot):
         super().__init__(config)
         self.act_PRIVMSG = MagicMock()
         self._modules = []
+        self.start_loop()
 
     def feed_line(self, trailing, cmd="PRIVMSG", args=["#test"], sender=("chatter", "root", "cia.gov")):
         """
@@ -32,11 +35,9 @@ class FakeBaseBot(PrimitiveBot):
                                      f"{sender[0]}!{sender[1]}@{sender[2]}",   # hack
                                      trailing)
 
-        for module_name, module in self.moduleInstances.items():# TODO dedupe this block across the various base classes
-            for hook in module.irchooks:
-                validation = hook.validator(msg, self)
-                if validation:
-                    hook.method(msg, validation)
+        self.fire_irchooks(msg, self.get_nick())
+        # let async hooks finish before the caller checks what they did
+        wait([future for module in self.moduleInstances.values() for future in module.tasks], timeout=5)
 
     def closeAllModules(self):
         for modname in self._modules:
@@ -62,6 +63,7 @@ def fakebot(tmpdir):
                        "module_configs": {}})
     yield bot
     bot.closeAllModules()
+    bot.stop_loop()
 
 
 @pytest.fixture
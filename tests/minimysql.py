@@ -0,0 +1,134 @@
+"""
+Stand-in for the parts of the pymysql package used by the mysql service, backed by a sqlite file so the service and
+modules using it can be tested without a mysql server. The `host` passed to :py:func:`connect` is the sqlite file's
+path. Queries are translated from the few mysql-isms pyircbot uses; anything else is passed through as is.
+"""
+import re
+import sqlite3
+from types import SimpleNamespace
+
+
+class OperationalError(Exception):
+    pass
+
+
+class InterfaceError(Exception):
+    pass
+
+
+err = SimpleNamespace(OperationalError=OperationalError, InterfaceError=InterfaceError)
+cursors = SimpleNamespace(DictCursor=object())
+
+TRANSLATIONS = [
+    (re.compile(r"^\s*START TRANSACTION\s*;?\s*$", re.I), "BEGIN;"),
+    (re.compile(r"^\s*SHOW TABLES LIKE %s\s*;?\s*$", re.I),
+     "SELECT `name` AS `Tables_in_db` FROM `sqlite_master` WHERE `type`='table' AND `name` LIKE %s;"),
+    (re.compile(r"^\s*SHOW INDEX FROM `(\w+)` WHERE `Key_name`=%s\s*;?\s*$", re.I),
+     r"SELECT `name` AS `Key_name` FROM `sqlite_master` WHERE `type`='index' AND `tbl_name`='\1' AND `name`=%s;"),
+    (re.compile(r"int\(\d+\) NOT NULL AUTO_INCREMENT", re.I), "INTEGER NOT NULL"),
+    (re.compile(r"int\(\d+\)", re.I), "INTEGER"),
+    (re.compile(r"UNIQUE KEY `\w+` \(", re.I), "UNIQUE ("),
+    (re.compile(r"\s*(ENGINE|DEFAULT CHARSET)=\w+", re.I), ""),
+    (re.compile(r"CHARACTER SET \w+ ", re.I), ""),
+    (re.compile(r"(`\w+`)\(\d+\)"), r"\1"),
+    (re.compile(r"%s"), "?"),
+]
+
+
+def translate(query):
+    for pattern, replacement in TRANSLATIONS:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+def connect(host, user=None, passwd=None, database=None, autocommit=True, cursorclass=None):
+    return Connection(host)
+
+
+class Connection:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.alive = True
+        self.losing = False
+        self.queries = 0
+
+    def kill(self):
+        """Act as if the server dropped the connection"""
+        self.alive = False
+
+    def lose(self):
+        """Act as if the server drops the connection while running the next statement, after it has taken effect"""
+        self.losing = True
+
+    def lost(self):
+        if self.losing:
+            self.alive = False
+            raise OperationalError(2013, "Lost connection to MySQL server during query")
+
+    def check(self):
+        if not self.alive:
+            raise OperationalError(2006, "MySQL server has gone away")
+
+    def ping(self, reconnect=False):
+        self.check()
+
+    def cursor(self):
+        self.check()
+        return Cursor(self)
+
+    def escape_string(self, s):
+        return s.replace("\\", "\\\\").replace("'", "\\'").replace('"', '\\"')
+
+    def close(self):
+        if self.db is None:
+            raise InterfaceError(0, "Already closed")
+        self.db.close()
+        self.db = None
+
+
+class Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def execute(self, query, args=None):
+        self.connection.check()
+        self.connection.queries += 1
+        if query.upper().startswith("CREATE DATABASE"):
+            return 0
+        c = self.connection.db.execute(translate(query), args or ())
+        self.rows = [dict(row) for row in c.fetchall()]
+        self.rowcount = c.rowcount
+        self.lastrowid = c.lastrowid
+        self.connection.lost()
+        return self.rowcount
+
+    def executemany(self, query, args):
+        self.connection.check()
+        self.connection.queries += 1
+        c = self.connection.db.executemany(translate(query), args)
+        self.rowcount = c.rowcount
+        self.connection.lost()
+        return self.rowcount
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        self.rows = []
@@ -0,0 +1,110 @@
+import pytest
+from contextlib import closing
+from threading import Thread
+from tests.lib import *  # NOQA - fixtures
+
+
+@pytest.fixture
+def attrbot(fakebot):
+    """
+    Provide a bot loaded with the AttributeStorageLite module, with an empty database
+    """
+    fakebot.loadmodule("SQLite")
+    with closing(fakebot.moduleInstances["SQLite"].opendb("attributes.db")) as db:
+        for table in ["attribute", "items", "values"]:
+            db.query("DROP TABLE IF EXISTS `{}`;".format(table)).close()
+    fakebot.loadmodule("AttributeStorageLite")
+    return fakebot
+
+
+def test_set_get(attrbot):
+    attr = attrbot.moduleInstances["AttributeStorageLite"]
+    assert attr.getKey("Chatter", "password") is None
+    attr.setKey("Chatter", "password", "hunter2")
+    attr.setKey("chatter", "loggedinfrom", "cia.gov")
+    assert attr.getKey("chatter", "Password") == "hunter2"
+    assert attr.getItem("chatter") == {"password": "hunter2", "loggedinfrom": "cia.gov"}
+    attr.setKey("chatter", "loggedinfrom", None)
+    assert attr.getKey("chatter", "loggedinfrom") is None
+    assert attr.getItem("CHATTER") == {"password": "hunter2"}
+
+
+def test_cache(attrbot):
+    attr = attrbot.moduleInstances["AttributeStorageLite"]
+    attr.setKey("chatter", "password", "hunter2")
+    attr.db.query("UPDATE `values` SET `value`='changed behind our back'").close()
+    # served from the write-through cache
+    assert attr.getKey("chatter", "password") == "hunter2"
+    assert attr.values.stats()["hits"] == 1
+    attr.values.clear()
+    assert attr.getKey("chatter", "password") == "changed behind our back"
+    assert attr.getKey("someone", "password") is None
+    assert attr.getKey("someone", "password") is None
+    assert attr.cacheStats()["values"]["misses"] == 2
+    attr.setKey("chatter", "count", 5)
+    assert attr.getKey("chatter", "count") == "5"
+
+
+def test_cache_read_race(attrbot, monkeypatch):
+    attr = attrbot.moduleInstances["AttributeStorageLite"]
+    attr.setKey("chatter", "password", "old")
+    attr.values.clear()
+    query = attr.db.query
+
+    def racing_query(queryText, args=()):
+        c = query(queryText, args)
+        if args == ("chatter", "password"):
+            # another thread stores a new value after the read, but before it is cached
+            writer = Thread(target=attr.setKey, args=("chatter", "password", "new"))
+            writer.start()
+            writer.join()
+        return c
+    monkeypatch.setattr(attr.db, "query", racing_query)
+    assert attr.getKey("chatter", "password") == "old"
+    monkeypatch.undo()
+    assert attr.getKey("chatter", "password") == "new"
+    assert attr.values.stats()["hits"] == 1
+
+
+def test_get_many(attrbot):
+    attr = attrbot.moduleInstances["AttributeStorageLite"]
+    for nick in ["alice", "bob", "carol"]:
+        attr.setKey(nick, "loggedinfrom", nick + ".example.com")
+    attr.values.clear()
+    assert attr.getKey("alice", "loggedinfrom") == "alice.example.com"
+    assert attr.getMany(["Alice", "bob", "carol", "dave"], "loggedinfrom") == \
+        {"Alice": "alice.example.com", "bob": "bob.example.com", "carol": "carol.example.com", "dave": None}
+    stats = attr.values.stats()
+    assert attr.getMany(["bob", "dave"], "loggedinfrom") == {"bob": "bob.example.com", "dave": None}
+    assert attr.values.stats()["hits"] == stats["hits"] + 2
+
+
+def test_migrations(attrbot):
+    attr = attrbot.moduleInstances["AttributeStorageLite"]
+    with closing(attr.db.query("PRAGMA user_version")) as c:
+        assert c.fetchone()["user_version"] == 1
+    with closing(attr.db.query("EXPLAIN QUERY PLAN SELECT `id` FROM `items` WHERE `item`='chatter'")) as c:
+        assert "items_item" in c.fetchone()["detail"]
+
+
+def test_bulk(attrbot):
+    attr = attrbot.moduleInstances["AttributeStorageLite"]
+    attr.setKey("alice", "score", "5")
+    attr.setItems([("Alice", "score", "10"), ("bob", "score", "3"), ("bob", "rank", "1"), ("carol", "score", None)])
+    attr.items.clear()
+    attr.values.clear()
+    assert attr.getItems(["alice", "Bob", "carol"]) == {"alice": {"score": "10"}, "Bob": {"score": "3", "rank": "1"},
+                                                        "carol": {}}
+    assert attr.getItemsWithKey("score") == {"alice": "10", "bob": "3"}
+    attr.setItems([("bob", "rank", None)])
+    assert attr.getItems(["bob"]) == {"bob": {"score": "3"}}
+    with closing(attr.db.query("SELECT COUNT(*) AS `num` FROM `items`")) as c:
+        assert c.fetchone()["num"] == 3
+
+
+def test_bulk_repeated_key(attrbot):
+    attr = attrbot.moduleInstances["AttributeStorageLite"]
+    attr.setItems([("alice", "score", "x"), ("Alice", "score", None), ("bob", "score", None), ("bob", "score", "y")])
+    assert attr.getMany(["alice", "bob"], "score") == {"alice": None, "bob": "y"}
+    attr.values.clear()
+    assert attr.getMany(["alice", "bob"], "score") == {"alice": None, "bob": "y"}
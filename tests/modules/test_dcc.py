@@ -1,3 +1,5 @@
+import asyncio
+import concurrent.futures
 import pytest
 import os
 import hashlib
@@ -106,3 +108,42 @@ def test_toolongfails(dccbot, tmpdir):
         assert fe.args == ('Transfer failed: expected 52223 bytes but got 52224',)
         return
     raise Exception("Did not raise")
+
+
+def test_resume_async(dccbot, tmpdir):
+    dccbot.botconfig["module_configs"]["DCC"].pop("port_range")
+    flen = 1024 * 200
+    tmpfpath, srchash = _make_test_tempfiles(flen, tmpdir)
+    ip, port, reported_len, offer = dccbot.moduleInstances['DCC'].offer(tmpfpath)
+    assert port != 0
+    dccbot.feed_line("\x01DCC RESUME hello.bin {} 1000\x01".format(port), args=["testbot"])
+    dccbot.act_PRIVMSG.assert_called_once_with("chatter", "\x01DCC ACCEPT hello.bin {} 1000\x01".format(port))
+
+    async def recv():
+        data = b''
+        async for chunk in dccbot.moduleInstances['DCC'].recieve(DCC.int2ip(ip), port, reported_len, offset=1000):
+            data += chunk
+        return data
+    data = asyncio.run_coroutine_threadsafe(recv(), dccbot.loop).result(10)
+    offer.future.result(10)
+    with open(tmpfpath, "rb") as f:
+        assert data == f.read()[1000:]
+    stats = dccbot.moduleInstances['DCC'].stats()[0]
+    assert stats["state"] == "done"
+    assert stats["sent"] == flen - 1000
+    assert stats["acked"] == flen
+    assert stats["rate"] > 0
+
+
+def test_offer_expires(dccbot, tmpdir):
+    tmpfpath, srchash = _make_test_tempfiles(1024, tmpdir)
+    ip, port, reported_len, offer = dccbot.moduleInstances['DCC'].offer(tmpfpath, timeout=0.1)
+    offer.future.result(2)
+    assert offer.state == "expired"
+    assert port not in dccbot.moduleInstances['DCC'].offers
+    ip, port, reported_len, offer = dccbot.moduleInstances['DCC'].offer(tmpfpath)
+    offer.stopoffer()
+    with pytest.raises(concurrent.futures.CancelledError):
+        offer.future.result(2)
+    sleep(0.05)
+    assert offer.state == "withdrawn"
@@ -29,3 +29,30 @@ def test_help_one(helpbot):
     helpbot.feed_line(".help .helpindex")
     helpbot.act_PRIVMSG.assert_called_once_with('#test',
                                                 'RTFM: .helpindex: (.helpindex) show a short list of all commands')
+
+
+def test_help_pages(helpbot):
+    helpbot.moduleInstances["ModInfo"].page_size = 1
+    helpbot.feed_line(".help")
+    assert helpbot.act_PRIVMSG.mock_calls == [
+        call('#test', 'ModInfo .help [command] show the manual for all or [commands] '),
+        call('#test', 'Page 1 of 2. Use .help <page> for more')]
+    helpbot.act_PRIVMSG.reset_mock()
+    helpbot.feed_line(".help 5")
+    assert helpbot.act_PRIVMSG.mock_calls == [
+        call('#test', 'ModInfo .helpindex      show a short list of all commands     '),
+        call('#test', 'Page 2 of 2. Use .help <page> for more')]
+
+
+def test_registry(helpbot):
+    modinfo = helpbot.moduleInstances["ModInfo"]
+    helpbot.loadmodule("SQLite")
+    helpbot.loadmodule("Calc")
+    helpbot.feed_line(".help .quote")
+    assert helpbot.act_PRIVMSG.call_count == 1
+    assert "Calc" in modinfo.entries
+    helpbot.unloadmodule("Calc")
+    helpbot.act_PRIVMSG.reset_mock()
+    helpbot.feed_line(".help .quote")
+    helpbot.act_PRIVMSG.assert_not_called()
+    assert "Calc" not in modinfo.entries
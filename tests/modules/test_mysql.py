@@ -0,0 +1,127 @@
+import pytest
+from unittest.mock import MagicMock
+from tests.lib import *  # NOQA - fixtures
+from tests import minimysql
+import MySQL
+
+
+@pytest.fixture
+def mysqlbot(fakebot, tmpdir, monkeypatch):
+    """
+    Provide a bot loaded with the MySQL module, talking to a sqlite backed stand-in for the mysql driver
+    """
+    monkeypatch.setattr(MySQL, "MySQLdb", minimysql)
+    fakebot.botconfig["module_configs"]["MySQL"] = {"host": str(tmpdir.join("mysql.db")), "username": "bot",
+                                                    "password": "", "database": "bot", "pool_size": 2,
+                                                    "pool_timeout": 1, "idle_timeout": 60}
+    fakebot.loadmodule("MySQL")
+    db = fakebot.moduleInstances["MySQL"].connection
+    db.query("CREATE TABLE `things` (`id` int(11) NOT NULL AUTO_INCREMENT, `name` varchar(64) NOT NULL, "
+             "PRIMARY KEY (`id`), UNIQUE KEY `name` (`name`)) ENGINE=InnoDB DEFAULT CHARSET=latin1 ;").close()
+    return fakebot
+
+
+def names(db):
+    return [row["name"] for row in db.fetchall("SELECT `name` FROM `things` ORDER BY `id`;")]
+
+
+def test_reuse(mysqlbot):
+    db = mysqlbot.moduleInstances["MySQL"].connection
+    assert db.tableExists("things")
+    assert not db.tableExists("thing")
+    assert db.execute("INSERT INTO `things` (`name`) VALUES (%s);", ("one", )) == (1, 1)
+    assert db.executemany("INSERT INTO `things` (`name`) VALUES (%s);", [("two", ), ("three", )]) == 2
+    c = db.query("SELECT `name` FROM `things` WHERE `id`=%s;", (2, ))
+    assert c.fetchone() == {"name": "two"}
+    c.close()
+    assert names(db) == ["one", "two", "three"]
+    stats = db.pool.stats()
+    assert stats["created"] == 1
+    assert stats["checkouts"] == 7
+    assert stats["idle"] == 1
+
+
+def test_pool_limit(mysqlbot):
+    db = mysqlbot.moduleInstances["MySQL"].connection
+    first = db.getCursor()
+    second = db.getCursor()
+    assert db.pool.stats()["connections"] == 2
+    with pytest.raises(Exception):
+        db.getCursor()
+    first.close()
+    with db.getCursor() as third:
+        assert third.connection is not None
+    second.close()
+    assert db.pool.stats()["idle"] == 2
+
+
+def test_idle_health_check(mysqlbot):
+    db = mysqlbot.moduleInstances["MySQL"].connection
+    db.pool.idle_timeout = 0
+    db.pool.idle[-1][0].kill()
+    assert names(db) == []
+    stats = db.pool.stats()
+    assert stats["health_checks"] == 1
+    assert stats["created"] == 2
+    assert stats["retries"] == 0
+
+
+def test_retry(mysqlbot):
+    db = mysqlbot.moduleInstances["MySQL"].connection
+    # the dead connection hasn't been idle long enough to be pinged, so the query fails and is retried
+    db.pool.idle_timeout = float("inf")
+    db.pool.idle[-1][0].kill()
+    assert db.execute("INSERT INTO `things` (`name`) VALUES (%s);", ("one", ))[0] == 1
+    assert names(db) == ["one"]
+    stats = db.pool.stats()
+    assert stats["retries"] == 1
+    assert stats["connections"] == 1
+
+
+def test_no_retry_after_sent(mysqlbot):
+    db = mysqlbot.moduleInstances["MySQL"].connection
+    # the insert took effect but its response was lost, so running it again would insert twice
+    db.pool.idle[-1][0].lose()
+    with pytest.raises(minimysql.OperationalError):
+        db.execute("INSERT INTO `things` (`name`) VALUES (%s);", ("one", ))
+    assert names(db) == ["one"]
+    stats = db.pool.stats()
+    assert stats["retries"] == 0
+    assert stats["connections"] == 1
+
+
+def test_no_retry_other_errors(mysqlbot, monkeypatch):
+    db = mysqlbot.moduleInstances["MySQL"].connection
+    execute = MagicMock(side_effect=minimysql.OperationalError(1213, "Deadlock found"))
+    monkeypatch.setattr(minimysql.Cursor, "execute", execute)
+    with pytest.raises(minimysql.OperationalError):
+        db.execute("INSERT INTO `things` (`name`) VALUES (%s);", ("one", ))
+    assert execute.call_count == 1
+    stats = db.pool.stats()
+    assert stats["retries"] == 0
+    assert stats["idle"] == 1
+
+
+def test_transaction(mysqlbot):
+    db = mysqlbot.moduleInstances["MySQL"].connection
+    with db.transaction() as c:
+        c.execute("INSERT INTO `things` (`name`) VALUES (%s);", ("one", ))
+        c.execute("INSERT INTO `things` (`name`) VALUES (%s);", ("two", ))
+    with pytest.raises(Exception):
+        with db.transaction() as c:
+            c.execute("INSERT INTO `things` (`name`) VALUES (%s);", ("three", ))
+            c.execute("INSERT INTO `things` (`name`) VALUES (%s);", ("one", ))
+    assert names(db) == ["one", "two"]
+    assert db.pool.stats()["idle"] == 1
+
+
+def test_attributes(mysqlbot):
+    mysqlbot.loadmodule("AttributeStorage")
+    attr = mysqlbot.moduleInstances["AttributeStorage"]
+    attr.setKey("Chatter", "password", "hunter2")
+    attr.setItems([("chatter", "loggedinfrom", "cia.gov"), ("someone", "loggedinfrom", "nsa.gov")])
+    attr.values.clear()
+    attr.items.clear()
+    assert attr.getItem("chatter") == {"password": "hunter2", "loggedinfrom": "cia.gov"}
+    assert attr.getItemsWithKey("loggedinfrom") == {"chatter": "cia.gov", "someone": "nsa.gov"}
+    assert mysqlbot.moduleInstances["MySQL"].pool.stats()["connections"] == 1
@@ -87,3 +87,14 @@ def test_check(nickbot):
     assert not mod.check("chatter", "not-valid.hostname")
     pm(nickbot, ".logout")
     assert not mod.check("chatter", "cia.gov")
+
+
+def test_logout_on_disable(nickbot):
+    test_register_login(nickbot)
+    attr = nickbot.moduleInstances["AttributeStorageLite"]
+    attr.setKey("someone", "loggedinfrom", "example.com")
+    assert attr.getItemsWithKey("loggedinfrom") == {"chatter": "cia.gov", "someone": "example.com"}
+    nickbot.unloadmodule("NickUser")
+    assert attr.getItemsWithKey("loggedinfrom") == {}
+    assert attr.getKey("chatter", "loggedinfrom") is None
+    assert attr.getKey("chatter", "password") == "foobar"
@@ -10,7 +10,7 @@ def rbot(fakebot):
     """
     Provide a bot loaded with the Calc module. Clear the database.
     """
-    fakebot.botconfig["module_configs"]["Remind"] = {"mytimezone": "US/Pacific", "precision": 0.2}
+    fakebot.botconfig["module_configs"]["Remind"] = {"mytimezone": "US/Pacific"}
     fakebot.loadmodule("SQLite")
     with closing(fakebot.moduleInstances["SQLite"].opendb("remind.db")) as db:
         db.query("DROP TABLE IF EXISTS `reminders`;")
@@ -39,3 +39,28 @@ def test_remind_at(rbot):
     rbot.act_PRIVMSG.assert_not_called()
     sleep(2)
     rbot.act_PRIVMSG.assert_called_once_with('#test', 'chatter: Reminder: frig off')
+
+
+def test_remind_pending(fakebot):
+    """
+    Reminders already in the database are scheduled when the module loads
+    """
+    fakebot.botconfig["module_configs"]["Remind"] = {"mytimezone": "US/Pacific"}
+    fakebot.loadmodule("SQLite")
+    now = datetime.datetime.now()
+    with closing(fakebot.moduleInstances["SQLite"].opendb("remind.db")) as db:
+        db.query("DROP TABLE IF EXISTS `reminders`;")
+        db.query("CREATE TABLE `reminders` (`id` INTEGER PRIMARY KEY, `sender` varchar(64), `senderch` varchar(64), "
+                 "`when` timestamp, `message` varchar(2048));")
+        for when, message in [(now + datetime.timedelta(hours=1), "later"),
+                              (now - datetime.timedelta(minutes=1), "one"),
+                              (now - datetime.timedelta(minutes=2), "two")]:
+            db.query("INSERT INTO `reminders` (`sender`, `senderch`, `when`, `message`) VALUES (?, ?, ?, ?)",
+                     ("chatter", "#test", when, message)).close()
+    fakebot.loadmodule("Remind")
+    remind = fakebot.moduleInstances["Remind"]
+    sleep(0.5)
+    fakebot.act_PRIVMSG.assert_called_once_with('#test', 'chatter: Reminder: two, one')
+    with closing(remind.db.query("SELECT `message` FROM `reminders`")) as c:
+        assert c.fetchall() == [{"message": "later"}]
+    assert len(remind.heap) == 1
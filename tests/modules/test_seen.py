@@ -39,3 +39,18 @@ def test_notseen(seenbot):
     seenbot.feed_line(".seen notme")
     seenbot.act_PRIVMSG.assert_called_once_with('#test', "Sorry, I haven't seen notme!")
 
+
+def test_seen_write_behind(seenbot):
+    seen = seenbot.moduleInstances["Seen"]
+    seenbot.feed_line("blah", sender=("Someone", "root", "cia.gov"))
+    seenbot.feed_line("blah", sender=("other", "root", "cia.gov"))
+    assert set(seen.pending.keys()) == {"someone", "other"}
+    with closing(sqlite3.connect(seen.getFilePath('database.sql3'))) as db:
+        assert db.execute("SELECT COUNT(*) FROM `seen`").fetchone()[0] == 0
+        seen.flush()
+        assert seen.pending == {}
+        assert seen.seen == {}
+        assert db.execute("SELECT `nick` FROM `seen` ORDER BY `nick`").fetchall() == [("other", ), ("someone", )]
+
+    seenbot.feed_line(".seen someone")
+    assert seenbot.act_PRIVMSG.call_args[0][1].startswith("I last saw someone on ")
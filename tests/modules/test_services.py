@@ -0,0 +1,84 @@
+import pytest
+from base64 import b64decode
+from unittest.mock import MagicMock, call
+from tests.lib import *  # NOQA - fixtures
+
+
+@pytest.fixture
+def servicesbot(fakebot):
+    """
+    Provide a bot loaded with the Services module, set up to use SASL and ghost its nick
+    """
+    fakebot.botconfig["module_configs"]["Services"] = {
+        "user": {"nick": ["pyircbot3", "pyircbot3_"], "password": "hunter2", "username": "pyircbot3",
+                 "hostname": "pyircbot3.domain.com", "realname": "pyircbot3"},
+        "ident": {"enable": "yes", "to": "nickserv", "command": "identify %(password)s", "ghost": "yes",
+                  "ghost_to": "nickserv", "ghost_cmd": "ghost %(nick)s %(password)s", "ghost_timeout": 5},
+        "sasl": {"enable": True, "account": "bot"},
+        "channels": ["#a", "#b", "#c"],
+        "privatechannels": {"to": "chanserv", "command": "invite %(channel)s", "list": []}}
+    for action in ("act_NICK", "act_USER", "act_JOIN", "act_CAP", "act_AUTHENTICATE"):
+        setattr(fakebot, action, MagicMock())
+    fakebot.loadmodule("Services")
+    return fakebot
+
+
+def server_line(bot, cmd, args, trailing=None, sender=("irc.example.com", )):
+    bot.feed_line(trailing, cmd=cmd, args=args, sender=sender * 3)
+
+
+def test_sasl(servicesbot):
+    services = servicesbot.moduleInstances["Services"]
+    services._doConnect(None, None)
+    servicesbot.act_CAP.assert_called_once_with("LS", "302")
+    server_line(servicesbot, "CAP", ["*", "LS", "*"], "multi-prefix")
+    servicesbot.act_CAP.assert_called_once_with("LS", "302")
+    server_line(servicesbot, "CAP", ["*", "LS"], "sasl=PLAIN,EXTERNAL away-notify")
+    servicesbot.act_CAP.assert_called_with("REQ", "sasl")
+    server_line(servicesbot, "CAP", ["*", "ACK"], "sasl")
+    servicesbot.act_AUTHENTICATE.assert_called_once_with("PLAIN")
+    server_line(servicesbot, "AUTHENTICATE", ["+"])
+    assert b64decode(servicesbot.act_AUTHENTICATE.call_args[0][0]) == b"bot\0bot\0hunter2"
+    server_line(servicesbot, "903", ["*"], "SASL authentication successful")
+    servicesbot.act_CAP.assert_called_with("END")
+    assert services.authenticated
+    server_line(servicesbot, "001", ["pyircbot3"], "Welcome")
+    servicesbot.act_JOIN.assert_called_once_with(["#a", "#b", "#c"])
+    servicesbot.act_PRIVMSG.assert_not_called()
+
+
+def test_sasl_failed(servicesbot):
+    services = servicesbot.moduleInstances["Services"]
+    services._doConnect(None, None)
+    server_line(servicesbot, "CAP", ["*", "LS"], "multi-prefix")
+    servicesbot.act_CAP.assert_called_with("END")
+    servicesbot.act_CAP.reset_mock()
+    server_line(servicesbot, "904", ["*"], "SASL authentication failed")
+    servicesbot.act_CAP.assert_called_with("END")
+    assert not services.authenticated
+    server_line(servicesbot, "001", ["pyircbot3"], "Welcome")
+    servicesbot.act_PRIVMSG.assert_called_once_with("nickserv", "identify hunter2")
+
+
+def test_ghost(servicesbot):
+    services = servicesbot.moduleInstances["Services"]
+    services.sasl = {}
+    services._doConnect(None, None)
+    server_line(servicesbot, "433", ["*", "pyircbot3"], "Nickname is already in use")
+    servicesbot.act_NICK.assert_called_with("pyircbot3_")
+    server_line(servicesbot, "001", ["pyircbot3_"], "Welcome")
+    servicesbot.act_PRIVMSG.assert_called_once_with("nickserv", "ghost pyircbot3 hunter2")
+    servicesbot.act_JOIN.assert_not_called()
+    # services' unrelated notices don't end the wait for the ghost to take effect
+    server_line(servicesbot, "NOTICE", ["pyircbot3_"], "This nickname is registered. Please choose a different "
+                "nickname, or identify via /msg NickServ identify <password>.",
+                sender=("NickServ", "NickServ", "services."))
+    servicesbot.act_NICK.assert_called_with("pyircbot3_")
+    server_line(servicesbot, "NOTICE", ["pyircbot3_"], "pyircbot3 has been ghosted.",
+                sender=("NickServ", "NickServ", "services."))
+    servicesbot.act_NICK.assert_called_with("pyircbot3")
+    server_line(servicesbot, "NICK", [], "pyircbot3", sender=("pyircbot3_", "pyircbot3", "cia.gov"))
+    assert services.nick() == "pyircbot3"
+    assert servicesbot.act_PRIVMSG.call_args_list[1] == call("nickserv", "identify hunter2")
+    servicesbot.act_JOIN.assert_called_once_with(["#a", "#b", "#c"])
+    assert not services.regaining
@@ -0,0 +1,85 @@
+import asyncio
+import sqlite3
+import pytest
+from contextlib import closing
+from threading import Thread
+from tests.lib import *  # NOQA - fixtures
+
+
+@pytest.fixture
+def db(fakebot):
+    """
+    Provide a database opened through the sqlite service
+    """
+    fakebot.loadmodule("SQLite")
+    with closing(fakebot.moduleInstances["SQLite"].opendb("test.db")) as db:
+        db.query("CREATE TABLE `things` (`id` INTEGER PRIMARY KEY, `name` varchar(64) UNIQUE)").close()
+        yield db
+
+
+def names(db):
+    with closing(db.query("SELECT `name` FROM `things` ORDER BY `id`")) as c:
+        return [row["name"] for row in c.fetchall()]
+
+
+def test_pragmas(db):
+    with closing(db.query("PRAGMA journal_mode")) as c:
+        assert c.fetchone()["journal_mode"] == "wal"
+
+
+def test_thread_connections(db):
+    connections = []
+    thread = Thread(target=lambda: connections.append(db.thread_connection()))
+    thread.start()
+    thread.join()
+    assert db.thread_connection() is db.thread_connection()
+    assert connections[0] is not db.thread_connection()
+    # the exited thread's connection has been closed
+    assert connections[0] not in db.connections
+    with pytest.raises(sqlite3.ProgrammingError):
+        connections[0].execute("SELECT 1")
+
+
+def test_queued_writes(db, caplog):
+    assert db.writer is None
+    futures = [db.execute("INSERT INTO `things` (`name`) VALUES (?)", ("thing{}".format(i), )) for i in range(3)]
+    duplicate = db.execute("INSERT INTO `things` (`name`) VALUES (?)", ("thing0", ))
+    many = db.executemany("INSERT INTO `things` (`name`) VALUES (?)", [("a", ), ("b", )])
+    assert [f.result(timeout=5).lastrowid for f in futures] == [1, 2, 3]
+    with pytest.raises(sqlite3.IntegrityError):
+        duplicate.result(timeout=5)
+    assert "queued write failed: UNIQUE constraint failed" in caplog.text
+    assert many.result(timeout=5).rowcount == 2
+    assert names(db) == ["thing0", "thing1", "thing2", "a", "b"]
+
+
+def test_run_rolls_back(db):
+    def func(c):
+        c.execute("INSERT INTO `things` (`name`) VALUES ('one')")
+        raise Exception("nope")
+    with pytest.raises(Exception):
+        db.run(func).result(timeout=5)
+    assert names(db) == []
+
+
+def test_transaction(db):
+    with db.transaction() as c:
+        c.execute("INSERT INTO `things` (`name`) VALUES ('one')")
+        c.execute("INSERT INTO `things` (`name`) VALUES ('two')")
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.transaction() as c:
+            c.execute("INSERT INTO `things` (`name`) VALUES ('three')")
+            c.execute("INSERT INTO `things` (`name`) VALUES ('one')")
+    assert names(db) == ["one", "two"]
+
+
+def test_async(db):
+    async def work():
+        result = await db.aexecute("INSERT INTO `things` (`name`) VALUES (?)", ("one", ))
+        await db.arun(lambda c: c.execute("INSERT INTO `things` (`name`) VALUES ('two')"))
+        return result, await db.aquery("SELECT `name` FROM `things` ORDER BY `id`")
+    loop = asyncio.new_event_loop()
+    result, rows = loop.run_until_complete(work())
+    loop.close()
+    assert result.lastrowid == 1
+    assert rows == [{"name": "one"}, {"name": "two"}]
@@ -1,4 +1,6 @@
 import pytest
+import sqlite3
+from concurrent.futures import Future
 from contextlib import closing
 from tests.lib import *  # NOQA - fixtures
 
@@ -40,3 +42,38 @@ def test_max(tellbot):
     tellbot.feed_line(".tell foobar asdf")
     tellbot.act_PRIVMSG.assert_not_called()
 
+
+def test_delete_failed(tellbot, monkeypatch, caplog):
+    test_addtell(tellbot)
+    failed = Future()
+    failed.set_exception(sqlite3.OperationalError("database is locked"))
+    monkeypatch.setattr(tellbot.moduleInstances["Tell"].db, "executemany", lambda *args: failed)
+    tellbot.feed_line(".", sender=("fudge", "user", "host"))
+    tellbot.act_PRIVMSG.assert_called_once_with("#test", "fudge: chatter said 0 minutes ago: foo")
+    assert "failed to delete 1 delivered tells of fudge: database is locked" in caplog.text
+
+
+def test_tell_case(tellbot):
+    tellbot.feed_line(".tell Fudge foo")
+    tellbot.feed_line(".tell FUDGE bar", args=["testbot"])
+    tellbot.act_PRIVMSG.reset_mock()
+    tellbot.feed_line(".", sender=("someone", "user", "host"))
+    tellbot.act_PRIVMSG.assert_not_called()
+    tellbot.feed_line(".", sender=("fUdGe", "user", "host"))
+    assert tellbot.act_PRIVMSG.call_count == 2
+    tellbot.act_PRIVMSG.assert_any_call("#test", "fUdGe: chatter said 0 minutes ago: foo")
+    tellbot.act_PRIVMSG.assert_any_call("fUdGe", "fUdGe: chatter said 0 minutes ago: bar")
+    tellbot.act_PRIVMSG.reset_mock()
+    tellbot.feed_line(".", sender=("fudge", "user", "host"))
+    tellbot.act_PRIVMSG.assert_not_called()
+
+
+def test_pending_loaded(tellbot):
+    test_addtell(tellbot)
+    tellbot.unloadmodule("Tell")
+    tellbot.loadmodule("Tell")
+    tell = tellbot.moduleInstances["Tell"]
+    assert tell.pending == {"fudge": 1}
+    tellbot.feed_line(".", sender=("fudge", "user", "host"))
+    tellbot.act_PRIVMSG.assert_called_once_with("#test", "fudge: chatter said 0 minutes ago: foo")
+    assert tell.pending == {}
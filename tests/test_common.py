@@ -1,3 +1,5 @@
+import random
+import string
 from pyircbot import common
 
 
@@ -9,3 +11,100 @@ def test_parse_line():
 def test_parse_notrailing():
     assert common.parse_irc_line(":chuck!~chuck@foobar MODE #jesusandhacking -o asciibot") == \
         ('MODE', ['#jesusandhacking', '-o', 'asciibot'], 'chuck!~chuck@foobar', None)
+
+
+def test_parse_command_line():
+    assert common.parse_command_line(".seen  chuck  foo ") == \
+        (common.CommandLine(".seen", ("chuck", "foo"), "chuck  foo", ".seen  chuck  foo ", False, False), )
+    assert common.parse_command_line("") == ()
+
+
+def test_parse_command_line_highlight():
+    raw, highlight = common.parse_command_line("bot: seen chuck", "bot")
+    assert raw.word == "bot:" and raw.addressed and not raw.highlight
+    assert highlight == common.CommandLine(".seen", ("chuck", ), "chuck", ".seen chuck", True, True)
+
+
+def test_parse_bytes():
+    line = common.parse_irc_bytes(b":chuck!~chuck@foobar PRIVMSG #jesusandhacking :asdf\r\n")
+    assert line.astuple() == ('PRIVMSG', ['#jesusandhacking'], 'chuck!~chuck@foobar', "asdf")
+    assert line.tags == {}
+    assert common.parse_irc_bytes(b"PING :irc.example.com\r\n").astuple() == ('PING', [], None, 'irc.example.com')
+    assert common.parse_irc_bytes(b"\r\n") is None
+
+
+def test_parse_bytes_tags():
+    line = common.parse_irc_bytes(rb"@time=2019-02-10T00:00:00.000Z;msgid=a\sb\:c\\;+draft/typing;empty= "
+                                  b":chuck!~chuck@foobar PRIVMSG #jesusandhacking :asdf\r\n")
+    assert line.astuple() == ('PRIVMSG', ['#jesusandhacking'], 'chuck!~chuck@foobar', "asdf")
+    assert line.tags == {"time": "2019-02-10T00:00:00.000Z", "msgid": "a b;c\\", "+draft/typing": True,
+                         "empty": True}
+
+
+def test_parse_bytes_latin1():
+    line = common.parse_irc_bytes(":chuck!~chuck@foobar PRIVMSG #jesusandhacking :caf\xe9\r\n".encode("latin-1"))
+    assert line.trailing == "caf\xe9"
+
+
+def random_word(rand, first_chars, chars, maxlen=12):
+    return rand.choice(first_chars) + "".join(rand.choice(chars) for _ in range(rand.randint(0, maxlen)))
+
+
+def test_parse_bytes_matches_parse_line():
+    """
+    Property test: for randomly generated well-formed lines, the bytes parser returns the same result as the
+    original string parser.
+    """
+    rand = random.Random(1)
+    text = string.ascii_letters + string.digits + string.punctuation + " é☃"
+    word = string.ascii_letters + string.digits + string.punctuation.replace(":", "") + "é"
+    for _ in range(5000):
+        parts = []
+        if rand.random() < 0.8:
+            parts.append(":" + random_word(rand, word, word + ":"))
+        parts.append(rand.choice(["PRIVMSG", "NOTICE", "MODE", "JOIN", "001", "353", "KICK"]))
+        for _ in range(rand.randint(0 if rand.random() < 0.5 else 1, 4)):
+            parts.append(random_word(rand, word, word + ":"))
+        if len(parts) < 3 or rand.random() < 0.7:
+            parts.append(":" + "".join(rand.choice(text) for _ in range(rand.randint(0, 40))))
+        data = " ".join(parts) + "\r\n"
+        assert common.parse_irc_bytes(data.encode("UTF-8")).astuple() == common.parse_irc_line(data), data
+
+
+def test_penaltybucket(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(common, "time", lambda: now[0])
+    bucket = common.penaltybucket(window=10.0, cost=2.0, line_bytes=120.0, recover=30.0)
+    line = "PRIVMSG #test :" + "x" * 105  # 120 bytes, 3 seconds
+    assert [bucket.get(line) for i in range(4)] == [0, 0, 0, 0]
+    assert bucket.get(line) == 2.0
+    now[0] += 2.0
+    assert bucket.get(line) == 0
+    assert bucket.penalty("PONG :x") < bucket.penalty("JOIN #x")
+
+    bucket.throttled()
+    assert bucket.factor == 2.0 and bucket.throttles == 1
+    assert bucket.get(line) == 13.0
+    now[0] += 13.0
+    assert bucket.get(line) == 0
+    assert bucket.timer == now[0] + 10.0 + 6.0
+    now[0] += 60.0
+    bucket.get(line)
+    assert bucket.factor == 2.0 * 0.9 ** 2
+    now[0] += 3000.0
+    bucket.get(line)
+    assert bucket.factor == bucket.min_factor
+
+
+def test_lrucache():
+    cache = common.LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3 and cache.get("a") == 1
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 3, "misses": 1, "evictions": 1, "hit_rate": 0.75}
+    disabled = common.LRUCache(0)
+    disabled.put("a", 1)
+    assert disabled.get("a", "nope") == "nope"
@@ -0,0 +1,408 @@
+import asyncio
+import socket
+from threading import Thread, get_ident
+import pytest
+from unittest.mock import MagicMock
+from pyircbot.irccore import IRCCore, IRCEvent, UserPrefix, OutputQueue
+
+
+@pytest.fixture
+def irccore():
+    loop = asyncio.new_event_loop()
+    yield IRCCore([["localhost", 6667]], loop)
+    loop.run_until_complete(cancel_all())
+    loop.close()
+
+
+async def cancel_all():
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_legacy_hook_detection():
+    class Module(object):
+        def event(self, msg):
+            pass
+
+        def legacy(self, args, prefix, trailing):
+            pass
+
+    assert not IRCCore.isLegacyHook(Module().event)
+    assert not IRCCore.isLegacyHook(lambda msg: None)
+    assert IRCCore.isLegacyHook(Module().legacy)
+
+
+def test_fire_hook(irccore):
+    events = []
+    legacy = MagicMock()
+    irccore.addHook("PRIVMSG", lambda msg: events.append(msg))
+    irccore.addHook("_ALL", lambda msg: events.append(msg))
+    irccore.addHook("PRIVMSG", lambda args, prefix, trailing: legacy(args, prefix, trailing))
+    irccore.fire_hook("PRIVMSG", args=["#test"], prefix="chatter!root@cia.gov", trailing="hello")
+    expected = IRCEvent("PRIVMSG", ["#test"], UserPrefix("chatter", "root", "cia.gov"), "hello", "#test")
+    assert events == [expected, expected]
+    assert events[0] is events[1]
+    legacy.assert_called_once_with(["#test"], "chatter!root@cia.gov", "hello")
+
+
+def test_remove_hook(irccore):
+    hook = MagicMock()
+
+    def method(msg):
+        hook(msg)
+    irccore.addHook("JOIN", method)
+    irccore.removeHook("JOIN", method)
+    irccore.fire_hook("JOIN", args=[], prefix="chatter!root@cia.gov", trailing="#test")
+    hook.assert_not_called()
+
+
+class FakeWriter(object):
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+    async def drain(self):
+        pass
+
+
+def run_outputqueue(irccore, lines, duration=0.1):
+    irccore.writer = FakeWriter()
+    for line in lines:
+        irccore.sendRaw(line)
+    irccore._loop.run_until_complete(asyncio.sleep(duration))
+    return irccore.writer.writes
+
+
+def test_outputqueue_batches(irccore):
+    irccore.rate_limit = False
+    writes = run_outputqueue(irccore, ["PRIVMSG #test :{}".format(i) for i in range(10)])
+    assert writes == ["".join("PRIVMSG #test :{}\r\n".format(i) for i in range(10)).encode()]
+    assert irccore.get_stats() == {"output_queue": 0, "output_backlog": {}, "output_expired": {}, "lines_written": 10,
+                                   "bytes_written": len(writes[0]), "writes": 1, "inbound_queue": 0,
+                                   "inbound_dropped": 0, "lines_read": 0,
+                                   "inbound_latency": {"last": 0.0, "average": 0.0, "max": 0.0}}
+
+
+def test_outputqueue_batches_ratelimited(irccore):
+    irccore.rate_max = 3.0
+    writes = run_outputqueue(irccore, ["PRIVMSG #test :{}".format(i) for i in range(5)])
+    assert writes == ["".join("PRIVMSG #test :{}\r\n".format(i) for i in range(3)).encode()]
+    assert irccore.get_stats()["output_queue"] == 2
+
+
+def drain(queue):
+    lines = []
+    while not queue.empty():
+        lines.append(queue.get_nowait()[2])
+    return lines
+
+
+def test_outputqueue_round_robin():
+    queue = OutputQueue()
+    for i in range(3):
+        queue.put(3, "PRIVMSG #flood :{}".format(i))
+    queue.put(3, "PRIVMSG #other :hi")
+    queue.put(3, "PRIVMSG someone :hey")
+    queue.put(1, "PONG :server")
+    assert queue.backlog() == {"#flood": 3, "#other": 1, "someone": 1, "*": 1}
+    assert drain(queue) == ["PONG :server", "PRIVMSG #flood :0", "PRIVMSG #other :hi", "PRIVMSG someone :hey",
+                            "PRIVMSG #flood :1", "PRIVMSG #flood :2"]
+    assert queue.levels == {} and queue.priorities == []
+    with pytest.raises(asyncio.QueueEmpty):
+        queue.get_nowait()
+
+
+def test_outputqueue_coalesce():
+    queue = OutputQueue()
+    queue.coalesce_length = 32
+    for line in ["PRIVMSG #test :one", "PRIVMSG #test :two", "PRIVMSG #test :three", "PRIVMSG #test :four",
+                 "PRIVMSG #test :\x01ACTION waves\x01", "NOTICE #test :a", "NOTICE #test :b"]:
+        queue.put(3, line)
+    assert drain(queue) == ["PRIVMSG #test :one | two | three", "PRIVMSG #test :four",
+                            "PRIVMSG #test :\x01ACTION waves\x01", "NOTICE #test :a", "NOTICE #test :b"]
+    assert queue.qsize() == 0
+
+
+def test_outputqueue_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("pyircbot.irccore.time", lambda: now[0])
+    queue = OutputQueue()
+    queue.ttls = {3: 10}
+    queue.put(3, "PRIVMSG #test :old 1")
+    queue.put(3, "PRIVMSG #test :old 2")
+    queue.put(3, "JOIN #test")
+    queue.put(5, "PRIVMSG #test :no ttl")
+    queue.put(3, "PRIVMSG #other :short", ttl=5)
+    now[0] += 6
+    queue.put(3, "PRIVMSG #test :new")
+    assert queue.qsize() == 6
+    now[0] += 5
+    assert drain(queue) == ["JOIN #test", "PRIVMSG #test :new", "PRIVMSG #test :no ttl"]
+    assert queue.expired == {3: 3}
+
+
+def test_outputqueue_expiry_collapse(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("pyircbot.irccore.time", lambda: now[0])
+    queue = OutputQueue()
+    queue.expire_policy = "collapse"
+    for i in range(3):
+        queue.put(3, "PRIVMSG #test :{}".format(i), ttl=10)
+    queue.put(3, "NOTICE nick :hi", ttl=1)
+    now[0] += 2
+    queue.put(3, "PRIVMSG #test :new")
+    assert drain(queue) == ["PRIVMSG #test :0", "NOTICE nick :(1 old message dropped)", "PRIVMSG #test :1",
+                            "PRIVMSG #test :2", "PRIVMSG #test :new"]
+    now[0] += 20
+    queue.put(3, "PRIVMSG #test :a", ttl=10)
+    queue.put(3, "PRIVMSG #test :b", ttl=10)
+    now[0] += 20
+    assert drain(queue) == ["PRIVMSG #test :(2 old messages dropped)"]
+    with pytest.raises(asyncio.QueueEmpty):
+        queue.get_nowait()
+
+
+def test_throttle_detection():
+    assert IRCCore.is_throttle("ERROR", None, "Closing Link: 1.2.3.4 (Excess Flood)")
+    assert IRCCore.is_throttle("NOTICE", "irc.example.com", "*** Message to #test throttled due to flooding")
+    assert IRCCore.is_throttle("263", "irc.example.com", "Please wait a while and try again.")
+    assert not IRCCore.is_throttle("NOTICE", "chatter!root@cia.gov", "stop flooding")
+    assert not IRCCore.is_throttle("ERROR", None, "Closing Link: 1.2.3.4 (Ping timeout)")
+    assert IRCCore.is_throttle("NOTICE", "irc.example.com", "*** Target change too fast. Please wait 5 seconds.")
+    assert not IRCCore.is_throttle("NOTICE", "irc.example.com", "*** You are exempt from flood limits.")
+    assert not IRCCore.is_throttle("NOTICE", "irc.example.com", "*** Notice -- Possible flooder chatter!root@cia.gov")
+
+
+def test_adaptive_limiter_per_server():
+    loop = asyncio.new_event_loop()
+    irc = IRCCore([["irc.example.com", 6667], ["irc.example.net", 6667]], loop, rate_adaptive=True)
+    first = irc.server_limiter()
+    first.throttled()
+    irc.server = 1
+    assert irc.server_limiter() is not first
+    irc.server = 0
+    assert irc.server_limiter() is first
+    assert irc.get_stats()["rate_limits"] == {"irc.example.com:6667": {"factor": 2.0, "throttles": 1},
+                                              "irc.example.net:6667": {"factor": 1.0, "throttles": 0}}
+    loop.run_until_complete(cancel_all())
+    loop.close()
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_connect_races_servers():
+    loop = asyncio.new_event_loop()
+    accepted = []
+
+    async def serve():
+        server = await asyncio.start_server(lambda reader, writer: accepted.append(writer), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        irc = IRCCore([["127.0.0.1", unused_port()], ["127.0.0.1", port], ["127.0.0.1", port]], loop)
+        index, reader, writer = await irc.connect()
+        assert index == 1
+        writer.close()
+        irc.server = 2
+        irc.connect_parallel = 1
+        assert (await irc.connect())[0] == 2
+        irc.server = 0
+        with pytest.raises(OSError):
+            await irc.connect()
+        server.close()
+
+    loop.run_until_complete(serve())
+    loop.run_until_complete(cancel_all())
+    loop.close()
+
+
+def test_backoff(irccore, monkeypatch):
+    monkeypatch.setattr("pyircbot.irccore.random.uniform", lambda low, high: high)
+    irccore.reconnect_delay = 2.0
+    irccore.reconnect_max = 60.0
+    assert [irccore.backoff() for i in range(7)] == [2.0, 4.0, 8.0, 16.0, 32.0, 60.0, 60.0]
+    irccore.connect_attempts = 10000
+    assert irccore.backoff() == 60.0
+
+
+def test_connect_timeout_backs_off(irccore, monkeypatch):
+    attempts = []
+
+    async def connect():
+        attempts.append(irccore.server)
+        if len(attempts) == 2:
+            irccore.alive = False
+        raise asyncio.TimeoutError()
+    monkeypatch.setattr(irccore, "connect", connect)
+    monkeypatch.setattr(irccore, "backoff", lambda: 0)
+    irccore.servers = [["a.example.com", 6667], ["b.example.com", 6667], ["c.example.com", 6667]]
+    irccore._loop.run_until_complete(irccore.read(irccore._loop))
+    assert attempts == [0, 2]
+
+
+def test_join_batches(irccore):
+    irccore.sendRaw = MagicMock()
+    irccore.act_JOIN("#test")
+    irccore.sendRaw.assert_called_once_with("JOIN #test", 3)
+    irccore.sendRaw.reset_mock()
+    channels = ["#channel%03d" % i for i in range(100)]
+    irccore.act_JOIN(channels)
+    lines = [call[0][0] for call in irccore.sendRaw.call_args_list]
+    assert len(lines) == 3
+    assert all(len(line) <= 510 for line in lines)
+    assert [name for line in lines for name in line[5:].split(",")] == channels
+
+
+def test_sendraw_handoff(irccore):
+    irccore.rate_limit = False
+    irccore.writer = FakeWriter()
+    irccore.outputq.put = MagicMock(wraps=irccore.outputq.put)
+    sender = Thread(target=lambda: [irccore.sendRaw("PRIVMSG #test :{}".format(i), 3) for i in range(50)])
+    sender.start()
+    sender.join()
+    # one wakeup of the loop for the whole burst
+    assert len(irccore.handoff) == 50 and irccore.handoff_scheduled
+    irccore.outputq.put.assert_not_called()
+
+    async def from_loop():
+        await asyncio.sleep(0)  # let the output task start
+        irccore.sendRaw("PRIVMSG #test :50", 3)
+        irccore.outputq.put.assert_called_with(3, "PRIVMSG #test :50", None)
+        await asyncio.sleep(0.05)
+    irccore._loop.run_until_complete(from_loop())
+    assert not irccore.handoff and not irccore.handoff_scheduled
+    assert b"".join(irccore.writer.writes) == "".join("PRIVMSG #test :{}\r\n".format(i) for i in range(51)).encode()
+
+
+def test_read_limits_and_socket_options(irccore):
+    loop = irccore._loop
+    received = []
+
+    async def serve(reader, writer):
+        writer.write(b":server NOTICE * :" + b"x" * 300 + b"\r\n:server NOTICE * :short\r\n")
+        await writer.drain()
+
+    async def run():
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        irccore.servers = [["127.0.0.1", server.sockets[0].getsockname()[1]]]
+        irccore.stream_limit = 100
+        irccore.keepalive = {"idle": 30, "interval": 10, "count": 3}
+        irccore.addHook("NOTICE", lambda msg: received.append(msg.trailing))
+        client = asyncio.ensure_future(irccore.loop(loop))
+        while not received:
+            await asyncio.sleep(0.01)
+        sock = irccore.writer.get_extra_info("socket")
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE) == 30
+        server.close()
+        client.cancel()
+    loop.run_until_complete(run())
+    assert received == ["short"]
+
+
+def serve_lines(irccore, lines, hook):
+    """
+    Run the read loop against a server that sends lines, until each has been dispatched or dropped
+    """
+    loop = irccore._loop
+    seen = []
+
+    async def serve(reader, writer):
+        writer.write(b"".join(line + b"\r\n" for line in lines))
+        await writer.drain()
+
+    async def run():
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        irccore.servers = [["127.0.0.1", server.sockets[0].getsockname()[1]]]
+        irccore.writer = FakeWriter()
+        irccore.addHook("NOTICE", lambda msg: (seen.append(msg.trailing), hook(msg)))
+        client = asyncio.ensure_future(irccore.loop(loop))
+        while irccore.lines_read + irccore.inbound_dropped < len(lines):
+            await asyncio.sleep(0.01)
+        server.close()
+        client.cancel()
+        await asyncio.gather(client, return_exceptions=True)
+    loop.run_until_complete(run())
+    return seen
+
+
+def test_ping_fast_path(irccore):
+    irccore.rate_limit = False
+    pongs = []
+
+    def hook(msg):
+        # the PING after this line was answered by the reader before this line's hooks ran
+        if msg.trailing == "1":
+            pongs.append(irccore.outputq.put.call_count)
+    irccore.outputq.put = MagicMock(wraps=irccore.outputq.put)
+    seen = serve_lines(irccore, [b":server NOTICE * :1", b"PING :irc.example.com", b":server NOTICE * :last"],
+                       hook)
+    assert seen == ["1", "last"]
+    assert irccore.outputq.put.call_args_list[0][0][:2] == (1, "PONG :irc.example.com")
+    assert pongs == [1]
+    stats = irccore.get_stats()
+    assert stats["lines_read"] == 3
+    assert stats["inbound_queue"] == 0
+    assert stats["inbound_latency"]["max"] >= stats["inbound_latency"]["average"] > 0
+
+
+def test_ping_middle_param(irccore):
+    irccore.rate_limit = False
+    irccore.outputq.put = MagicMock(wraps=irccore.outputq.put)
+    serve_lines(irccore, [b"PING irc.example.com", b":server NOTICE * :last"], lambda msg: None)
+    assert irccore.outputq.put.call_args_list[0][0][:2] == (1, "PONG :irc.example.com")
+
+
+@pytest.mark.parametrize("policy,expected", [("drop_newest", ["0", "1"]),
+                                             ("drop_oldest", ["3", "last"]),
+                                             ("block", ["0", "1", "2", "3", "last"])])
+def test_inbound_overflow(irccore, policy, expected):
+    irccore.inbound_size = 2
+    irccore.inbound_overflow = policy
+    lines = [b":server NOTICE * :%d" % i for i in range(4)] + [b":server NOTICE * :last"]
+    # the reader queues everything it has read before any hooks run
+    assert serve_lines(irccore, lines, lambda msg: None) == expected
+    assert irccore.get_stats()["inbound_dropped"] == 5 - len(expected)
+
+
+def test_inbound_overflow_default(irccore):
+    irccore.rate_limit = False
+    irccore.inbound_size = 2
+    irccore.outputq.put = MagicMock(wraps=irccore.outputq.put)
+    pongs = []
+
+    def hook(msg):
+        pongs.append(irccore.outputq.put.call_count)
+    lines = [b":server NOTICE * :%d" % i for i in range(4)] + [b"PING :irc.example.com", b":server NOTICE * :last"]
+    # the reader keeps reading, and answering PINGs, while the queue is full
+    assert serve_lines(irccore, lines, hook) == ["last"]
+    assert pongs == [1]
+    assert irccore.outputq.put.call_args_list[0][0][:2] == (1, "PONG :irc.example.com")
+
+
+def test_stats_from_thread(irccore):
+    irccore.rate_adaptive = True
+    irccore.server_limiter()
+    loop_thread = Thread(target=irccore._loop.run_forever, daemon=True)
+    loop_thread.start()
+    threads = []
+
+    def collect():
+        threads.append(get_ident())
+        return IRCCore.collect_stats(irccore)
+    irccore.collect_stats = collect
+    try:
+        stats = irccore.get_stats()
+    finally:
+        irccore._loop.call_soon_threadsafe(irccore._loop.stop)
+        loop_thread.join()
+    assert threads == [loop_thread.ident]
+    assert stats["output_queue"] == 0 and "rate_limits" in stats
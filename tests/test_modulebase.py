@@ -0,0 +1,260 @@
+import re
+import pytest
+import asyncio
+from threading import current_thread
+from types import SimpleNamespace
+from pyircbot import modulebase
+from pyircbot.modulebase import ModuleBase, HookIndex, IRCHook, hook, command, regex, required_literal
+from pyircbot.irccore import IRCCore
+from pyircbot.common import messageHasCommand
+from tests.lib import *  # NOQA - fixtures
+
+
+def make_msg(trailing, cmd="PRIVMSG", args=["#test"]):
+    return IRCCore.packetAsObject(cmd, args, "chatter!root@cia.gov", trailing)
+
+
+def test_index_by_command():
+    index = HookIndex()
+    join = IRCHook(None, None, hook("JOIN"))
+    privmsg = IRCHook(None, None, hook("PRIVMSG"))
+    index.add([join, privmsg])
+    assert index.lookup(make_msg("#test", cmd="JOIN")) == [join]
+    assert index.lookup(make_msg("hello")) == [privmsg]
+    assert index.lookup(make_msg("x", cmd="KICK")) == []
+
+
+def test_index_by_keyword():
+    index = HookIndex()
+    cmd = IRCHook(None, None, command("inventory", "inv"))
+    other = IRCHook(None, None, command("seen"))
+    index.add([cmd, other])
+    assert index.lookup(make_msg(".inv")) == [cmd]
+    assert index.lookup(make_msg(".inventory foo bar")) == [cmd]
+    assert index.lookup(make_msg("testbot: inv foo"), "testbot") == [cmd]
+    assert index.lookup(make_msg(".invent")) == []
+    assert index.lookup(make_msg(None)) == []
+
+
+def test_index_order_and_remove():
+    index = HookIndex()
+    first = IRCHook(None, None, hook("PRIVMSG"))
+    second = IRCHook(None, None, command("seen"))
+    third = IRCHook(None, None, regex("foo"))
+    anything = IRCHook(None, None)
+    index.add([first, second, third, anything])
+    assert index.lookup(make_msg(".seen foo")) == [first, second, third, anything]
+    index.remove([second, anything])
+    assert index.lookup(make_msg(".seen foo")) == [first, third]
+    index.remove([first, third])
+    assert index.lookup(make_msg(".seen foo")) == []
+    assert index.by_command == {} and index.by_keyword == {}
+
+
+def test_index_builds_pattern_sets_once(monkeypatch):
+    built = []
+    monkeypatch.setattr(modulebase, "PatternSet", lambda hooks: built.append(hooks) or SimpleNamespace(hooks=hooks))
+    index = HookIndex()
+    hooks = [IRCHook(None, None, regex("foo%d" % i)) for i in range(5)]
+    index.add(hooks)
+    assert built == [hooks]
+    index.remove(hooks[:2])
+    assert built[1:] == [hooks[2:]]
+    index.remove(hooks[2:])
+    assert len(built) == 2
+    assert index.by_pattern == {}
+
+
+class DispatchTest(ModuleBase):
+    @command("ping")
+    def cmd_ping(self, msg, cmd):
+        self.bot.act_PRIVMSG(msg.args[0], "pong " + cmd.args_str)
+
+    @hook("JOIN")
+    def joined(self, msg, cmd):
+        self.bot.act_PRIVMSG(msg.trailing, "hi")
+
+
+def test_load_unload_updates_index(fakebot):
+    fakebot.modules["DispatchTest"] = SimpleNamespace(DispatchTest=DispatchTest)
+    fakebot.loadmodule("DispatchTest")
+    fakebot.feed_line(".ping foo")
+    fakebot.act_PRIVMSG.assert_called_once_with("#test", "pong foo")
+    fakebot.act_PRIVMSG.reset_mock()
+    fakebot.feed_line("#test", cmd="JOIN")
+    fakebot.act_PRIVMSG.assert_called_once_with("#test", "hi")
+    fakebot.act_PRIVMSG.reset_mock()
+    fakebot.unloadmodule("DispatchTest")
+    fakebot.feed_line(".ping foo")
+    fakebot.act_PRIVMSG.assert_not_called()
+    assert fakebot.hookindex.by_keyword == {}
+
+
+class FakeNickBot(object):
+    def get_nick(self):
+        return "testbot"
+
+
+def test_command_matches_messagehascommand():
+    """
+    Commands matched through the parsed command line must be the same as matching each keyword with
+    messageHasCommand
+    """
+    hooks = [command("seen"), command("seen", require_args=True), command("seen", require_args=2),
+             command("seen", allow_highlight=False), command("scramble top", "seen")]
+    lines = [".seen", ".seen chuck", ".seen chuck norris", ".seens chuck", "seen", "testbot: seen chuck",
+             "testbot, seen", "testbot: .seen", ".scramble top 10", ".scramble", "  .seen", ".seen\tchuck"]
+    for cmd in hooks:
+        for line in lines:
+            msg = make_msg(line)
+            expected = False
+            for keyword in cmd.keywords:
+                expected = messageHasCommand("." + keyword, line, requireArgs=cmd.require_args,
+                                             withHighlight="testbot" if cmd.allow_highlight else False)
+                if expected:
+                    break
+            assert cmd.validate(msg, FakeNickBot()) == expected
+            routed = [validation for irchook, validation in
+                      indexed(cmd).matches(msg, FakeNickBot(), "testbot")]
+            assert routed == ([expected] if expected else [])
+
+
+def indexed(hook):
+    index = HookIndex()
+    index.add([IRCHook(hook.validate, None, hook)])
+    return index
+
+
+def test_required_literal():
+    assert required_literal(re.compile(r'\bF\b')) == "F"
+    assert required_literal(re.compile(r'(?:^\.text\-([a-zA-Z0-9]+)(?:\s+(.+))?)')) == ".text-"
+    assert required_literal(re.compile(r'(?:hello)+ world')) == " world"
+    assert required_literal(re.compile(r'(?:hello)* world')) == " world"
+    assert required_literal(re.compile(r'foo|bar')) is None
+    assert required_literal(re.compile(r'(?i)hello')) is None
+    assert required_literal(re.compile(r'^\d+$')) is None
+
+
+def test_regex_patternset():
+    index = HookIndex()
+    literal = IRCHook(None, None, regex(r'\bF\b'))
+    merged = IRCHook(None, None, regex(r'(?P<num>\d{3})', r'foo(\d+)'))
+    backref = IRCHook(None, None, regex(r'(\w)\1'))
+    flagged = IRCHook(None, None, regex(r'(?i)hello'))
+    samename = IRCHook(None, None, regex(r'^(?P<num>\d)$'))
+    index.add([literal, merged, backref, flagged, samename])
+    patterns = index.by_pattern["PRIVMSG"]
+    assert [i[0] for i in patterns.always] == [backref, flagged, samename]
+    assert [i[0] for i in patterns.merged] == [merged]
+    assert list(patterns.by_literal.keys()) == ["F", "foo"]
+    everything = [literal, merged, backref, flagged, samename]
+    assert index.lookup(make_msg("nothing here")) == [backref, flagged, samename]
+    assert index.lookup(make_msg("pay respects: F")) == [literal, backref, flagged, samename]
+    assert index.lookup(make_msg("F 123")) == everything
+    index.remove([backref, flagged, samename])
+    assert index.lookup(make_msg("nothing here")) == []
+    assert index.lookup(make_msg("foo")) == [merged]
+    assert index.lookup(make_msg("555")) == [merged]
+
+
+def test_regex_empty_message():
+    index = HookIndex()
+    empty, anything, literal = [IRCHook(exp.validate, None, exp) for exp in (regex(r'^$'), regex(r'.*'),
+                                                                              regex(r'\bF\b'))]
+    index.add([empty, anything, literal])
+
+    def matched(trailing):
+        return [irchook for irchook, validation in index.matches(make_msg(trailing), FakeNickBot(), "testbot")]
+    assert matched("") == [empty, anything]
+    assert matched("F") == [anything, literal]
+    assert matched(None) == []
+
+
+def test_regex_dispatch(fakebot):
+    fakebot.loadmodule("PressF")
+    fakebot.feed_line("press F to pay respects")
+    assert fakebot.act_PRIVMSG.call_count == 1
+    fakebot.act_PRIVMSG.reset_mock()
+    fakebot.feed_line("FFF")
+    fakebot.act_PRIVMSG.assert_not_called()
+
+
+class AsyncTest(ModuleBase):
+    max_tasks = 2
+
+    def __init__(self, bot, moduleName):
+        super().__init__(bot, moduleName)
+        self.threads = []
+        self.running = 0
+        self.most = 0
+        self.release = None
+
+    @command("ping")
+    async def cmd_ping(self, msg, cmd):
+        self.threads.append(current_thread())
+        reply = await self.run_in_thread(lambda: (self.threads.append(current_thread()), "pong")[1])
+        self.bot.act_PRIVMSG(msg.args[0], reply)
+
+    @command("fail")
+    async def cmd_fail(self, msg, cmd):
+        raise Exception("oops")
+
+    @command("wait")
+    async def cmd_wait(self, msg, cmd):
+        self.running += 1
+        self.most = max(self.most, self.running)
+        try:
+            await self.release.wait()
+        finally:
+            self.running -= 1
+
+
+def test_async_hooks(fakebot, monkeypatch):
+    fakebot.modules["AsyncTest"] = SimpleNamespace(AsyncTest=AsyncTest)
+    fakebot.loadmodule("AsyncTest")
+    mod = fakebot.moduleInstances["AsyncTest"]
+    fakebot.feed_line(".ping")
+    fakebot.act_PRIVMSG.assert_called_once_with("#test", "pong")
+    assert mod.threads[0] is fakebot.loop_thread
+    assert mod.threads[1] not in (fakebot.loop_thread, current_thread())
+    reported = []
+    monkeypatch.setattr(modulebase, "report", reported.append)
+    fakebot.feed_line(".fail")
+    assert str(reported[0]) == "oops"
+    assert not mod.tasks
+
+
+def test_async_hooks_limit_and_unload(fakebot):
+    fakebot.modules["AsyncTest"] = SimpleNamespace(AsyncTest=AsyncTest)
+    fakebot.loadmodule("AsyncTest")
+    mod = fakebot.moduleInstances["AsyncTest"]
+    mod.release = asyncio.Event()
+    futures = [mod.run_task(mod.cmd_wait(None, None)) for i in range(4)]
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), fakebot.loop).result()
+    assert mod.most == 2
+    fakebot.unloadmodule("AsyncTest")
+    for future in futures:
+        with pytest.raises(Exception):
+            future.result(timeout=2)
+        assert future.cancelled()
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), fakebot.loop).result()
+    assert mod.running == 0
+    assert not mod.tasks
+
+
+def test_async_hooks_waiting_limit(fakebot):
+    fakebot.modules["AsyncTest"] = SimpleNamespace(AsyncTest=AsyncTest)
+    fakebot.loadmodule("AsyncTest")
+    mod = fakebot.moduleInstances["AsyncTest"]
+    mod.max_waiting = 1
+    mod.release = asyncio.Event()
+    futures = [mod.run_task(mod.cmd_wait(None, None)) for i in range(4)]
+    # two run, one waits for a slot and the last is dropped
+    assert futures[3].result(timeout=2) is None
+    assert mod.tasks_dropped == 1
+    assert mod.tasks_waiting == 1
+    fakebot.loop.call_soon_threadsafe(mod.release.set)
+    for future in futures[:3]:
+        future.result(timeout=2)
+    assert mod.most == 2
+    assert mod.tasks_waiting == 0
@@ -2,7 +2,10 @@ import pytest
 from tests.lib import *  # NOQA - fixtures
 from time import sleep, time
 from pyircbot import IRCCore
+from pyircbot.pyircbot import PrimitiveBot
+from unittest.mock import MagicMock
 import logging
+import os
 
 
 logging.getLogger().setLevel(logging.DEBUG)
@@ -62,6 +65,40 @@ def test_quit_reconnect(livebot):
     assert nick in wait_until_joined(server, channel, nick)
 
 
+def test_primitive_bot_jobs(tmpdir):
+    """
+    Modules with timed jobs work on a bot that doesn't run an event loop of its own, like the pubsub client's
+    """
+    os.mkdir(os.path.join(tmpdir, "data"))
+    bot = PrimitiveBot({"bot": {"datadir": tmpdir},
+                        "modules": ["Services", "Rejoin", "Seen", "Triggered", "PingResponder"],
+                        "module_configs": {"Services": {"user": {"nick": ["testbot"]}},
+                                           "Rejoin": {"delay": 0},
+                                           "Seen": {"timezone": "UTC", "add_hours": 0, "flush_interval": 0.01},
+                                           "Triggered": {"channels": ["#test"], "words": ["ouch"],
+                                                         "responses": ["ow"], "quiet": 0, "mindelay": 0,
+                                                         "maxdelay": 1}}})
+    bot.act_PRIVMSG = MagicMock()
+    bot.act_JOIN = MagicMock()
+    for name in bot.botconfig["modules"]:
+        bot.loadmodule(name)
+    assert sorted(bot.moduleInstances) == sorted(bot.botconfig["modules"])
+    bot.moduleInstances["Services"].current_nick = "testbot"
+    try:
+        bot.fire_irchooks(IRCCore.packetAsObject("PRIVMSG", ["#test"], "chatter!root@cia.gov", "ouch"))
+        bot.fire_irchooks(IRCCore.packetAsObject("KICK", ["#test", "testbot"], "chatter!root@cia.gov", "bye"))
+        seen = bot.moduleInstances["Seen"]
+        assert wait_until(None, None, None, lambda: bot.act_PRIVMSG.called and bot.act_JOIN.called and
+                          not seen.pending, timeout=5)
+        bot.act_PRIVMSG.assert_called_once_with("#test", "ow")
+        bot.act_JOIN.assert_called_once_with("#test")
+        assert seen.sql.execute("SELECT `nick` FROM `seen`").fetchall() == [{"nick": "chatter"}]
+        assert bot.scheduler.stats()["PingResponder.check"]["due"] is not None
+    finally:
+        bot.closeAllModules()
+        bot.stop_loop()
+
+
 def test_bs():
     IRCCore.fulltrace()
     IRCCore.trace()
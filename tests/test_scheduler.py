@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from datetime import datetime
+from threading import Event, current_thread
+from time import sleep
+from pyircbot.modulebase import ModuleBase
+from pyircbot.scheduler import CronSpec
+from tests.lib import *  # NOQA - fixtures
+
+
+def test_call_later(fakebot):
+    done = Event()
+    threads = []
+
+    def job(value):
+        threads.append((value, current_thread()))
+        done.set()
+
+    fakebot.scheduler.call_later(0.05, job, "later")
+    assert done.wait(2)
+    done.clear()
+    fakebot.scheduler.call_later(0, job, "threaded", threaded=True)
+    assert done.wait(2)
+    assert threads[0] == ("later", fakebot.loop_thread)
+    assert threads[1][0] == "threaded"
+    assert threads[1][1] not in (fakebot.loop_thread, current_thread())
+
+
+def test_call_every(fakebot):
+    runs = []
+    job = fakebot.scheduler.call_every(0.05, runs.append, 1, delay=0)
+    sleep(0.3)
+    job.cancel()
+    count = len(runs)
+    assert 4 <= count <= 7
+    sleep(0.15)
+    assert len(runs) == count
+    assert job not in fakebot.scheduler.jobs
+
+
+def test_coroutine(fakebot):
+    done = Event()
+
+    async def job():
+        await asyncio.sleep(0.01)
+        done.set()
+
+    fakebot.scheduler.call_later(0, job)
+    assert done.wait(2)
+
+
+def test_stats(fakebot):
+    def fail():
+        raise Exception("nope")
+    fakebot.scheduler.call_every(0.02, fail, name="failing", delay=0)
+    sleep(0.1)
+    stats = fakebot.scheduler.stats()["failing"]
+    assert stats["runs"] >= 2
+    assert stats["errors"] == stats["runs"]
+    assert stats["due"] is not None
+
+
+def test_module_unload(fakebot):
+    runs = []
+
+    class Ticker(ModuleBase):
+        def __init__(self, bot, moduleName):
+            super().__init__(bot, moduleName)
+            self.job = self.call_every(0.02, runs.append, 1, delay=0)
+
+    fakebot.modules["Ticker"] = type("module", (), {"Ticker": Ticker})
+    fakebot.loadmodule("Ticker")
+    job = fakebot.moduleInstances["Ticker"].job
+    assert job.name == "Ticker.append"
+    sleep(0.1)
+    fakebot.unloadmodule("Ticker")
+    assert job.cancelled
+    assert not fakebot.scheduler.jobs
+    count = len(runs)
+    sleep(0.1)
+    assert len(runs) == count
+
+
+def next_run(spec, now):
+    return datetime.fromtimestamp(CronSpec(spec).next(now.timestamp()))
+
+
+def test_cron():
+    now = datetime(2019, 2, 10, 13, 37, 20)  # a Sunday
+    assert next_run("* * * * *", now) == datetime(2019, 2, 10, 13, 38)
+    assert next_run("*/15 * * * *", now) == datetime(2019, 2, 10, 13, 45)
+    assert next_run("@hourly", now) == datetime(2019, 2, 10, 14, 0)
+    assert next_run("@daily", now) == datetime(2019, 2, 11, 0, 0)
+    assert next_run("30 9 * * 1-5", now) == datetime(2019, 2, 11, 9, 30)
+    assert next_run("0 12 1 * *", now) == datetime(2019, 3, 1, 12, 0)
+    assert next_run("0 0 29 2 *", now) == datetime(2020, 2, 29, 0, 0)
+    # either day field may match when both are given
+    assert next_run("0 0 20 * 3", now) == datetime(2019, 2, 13, 0, 0)
+    with pytest.raises(ValueError):
+        CronSpec("* * *")
+    with pytest.raises(ValueError):
+        CronSpec("60 * * * *")
+    with pytest.raises(ValueError):
+        CronSpec("0 0 31 2 *")